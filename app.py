@@ -1,33 +1,1331 @@
-from flask import Flask, render_template_string, request, jsonify, send_file
+from flask import Flask, render_template_string, request, jsonify, send_file, Response, stream_with_context
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+import io
+import csv
 import os
 import time
 import json
+import math
+import random
+import re
+import sqlite3
 import threading
+import queue
+import uuid
+import hashlib
+from collections import defaultdict, deque
+import shutil
+import tempfile
 from datetime import datetime
-from openpyxl import Workbook
+from decimal import Decimal
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.drawing.image import Image
+from PIL import Image as PILImage
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 import platform
+import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+
+URL_SIMIT = os.environ.get("SIMIT_URL", "https://www.fcm.org.co/simit/#/home-public")
+
+# Navegadores en paralelo por proceso (se puede sobreescribir por petición)
+NUM_WORKERS_DEFECTO = int(os.environ.get("SIMIT_WORKERS", 1))
+MAX_WORKERS = int(os.environ.get("SIMIT_MAX_WORKERS", 4))
+
+# Tiempos máximos (segundos) de cada etapa de espera; se sale antes si la página ya respondió
+TIEMPOS_ESPERA = {
+    'carga': float(os.environ.get("SIMIT_TIMEOUT_CARGA", 20)),
+    'popup': float(os.environ.get("SIMIT_TIMEOUT_POPUP", 2)),
+    'campo': float(os.environ.get("SIMIT_TIMEOUT_CAMPO", 10)),
+    'resultado': float(os.environ.get("SIMIT_TIMEOUT_RESULTADO", 20)),
+}
+INTERVALO_SONDEO = 0.2
+
+# Pausa de cortesía entre placas de un mismo navegador (no es espera de la página).
+# El ritmo real lo marca el limitador de tasa compartido (SIMIT_TASA_NAVEGADOR / SIMIT_TASA_HTTP).
+PAUSA_ENTRE_PLACAS = float(os.environ.get("SIMIT_PAUSA_ENTRE_PLACAS", 0))
+
+# Consultas por segundo hacia SIMIT, sumando todos los workers y trabajos (0 = sin límite).
+# El 0.5 del navegador es un tope deliberado de cortesía con el sitio público: limita todo el
+# proceso a ~30 placas/min sin importar SIMIT_WORKERS ni SIMIT_PESTANAS. Para sacar provecho de
+# más navegadores o pestañas hay que subirlo (o ponerlo en 0 contra simit_mock.py).
+TASA_NAVEGADOR = float(os.environ.get("SIMIT_TASA_NAVEGADOR", 0.5))
+TASA_HTTP = float(os.environ.get("SIMIT_TASA_HTTP", 4))
+RAFAGA_CONSULTAS = int(os.environ.get("SIMIT_RAFAGA", 2))
+
+# Reintentos de fallos transitorios con espera exponencial y aleatoria
+REINTENTOS_MAX = int(os.environ.get("SIMIT_REINTENTOS", 2))
+REINTENTO_BASE = float(os.environ.get("SIMIT_REINTENTO_BASE", 2))  # segundos
+REINTENTO_MAX_ESPERA = float(os.environ.get("SIMIT_REINTENTO_MAX_ESPERA", 30))
+
+# Cortocircuito: tras N fallos seguidos de SIMIT se pausan todas las consultas
+CIRCUITO_UMBRAL = int(os.environ.get("SIMIT_CIRCUITO_UMBRAL", 5))
+CIRCUITO_PAUSA = float(os.environ.get("SIMIT_CIRCUITO_PAUSA", 60))  # segundos
+
+# Marca los resultados que ya están en pantalla para no confundirlos con los de la nueva consulta
+MARCAR_RESULTADOS_PREVIOS_JS = """
+var marcar = function (nodo) { nodo.setAttribute('data-simit-previo', '1'); };
+document.querySelectorAll('#multaTable tbody tr').forEach(marcar);
+var xp = document.evaluate(
+    "//*[contains(text(), 'No se encontraron') or contains(text(), 'sin multas') or contains(text(), 'No hay multas')]",
+    document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < xp.snapshotLength; i++) { marcar(xp.snapshotItem(i)); }
+"""
+
+# Estado terminal de la consulta: 'multas', 'sin_multas', 'error' o null si sigue cargando
+ESTADO_RESULTADO_JS = """
+var frases = ['no se encontraron', 'sin multas', 'no hay multas', 'no tiene multas'];
+var visible = function (nodo) { return !!(nodo.offsetWidth || nodo.offsetHeight || nodo.getClientRects().length); };
+var cargando = !!document.querySelector('.swal2-loading, .spinner-border, .spinner, .loading, .ngx-spinner-overlay');
+var filas = Array.prototype.slice.call(document.querySelectorAll('#multaTable tbody tr'));
+var hayContenido = filas.length > 0;
+var nuevas = filas.filter(function (f) { return !f.hasAttribute('data-simit-previo'); });
+if (nuevas.length) {
+    var conMultas = nuevas.some(function (f) {
+        var texto = (f.innerText || '').toLowerCase();
+        return texto.trim() && f.querySelectorAll('td').length >= 6 &&
+            !frases.some(function (p) { return texto.indexOf(p) >= 0; });
+    });
+    return {estado: conMultas ? 'multas' : 'sin_multas', cargando: cargando, hayContenido: true};
+}
+var xp = document.evaluate(
+    "//*[contains(text(), 'No se encontraron') or contains(text(), 'sin multas') or contains(text(), 'No hay multas')]",
+    document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < xp.snapshotLength; i++) {
+    var nodo = xp.snapshotItem(i);
+    if (!visible(nodo)) { continue; }
+    hayContenido = true;
+    if (!nodo.hasAttribute('data-simit-previo')) {
+        return {estado: 'sin_multas', cargando: cargando, hayContenido: true};
+    }
+}
+var error = document.querySelector('.swal2-popup .swal2-icon.swal2-error');
+if (error && visible(error)) {
+    return {estado: 'error', cargando: cargando, hayContenido: hayContenido};
+}
+return {estado: null, cargando: cargando, hayContenido: hayContenido};
+"""
+
+# Tabla de multas completa en un solo viaje al navegador:
+# {tabla, numFilas, filas: [[texto por celda]], sinMultas, fraseSinMultas, indicadores}
+LEER_TABLA_MULTAS_JS = """
+var frasesFila = ['no se encontraron', 'sin multas', 'no hay multas', 'no tiene multas'];
+var textoDe = function (nodo) { return (nodo.innerText || nodo.textContent || '').trim(); };
+var datos = {tabla: false, numFilas: 0, filas: [], sinMultas: false, fraseSinMultas: '', indicadores: false};
+
+var tabla = document.getElementById('multaTable');
+var tbody = tabla && tabla.querySelector('tbody');
+if (tbody) {
+    datos.tabla = true;
+    var trs = tbody.querySelectorAll('tr');
+    datos.numFilas = trs.length;
+    for (var i = 0; i < trs.length; i++) {
+        if (trs[i].hasAttribute('data-simit-previo')) { continue; }  // fila de la placa anterior
+        var texto = textoDe(trs[i]).toLowerCase();
+        if (!texto || frasesFila.some(function (p) { return texto.indexOf(p) >= 0; })) { continue; }
+        var celdas = trs[i].querySelectorAll('td');
+        if (celdas.length >= 6) {
+            datos.filas.push(Array.prototype.map.call(celdas, textoDe));
+        }
+    }
+    datos.sinMultas = datos.filas.length === 0;
+    return datos;
+}
+
+var xp = document.evaluate(
+    "//*[contains(text(), 'No se encontraron') or contains(text(), 'sin multas') or contains(text(), 'No hay multas')]",
+    document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var k = 0; k < xp.snapshotLength; k++) {
+    var mensaje = xp.snapshotItem(k);
+    if (mensaje.hasAttribute('data-simit-previo')) { continue; }  // mensaje de la placa anterior
+    datos.sinMultas = true;
+    datos.fraseSinMultas = textoDe(mensaje);
+    return datos;
+}
+
+// Texto de la página sin lo que quedó marcado de la placa anterior
+var copia = document.documentElement.cloneNode(true);
+copia.querySelectorAll('[data-simit-previo]').forEach(function (nodo) { nodo.remove(); });
+var pagina = (copia.textContent || '').toLowerCase();
+var frasesPagina = ['no se encontraron multas', 'sin multas registradas', 'no hay multas',
+                    'no tiene multas', 'sin infracciones', 'no se encontraron infracciones'];
+for (var j = 0; j < frasesPagina.length; j++) {
+    if (pagina.indexOf(frasesPagina[j]) >= 0) {
+        datos.sinMultas = true;
+        datos.fraseSinMultas = frasesPagina[j];
+        return datos;
+    }
+}
+datos.indicadores = ['valor a pagar', 'cobro coactivo', 'secretaría', 'infracción'].some(
+    function (p) { return pagina.indexOf(p) >= 0; });
+return datos;
+"""
+
+# Motor de consulta: 'selenium' (navegador) o 'http' (API JSON que usa la propia página)
+MOTOR_DEFECTO = os.environ.get("SIMIT_MOTOR", "selenium")
+API_SIMIT_URL = os.environ.get(
+    "SIMIT_API_URL",
+    "https://consultasimit.fcm.org.co/simit/microservices/estado-cuenta-simit/estadocuenta/consulta"
+)
+HTTP_CONCURRENCIA = int(os.environ.get("SIMIT_HTTP_CONCURRENCIA", 8))
+HTTP_TIMEOUT = float(os.environ.get("SIMIT_HTTP_TIMEOUT", 15))
+# Con motor HTTP, abrir el navegador solo para dejar evidencia de las placas con multas
+HTTP_CAPTURAS = os.environ.get("SIMIT_HTTP_CAPTURAS", "0") == "1"
+# Carpeta donde guardar las respuestas crudas para reproducirlas luego con simit_mock.py
+HTTP_GRABAR_DIR = os.environ.get("SIMIT_HTTP_GRABAR_DIR", "")
+
+# Columnas de la tabla #multaTable, en orden
+CAMPOS_MULTA = ["Tipo", "Notificación", "Placa", "Secretaría", "Infracción", "Estado", "Valor", "Valor a pagar"]
+
+def formatear_detalle_multas(filas):
+    """Convierte filas de multas (listas de textos por columna) al texto de detalle del reporte"""
+    detalles = ""
+    for numero, celdas in enumerate(filas, 1):
+        detalles += f"=== MULTA {numero} ===\n"
+        for etiqueta, valor in zip(CAMPOS_MULTA, celdas):
+            detalles += f"{etiqueta}: {valor}\n"
+        detalles += "\n"
+    return detalles.strip()
+
+def parsear_pesos(texto):
+    """Valor exacto en pesos (Decimal, con centavos) de un texto como '$ 1.234.567' o '1,234,567.50'.
+    
+    None si no hay número. No se redondea: eso se hace solo al presentar.
+    """
+    if texto is None or texto == "":
+        return None
+    if isinstance(texto, Decimal):
+        return texto
+    if isinstance(texto, (int, float)):
+        return Decimal(str(texto))
+    limpio = re.sub(r'[^\d.,]', '', str(texto))
+    if not re.search(r'\d', limpio):
+        return None
+    entero, decimales = limpio, ""
+    separador = max(limpio.rfind('.'), limpio.rfind(','))
+    if separador >= 0 and len(limpio) - separador - 1 in (1, 2):
+        # Uno o dos dígitos tras el último separador: son centavos
+        entero, decimales = limpio[:separador], limpio[separador + 1:]
+    enteros = re.sub(r'[.,]', '', entero) or "0"
+    return Decimal(f"{enteros}.{decimales.ljust(2, '0')}" if decimales else enteros)
+
+def valor_json(valor):
+    """`default` de json.dumps: los pesos (Decimal) salen como número, entero si no tienen centavos"""
+    if isinstance(valor, Decimal):
+        return int(valor) if valor == valor.to_integral_value() else float(valor)
+    return str(valor)
+
+class Multa:
+    """Una multa como registro tipado y compacto, con los valores ya convertidos a pesos"""
+    
+    __slots__ = ('placa', 'tipo', 'notificacion', 'secretaria', 'infraccion', 'estado', 'valor', 'valor_a_pagar')
+    
+    def __init__(self, placa, tipo="", notificacion="", secretaria="", infraccion="", estado="",
+                 valor=None, valor_a_pagar=None):
+        self.placa = placa
+        self.tipo = tipo
+        self.notificacion = notificacion
+        self.secretaria = secretaria
+        self.infraccion = infraccion
+        self.estado = estado
+        self.valor = valor
+        self.valor_a_pagar = valor_a_pagar
+    
+    @classmethod
+    def desde_celdas(cls, celdas, placa):
+        """Multa a partir de una fila de #multaTable (columnas en el orden de CAMPOS_MULTA)"""
+        celdas = [str(celda).strip() for celda in celdas] + [""] * (len(CAMPOS_MULTA) - len(celdas))
+        return cls(
+            celdas[2] or placa, celdas[0], celdas[1], celdas[3], celdas[4], celdas[5],
+            parsear_pesos(celdas[6]), parsear_pesos(celdas[7])
+        )
+    
+    @classmethod
+    def desde_lista(cls, valores):
+        multa = cls(*valores)
+        multa.valor = parsear_pesos(multa.valor)  # de JSON llegan como número
+        multa.valor_a_pagar = parsear_pesos(multa.valor_a_pagar)
+        return multa
+    
+    def a_lista(self):
+        return [getattr(self, campo) for campo in self.__slots__]
+    
+    def a_dict(self):
+        """Campos listos para JSON (los pesos como número)"""
+        return {
+            campo: valor_json(valor) if isinstance(valor, Decimal) else valor
+            for campo, valor in ((campo, getattr(self, campo)) for campo in self.__slots__)
+        }
+    
+    def __eq__(self, otra):
+        return isinstance(otra, Multa) and self.a_lista() == otra.a_lista()
+    
+    def __repr__(self):
+        return f"Multa({self.placa}, {self.tipo!r}, valor_a_pagar={self.valor_a_pagar})"
+
+def multas_desde_filas(filas, placa):
+    return tuple(Multa.desde_celdas(celdas, placa) for celdas in filas)
+
+def multas_desde_detalle(detalle, placa):
+    """Reconstruye las multas desde el texto de detalle (resultados guardados antes de tener registros)"""
+    filas = []
+    for bloque in re.split(r'=== MULTA \d+ ===', detalle or "")[1:]:
+        campos = {}
+        for linea in bloque.strip().splitlines():
+            etiqueta, _, valor = linea.partition(": ")
+            campos[etiqueta.strip()] = valor.strip()
+        filas.append([campos.get(etiqueta, "") for etiqueta in CAMPOS_MULTA])
+    return multas_desde_filas(filas, placa)
+
+def multas_de(resultado):
+    """Registros de multas de una tupla de resultado (las antiguas de 5 campos solo traen el texto)"""
+    if len(resultado) > 5:
+        return resultado[5]
+    return multas_desde_detalle(resultado[4], resultado[0])
+
+def multas_a_json(multas):
+    return json.dumps([multa.a_lista() for multa in multas], ensure_ascii=False, default=valor_json)
+
+def multas_desde_json(texto, resultado):
+    """Multas guardadas en SQLite; si la fila es anterior a la columna, se sacan del detalle"""
+    if texto:
+        return tuple(Multa.desde_lista(valores) for valores in json.loads(texto))
+    return multas_desde_detalle(resultado[4], resultado[0])
+
+def agregar_columna(conn, tabla, definicion):
+    """ALTER TABLE ... ADD COLUMN para bases creadas por versiones anteriores"""
+    columna = definicion.split()[0]
+    existentes = [fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")]
+    if columna not in existentes:
+        conn.execute(f"ALTER TABLE {tabla} ADD COLUMN {definicion}")
+
+# Caché persistente de resultados por placa
+CACHE_ACTIVO = os.environ.get("SIMIT_CACHE", "1") == "1"
+CACHE_DB = os.environ.get("SIMIT_CACHE_DB", "cache_simit.db")
+CACHE_TTL = int(os.environ.get("SIMIT_CACHE_TTL", 6 * 3600))  # segundos
+CACHE_MAX_ENTRADAS = int(os.environ.get("SIMIT_CACHE_MAX", 10000))
+
+def normalizar_placa(placa):
+    """Mayúsculas y sin espacios, guiones ni puntos: 'abc-123' -> 'ABC123'"""
+    return re.sub(r'[^A-Z0-9]', '', str(placa).upper())
+
+class CacheResultados:
+    """Último resultado por placa en SQLite, con vencimiento (TTL) y tamaño máximo.
+    
+    Solo se guardan consultas exitosas. Al superar el máximo se descartan las
+    entradas usadas hace más tiempo.
+    """
+    
+    def __init__(self, ruta=CACHE_DB, ttl=CACHE_TTL, max_entradas=CACHE_MAX_ENTRADAS):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS resultados (
+                    placa TEXT PRIMARY KEY,
+                    estado TEXT NOT NULL,
+                    resultado TEXT NOT NULL,
+                    captura TEXT NOT NULL,
+                    detalle TEXT NOT NULL,
+                    consultado REAL NOT NULL,
+                    ultimo_acceso REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_resultados_acceso ON resultados (ultimo_acceso)")
+            agregar_columna(conn, "resultados", "multas TEXT")
+    
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+    
+    def obtener(self, placa):
+        """Devuelve (tupla_resultado, fecha_consulta) si hay una entrada vigente, o None"""
+        clave = normalizar_placa(placa)
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT estado, resultado, captura, detalle, consultado, multas FROM resultados WHERE placa = ?",
+                (clave,)
+            ).fetchone()
+            if not fila:
+                return None
+            estado, resultado, captura, detalle, consultado, multas = fila
+            if ahora - consultado > self.ttl:
+                conn.execute("DELETE FROM resultados WHERE placa = ?", (clave,))
+                return None
+            conn.execute("UPDATE resultados SET ultimo_acceso = ? WHERE placa = ?", (ahora, clave))
+        
+        if captura != "Sin captura" and not os.path.exists(captura):
+            captura = "Sin captura"
+        tupla = (placa, estado, resultado, captura, detalle)
+        return tupla + (multas_desde_json(multas, tupla),), consultado
+    
+    def guardar(self, resultado):
+        placa, estado, resultado_consulta, captura, detalle = resultado[:5]
+        if resultado_consulta != "Éxito":
+            return
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO resultados
+                   (placa, estado, resultado, captura, detalle, consultado, ultimo_acceso, multas)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (normalizar_placa(placa), estado, resultado_consulta, captura, detalle or "", ahora, ahora,
+                 multas_a_json(multas_de(resultado)))
+            )
+            conn.execute(
+                """DELETE FROM resultados WHERE placa IN (
+                       SELECT placa FROM resultados ORDER BY ultimo_acceso DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entradas,)
+            )
+
+# Modo monitoreo: huella de la última tabla de multas por placa para reportar solo los cambios
+MONITOREO_DEFECTO = os.environ.get("SIMIT_MONITOREO", "0") == "1"
+MONITOREO_DB = os.environ.get("SIMIT_MONITOREO_DB", "monitoreo_simit.db")
+
+def huella_multas(estado_multas, multas):
+    """Huella del contenido de la consulta (independiente del orden de las filas)"""
+    # Se ordena por el texto JSON de cada fila: un valor ilegible (None) no se puede comparar con un Decimal
+    filas = sorted((multa.a_lista() for multa in multas),
+                   key=lambda fila: json.dumps(fila, ensure_ascii=False, default=valor_json))
+    contenido = json.dumps([estado_multas, filas], ensure_ascii=False, default=valor_json)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+def identidad_multa(multa):
+    """Lo que no cambia de una multa entre consultas (el estado y el valor a pagar sí cambian)"""
+    return (multa.tipo, multa.notificacion, multa.secretaria, multa.infraccion, multa.valor)
+
+def comparar_multas(anteriores, actuales):
+    """Lista de (cambio, multa_anterior, multa_actual) con cambio 'nueva', 'pagada' o 'cambiada'.
+    
+    Se comparan como multiconjuntos: dos multas iguales (p. ej. del mismo tipo) cuentan por separado.
+    """
+    # Primero se descartan las que siguen idénticas
+    previas = list(anteriores)
+    restantes = []
+    for multa in actuales:
+        if multa in previas:
+            previas.remove(multa)
+        else:
+            restantes.append(multa)
+    # De las demás, la misma multa con otro estado o valor a pagar es un cambio
+    por_identidad = defaultdict(list)
+    for multa in previas:
+        por_identidad[identidad_multa(multa)].append(multa)
+    cambios = []
+    for multa in restantes:
+        candidatas = por_identidad[identidad_multa(multa)]
+        if candidatas:
+            cambios.append(('cambiada', candidatas.pop(0), multa))
+        else:
+            cambios.append(('nueva', None, multa))
+    # Las que ya no aparecen se dieron por pagadas (o anuladas)
+    cambios.extend(('pagada', multa, None) for lista in por_identidad.values() for multa in lista)
+    return cambios
+
+class MonitoreoFlota:
+    """Última huella y multas conocidas de cada placa (SQLite), para comparar consultas sucesivas"""
+    
+    def __init__(self, ruta=MONITOREO_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS huellas (
+                    placa TEXT PRIMARY KEY,
+                    huella TEXT NOT NULL,
+                    multas TEXT NOT NULL,
+                    actualizado REAL NOT NULL
+                )
+            """)
+    
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+    
+    def cargar(self, placas):
+        """{placa_normalizada: (huella, multas)} de las placas que ya se habían consultado"""
+        claves = sorted({normalizar_placa(placa) for placa in placas})
+        anteriores = {}
+        with self._lock, self._conectar() as conn:
+            for inicio in range(0, len(claves), 500):
+                lote = claves[inicio:inicio + 500]
+                filas = conn.execute(
+                    f"SELECT placa, huella, multas FROM huellas WHERE placa IN ({','.join('?' * len(lote))})",
+                    lote
+                ).fetchall()
+                for placa, huella, multas in filas:
+                    anteriores[placa] = (huella, tuple(Multa.desde_lista(valores) for valores in json.loads(multas)))
+        return anteriores
+    
+    def guardar(self, resultados):
+        """Actualiza la huella de las placas consultadas con éxito"""
+        ahora = time.time()
+        filas = [
+            (normalizar_placa(resultado[0]), huella_multas(resultado[1], multas_de(resultado)),
+             multas_a_json(multas_de(resultado)), ahora)
+            for resultado in resultados if resultado[2] == "Éxito"
+        ]
+        with self._lock, self._conectar() as conn:
+            conn.executemany("INSERT OR REPLACE INTO huellas VALUES (?, ?, ?, ?)", filas)
+
+# Bitácora de trabajos: cada resultado se guarda al terminar para poder reanudar
+BITACORA_DB = os.environ.get("SIMIT_BITACORA_DB", "trabajos_simit.db")
+REANUDAR_TRABAJOS = os.environ.get("SIMIT_REANUDAR", "1") == "1"
+RETENCION_BITACORA = int(os.environ.get("SIMIT_RETENCION_BITACORA", 7 * 24 * 3600))  # segundos
+
+# Estado compartido entre procesos (varios workers de gunicorn): el proceso dueño de cada trabajo
+# vuelca su progreso a la bitácora y los demás lo leen de ahí
+INTERVALO_PROGRESO_COMPARTIDO = float(os.environ.get("SIMIT_INTERVALO_PROGRESO", 0.5))  # segundos
+INTERVALO_RECLAMO = float(os.environ.get("SIMIT_INTERVALO_RECLAMO", 30))  # segundos; 0 = solo al arrancar
+
+# Dueño de cada trabajo: un token por arranque de proceso (los PID se repiten tras reiniciar un
+# contenedor) y un latido periódico; un trabajo sin latido reciente se da por huérfano
+INTERVALO_LATIDO = float(os.environ.get("SIMIT_INTERVALO_LATIDO", 10))  # segundos
+LATIDO_VENCIDO = float(os.environ.get("SIMIT_LATIDO_VENCIDO", 60))  # segundos sin latido
+_instancia = {'pid': None, 'token': None}
+
+def instancia_proceso():
+    """Token único de este proceso (uno nuevo en cada fork o arranque)"""
+    if _instancia['pid'] != os.getpid():
+        _instancia.update(pid=os.getpid(), token=uuid.uuid4().hex)
+    return _instancia['token']
+
+class BitacoraTrabajos:
+    """Diario persistente (SQLite en modo WAL) de trabajos y de cada placa terminada.
+    
+    Si el proceso muere a mitad de un trabajo, al arrancar de nuevo se pueden
+    recuperar las placas ya resueltas y reanudar solo las que faltan. También es
+    el estado compartido entre procesos: cada trabajo guarda aquí la última foto
+    de su progreso para que cualquier worker web pueda responder por él.
+    """
+    
+    ESTADOS_FINALES = ('completed', 'error')
+    
+    def __init__(self, ruta=BITACORA_DB):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._preparacion = threading.Lock()
+        self._preparada = False  # el archivo y las tablas se crean en la primera conexión, no al importar
+    
+    def _preparar(self, conn):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                id TEXT PRIMARY KEY,
+                placas TEXT NOT NULL,
+                opciones TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                archivo_excel TEXT NOT NULL DEFAULT '',
+                pid INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                terminado REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS resultados_trabajo (
+                trabajo_id TEXT NOT NULL,
+                indice INTEGER NOT NULL,
+                placa TEXT NOT NULL,
+                estado TEXT NOT NULL,
+                resultado TEXT NOT NULL,
+                captura TEXT NOT NULL,
+                detalle TEXT NOT NULL,
+                consultado_cache REAL,
+                PRIMARY KEY (trabajo_id, indice)
+            )
+        """)
+        agregar_columna(conn, "resultados_trabajo", "multas TEXT")
+        agregar_columna(conn, "trabajos", "progreso TEXT")
+        agregar_columna(conn, "trabajos", "prioridad TEXT NOT NULL DEFAULT 'lote'")
+        agregar_columna(conn, "trabajos", "usuario TEXT")
+        agregar_columna(conn, "trabajos", "dueno TEXT")
+        agregar_columna(conn, "trabajos", "latido REAL")
+    
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta, timeout=30)
+        if not self._preparada:
+            with self._preparacion:
+                if not self._preparada:
+                    self._preparar(conn)
+                    conn.commit()
+                    self._preparada = True
+        return conn
+    
+    def registrar_trabajo(self, trabajo_id, placas, opciones, creado, pid=None):
+        """Registra el trabajo como de este proceso; con pid=0 queda en la cola, sin dueño"""
+        en_cola = pid == 0
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO trabajos
+                   (id, placas, opciones, estado, pid, creado, prioridad, usuario, dueno, latido)
+                   VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)""",
+                (trabajo_id, json.dumps(placas), json.dumps(opciones), os.getpid() if pid is None else pid, creado,
+                 opciones.get('prioridad') or 'lote', opciones.get('usuario'),
+                 None if en_cola else instancia_proceso(), None if en_cola else time.time())
+            )
+    
+    def tomar_pendiente(self, solo_interactivos=False):
+        """Adjudica a este proceso el siguiente trabajo sin dueño; devuelve su id o None.
+        
+        Primero los interactivos; dentro de cada clase, el del usuario con menos
+        trabajos en marcha, luego el del que hace más tiempo no empieza uno y, a
+        igualdad, el más antiguo.
+        """
+        with self._lock, self._conectar() as conn:
+            while True:
+                fila = conn.execute(
+                    """SELECT id FROM trabajos AS t
+                       WHERE pid = 0 AND estado = 'queued' AND (? = 0 OR prioridad = 'interactiva')
+                       ORDER BY prioridad = 'interactiva' DESC,
+                                (SELECT COUNT(*) FROM trabajos AS o
+                                 WHERE o.usuario = t.usuario AND o.pid != 0 AND o.estado IN ('queued', 'processing')),
+                                (SELECT MAX(o.creado) FROM trabajos AS o WHERE o.usuario = t.usuario AND o.pid != 0),
+                                creado
+                       LIMIT 1""",
+                    (1 if solo_interactivos else 0,)
+                ).fetchone()
+                if not fila:
+                    return None
+                # Otro worker pudo ganarlo entre el SELECT y el UPDATE: en ese caso, probar el siguiente
+                cursor = conn.execute(
+                    "UPDATE trabajos SET pid = ?, dueno = ?, latido = ? WHERE id = ? AND pid = 0",
+                    (os.getpid(), instancia_proceso(), time.time(), fila[0])
+                )
+                if cursor.rowcount == 1:
+                    return fila[0]
+    
+    def pendientes(self):
+        """Trabajos en la cola que ningún worker tomó todavía"""
+        with self._lock, self._conectar() as conn:
+            return conn.execute("SELECT COUNT(*) FROM trabajos WHERE pid = 0 AND estado = 'queued'").fetchone()[0]
+    
+    def guardar_resultado(self, trabajo_id, indice, resultado, consultado_cache=None):
+        placa, estado, resultado_consulta, captura, detalle = resultado[:5]
+        with self._lock, self._conectar() as conn:
+            # El rowid marca el orden de terminación (cursor de /resultados): al reescribir una placa se conserva
+            conn.execute(
+                """INSERT INTO resultados_trabajo
+                   (trabajo_id, indice, placa, estado, resultado, captura, detalle, consultado_cache, multas)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (trabajo_id, indice) DO UPDATE SET
+                       placa = excluded.placa, estado = excluded.estado, resultado = excluded.resultado,
+                       captura = excluded.captura, detalle = excluded.detalle,
+                       consultado_cache = excluded.consultado_cache, multas = excluded.multas""",
+                (trabajo_id, indice, placa, estado, resultado_consulta, captura, detalle or "", consultado_cache,
+                 multas_a_json(multas_de(resultado)))
+            )
+    
+    def marcar_estado(self, trabajo_id, estado, archivo_excel=''):
+        terminado = time.time() if estado in self.ESTADOS_FINALES else None
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "UPDATE trabajos SET estado = ?, archivo_excel = ?, terminado = ? WHERE id = ?",
+                (estado, archivo_excel or '', terminado, trabajo_id)
+            )
+    
+    def guardar_progresos(self, progresos):
+        """Foto del progreso de varios trabajos {id: progreso} en una sola transacción"""
+        with self._lock, self._conectar() as conn:
+            conn.executemany(
+                "UPDATE trabajos SET progreso = ? WHERE id = ?",
+                [(json.dumps(progreso, ensure_ascii=False, default=str), trabajo_id)
+                 for trabajo_id, progreso in progresos.items()]
+            )
+    
+    def progreso(self, trabajo_id=None):
+        """Último progreso publicado del trabajo (o del más reciente si no se indica id)"""
+        with self._lock, self._conectar() as conn:
+            if trabajo_id:
+                fila = conn.execute(
+                    "SELECT id, progreso, estado, placas, archivo_excel FROM trabajos WHERE id = ?", (trabajo_id,)
+                ).fetchone()
+            else:
+                fila = conn.execute(
+                    "SELECT id, progreso, estado, placas, archivo_excel FROM trabajos ORDER BY creado DESC LIMIT 1"
+                ).fetchone()
+        if not fila:
+            return None
+        trabajo_id, progreso, estado, placas, archivo_excel = fila
+        if progreso:
+            return json.loads(progreso)
+        # Trabajo de una versión anterior o todavía sin foto publicada
+        progreso = nuevo_progreso(len(json.loads(placas)), estado, "Trabajo registrado en la bitácora")
+        progreso.update({'id': trabajo_id, 'archivo_excel': archivo_excel})
+        return progreso
+    
+    def obtener_trabajo(self, trabajo_id):
+        with self._lock, self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT placas, opciones, estado, archivo_excel, creado FROM trabajos WHERE id = ?",
+                (trabajo_id,)
+            ).fetchone()
+        if not fila:
+            return None
+        placas, opciones, estado, archivo_excel, creado = fila
+        return {
+            'placas': json.loads(placas),
+            'opciones': json.loads(opciones),
+            'estado': estado,
+            'archivo_excel': archivo_excel,
+            'creado': creado
+        }
+    
+    def resultados(self, trabajo_id):
+        """Placas ya terminadas, en el orden en que terminaron: {indice: (tupla_resultado, consultado_cache)}"""
+        with self._lock, self._conectar() as conn:
+            filas = conn.execute(
+                """SELECT indice, placa, estado, resultado, captura, detalle, consultado_cache, multas
+                   FROM resultados_trabajo WHERE trabajo_id = ? ORDER BY rowid""",
+                (trabajo_id,)
+            ).fetchall()
+        return dict(map(self._leer_resultado, filas))
+    
+    def resultados_desde(self, trabajo_id, desde, limite):
+        """[(indice, (tupla_resultado, consultado_cache))] terminados a partir de la posición `desde`"""
+        with self._lock, self._conectar() as conn:
+            filas = conn.execute(
+                """SELECT indice, placa, estado, resultado, captura, detalle, consultado_cache, multas
+                   FROM resultados_trabajo WHERE trabajo_id = ? ORDER BY rowid LIMIT ? OFFSET ?""",
+                (trabajo_id, limite, desde)
+            ).fetchall()
+        return [self._leer_resultado(fila) for fila in filas]
+    
+    def contar_resultados(self, trabajo_id):
+        with self._lock, self._conectar() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM resultados_trabajo WHERE trabajo_id = ?", (trabajo_id,)
+            ).fetchone()[0]
+    
+    @staticmethod
+    def _leer_resultado(fila):
+        indice, placa, estado, resultado, captura, detalle, consultado_cache, multas = fila
+        tupla = (placa, estado, resultado, captura, detalle)
+        return indice, (tupla + (multas_desde_json(multas, tupla),), consultado_cache)
+    
+    def latir(self):
+        """Renueva el latido de los trabajos sin terminar de este proceso"""
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "UPDATE trabajos SET latido = ? WHERE dueno = ? AND estado NOT IN ('completed', 'error')",
+                (time.time(), instancia_proceso())
+            )
+    
+    def reclamar_interrumpidos(self, vencido=LATIDO_VENCIDO):
+        """Toma para este proceso los trabajos sin terminar de otro dueño cuyo latido se detuvo"""
+        reclamados = []
+        ahora = time.time()
+        with self._lock, self._conectar() as conn:
+            filas = conn.execute(
+                """SELECT id, COALESCE(dueno, ''), COALESCE(latido, 0) FROM trabajos
+                   WHERE estado NOT IN ('completed', 'error') AND pid != 0 AND COALESCE(dueno, '') != ?
+                     AND COALESCE(latido, 0) < ?
+                   ORDER BY creado""",
+                (instancia_proceso(), ahora - vencido)
+            ).fetchall()
+            for trabajo_id, dueno, latido in filas:
+                # El UPDATE condicionado evita que dos procesos reclamen el mismo trabajo
+                cursor = conn.execute(
+                    """UPDATE trabajos SET pid = ?, dueno = ?, latido = ?
+                       WHERE id = ? AND COALESCE(dueno, '') = ? AND COALESCE(latido, 0) = ?""",
+                    (os.getpid(), instancia_proceso(), ahora, trabajo_id, dueno, latido)
+                )
+                if cursor.rowcount == 1:
+                    reclamados.append(trabajo_id)
+        return reclamados
+    
+    def artefactos_activos(self):
+        """(ids, capturas) de los trabajos sin terminar de cualquier proceso"""
+        with self._lock, self._conectar() as conn:
+            ids = {fila[0] for fila in conn.execute(
+                "SELECT id FROM trabajos WHERE estado NOT IN ('completed', 'error')"
+            )}
+            capturas = {fila[0] for fila in conn.execute(
+                """SELECT DISTINCT r.captura FROM resultados_trabajo AS r JOIN trabajos AS t ON t.id = r.trabajo_id
+                   WHERE t.estado NOT IN ('completed', 'error')"""
+            )}
+        return ids, capturas
+    
+    def purgar(self, retencion=RETENCION_BITACORA):
+        limite = time.time() - retencion
+        with self._lock, self._conectar() as conn:
+            viejos = [fila[0] for fila in conn.execute(
+                "SELECT id FROM trabajos WHERE terminado IS NOT NULL AND terminado < ?", (limite,)
+            )]
+            conn.executemany("DELETE FROM resultados_trabajo WHERE trabajo_id = ?", [(t,) for t in viejos])
+            conn.executemany("DELETE FROM trabajos WHERE id = ?", [(t,) for t in viejos])
+
+# Evidencias: qué placas capturar y cómo comprimir la imagen
+CAPTURA_POLITICA = os.environ.get("SIMIT_CAPTURA_POLITICA", "todas")  # todas | con_multas | ninguna
+CAPTURA_FORMATO = os.environ.get("SIMIT_CAPTURA_FORMATO", "jpeg").lower()  # jpeg | webp | png
+CAPTURA_CALIDAD = int(os.environ.get("SIMIT_CAPTURA_CALIDAD", 80))
+CAPTURA_HILOS = int(os.environ.get("SIMIT_CAPTURA_HILOS", 2))
+
+# Zona a capturar: la tabla de multas o el panel con el mensaje de "sin resultados"
+ZONA_RESULTADOS_JS = """
+var tabla = document.getElementById('multaTable');
+if (tabla && tabla.getClientRects().length) { return tabla; }
+var mensaje = document.evaluate(
+    "//*[contains(text(), 'No se encontraron') or contains(text(), 'sin multas') or contains(text(), 'No hay multas')]",
+    document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (mensaje) { return mensaje.closest('.card, .panel, .modal-content, .swal2-popup, section') || mensaje.parentElement; }
+return null;
+"""
+
+_EXTENSIONES_CAPTURA = {'jpeg': 'jpg', 'webp': 'webp', 'png': 'png'}
+guardado_evidencias = ThreadPoolExecutor(max_workers=max(1, CAPTURA_HILOS), thread_name_prefix="evidencias")
+
+# Almacén de artefactos: capturas direccionadas por contenido y cuota de disco para capturas y reportes
+# Rutas absolutas: quedan en la bitácora y cualquier proceso (o send_file) las resuelve igual
+CARPETA_CAPTURAS = os.path.abspath(os.environ.get("SIMIT_DIR_CAPTURAS", "capturas"))
+CARPETA_REPORTES = os.path.abspath(os.environ.get("SIMIT_DIR_REPORTES", "reportes_excel"))
+CUOTA_DISCO_MB = float(os.environ.get("SIMIT_CUOTA_DISCO_MB", 2048))  # 0 = sin cuota
+RETENCION_ARTEFACTOS = float(os.environ.get("SIMIT_RETENCION_ARTEFACTOS_DIAS", 14)) * 86400  # 0 = no vencen
+INTERVALO_LIMPIEZA = float(os.environ.get("SIMIT_INTERVALO_LIMPIEZA", 600))  # segundos; 0 = sin barrido
+NOMBRE_EVIDENCIA = re.compile(r"^[0-9a-f]{64}\.(jpg|webp|png)$")
+
+def ruta_evidencia(png, formato=CAPTURA_FORMATO):
+    """capturas/ab/<sha256>.jpg: la misma imagen cae siempre en el mismo archivo y dos capturas nunca chocan"""
+    huella = hashlib.sha256(png).hexdigest()
+    return os.path.join(CARPETA_CAPTURAS, huella[:2], f"{huella}.{_EXTENSIONES_CAPTURA.get(formato, 'jpg')}")
+
+def guardar_evidencia(png, ruta, formato=CAPTURA_FORMATO, calidad=CAPTURA_CALIDAD):
+    """Comprime la captura (bytes PNG del navegador) y la escribe en disco si no existía"""
+    if os.path.exists(ruta):
+        almacen_artefactos.tocar(ruta)  # mismo contenido: se reutiliza el archivo
+        return ruta
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    # Escribir aparte y renombrar: nadie lee (ni deduplica contra) una imagen a medias
+    temporal = f"{ruta}.{uuid.uuid4().hex[:8]}.tmp"
+    if formato == 'png':
+        with open(temporal, "wb") as f:
+            f.write(png)
+    else:
+        with PILImage.open(io.BytesIO(png)) as img:
+            img.convert("RGB").save(temporal, format=formato.upper(), quality=calidad)
+    os.replace(temporal, ruta)
+    return ruta
+
+def nombre_evidencia(captura):
+    """Nombre con el que /evidencia/<nombre> sirve la captura (o None)"""
+    return os.path.basename(captura) if captura and captura != "Sin captura" else None
+
+class AlmacenArtefactos:
+    """Capturas y reportes en disco con cuota: primero vence lo viejo y, si aún
+    se pasa de la cuota, se borra lo usado hace más tiempo.
+    
+    El último uso es la fecha de modificación del archivo (se renueva al reutilizar
+    una captura o descargar un archivo). Lo que usan los trabajos en curso no se toca.
+    """
+    
+    def __init__(self, carpetas, cuota_mb=CUOTA_DISCO_MB, retencion=RETENCION_ARTEFACTOS, en_uso=None):
+        self.carpetas = carpetas
+        self.cuota = cuota_mb * 1024 * 1024
+        self.retencion = retencion
+        self.en_uso = en_uso or set
+        self.bytes_ocupados = 0
+        self._lock = threading.Lock()
+        self._hilo = None
+    
+    @staticmethod
+    def tocar(ruta):
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+    
+    def _listar(self):
+        archivos = []
+        for carpeta in self.carpetas:
+            for raiz, _, nombres in os.walk(carpeta):
+                for nombre in nombres:
+                    if nombre.startswith("."):
+                        continue  # .gitkeep y similares no son artefactos
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        info = os.stat(ruta)
+                    except OSError:
+                        continue  # borrado mientras se recorría
+                    archivos.append((info.st_mtime, info.st_size, ruta))
+        return archivos
+    
+    def limpiar(self):
+        """Un barrido completo; devuelve (archivos borrados, bytes liberados)"""
+        with self._lock:
+            archivos = sorted(self._listar())  # del uso más antiguo al más reciente
+            protegidos = {os.path.normpath(ruta) for ruta in self.en_uso()}
+            ocupados = sum(tamano for _, tamano, _ in archivos)
+            vencimiento = time.time() - self.retencion if self.retencion else None
+            borrados = liberados = 0
+            for modificado, tamano, ruta in archivos:
+                vencido = vencimiento is not None and modificado < vencimiento
+                if not vencido and not (self.cuota and ocupados > self.cuota):
+                    break
+                if os.path.normpath(ruta) in protegidos:
+                    continue
+                try:
+                    os.remove(ruta)
+                except OSError:
+                    continue
+                ocupados -= tamano
+                borrados += 1
+                liberados += tamano
+            self.bytes_ocupados = ocupados
+        if borrados:
+            metricas.incrementar('simit_artefactos_eliminados_total', borrados)
+            print(f"🧹 Limpieza de artefactos: {borrados} archivo(s), {liberados / 1024 / 1024:.1f} MB liberados")
+        return borrados, liberados
+    
+    def iniciar_barrido(self, intervalo=INTERVALO_LIMPIEZA):
+        """Hilo en segundo plano que limpia al arrancar y luego cada `intervalo` segundos"""
+        if intervalo <= 0 or self._hilo:
+            return
+        def barrer():
+            while True:
+                try:
+                    self.limpiar()
+                except Exception as e:
+                    print(f"⚠️ Error limpiando artefactos: {e}")
+                time.sleep(intervalo)
+        self._hilo = threading.Thread(target=barrer, daemon=True, name="limpieza_artefactos")
+        self._hilo.start()
+
+almacen_artefactos = AlmacenArtefactos([CARPETA_CAPTURAS, CARPETA_REPORTES])
+
+# Reporte Excel: 'streaming' (write-only, filas a medida que terminan) o 'completo' (en memoria)
+EXCEL_MODO = os.environ.get("SIMIT_EXCEL_MODO", "streaming")
+MINIATURA_ANCHO = int(os.environ.get("SIMIT_MINIATURA_ANCHO", 480))
+MINIATURA_CALIDAD = int(os.environ.get("SIMIT_MINIATURA_CALIDAD", 70))
+
+def ruta_reporte_excel(trabajo_id=None):
+    """Nombre del reporte; el id del trabajo evita choques entre trabajos del mismo segundo"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sufijo = f"_{trabajo_id}" if trabajo_id else ""
+    return os.path.join(CARPETA_REPORTES, f"reporte_simit_{timestamp}{sufijo}.xlsx")
+
+def ruta_exportacion(trabajo_id, extension, prefijo="multas_simit"):
+    """Archivo de datos (multas CSV/JSONL, cambios) que acompaña al reporte Excel del trabajo"""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sufijo = f"_{trabajo_id}" if trabajo_id else ""
+    return os.path.join(CARPETA_REPORTES, f"{prefijo}_{timestamp}{sufijo}.{extension}")
+
+# Exportaciones para procesar sin Excel: CSV con una fila por multa, JSONL con una línea por placa
+FORMATOS_EXPORTACION = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+COLUMNAS_CSV_MULTAS = ['indice', 'placa_consultada', 'origen'] + list(Multa.__slots__)
+
+COLUMNAS_CAMBIOS = ['placa', 'cambio', 'tipo', 'secretaria', 'infraccion', 'estado_anterior', 'estado',
+                    'valor_a_pagar_anterior', 'valor_a_pagar']
+
+def filas_cambios(placa, cambios):
+    filas = []
+    for cambio, anterior, actual in cambios:
+        referencia = actual or anterior
+        filas.append([
+            placa, cambio, referencia.tipo, referencia.secretaria, referencia.infraccion,
+            anterior.estado if anterior else "", actual.estado if actual else "",
+            anterior.valor_a_pagar if anterior else "", actual.valor_a_pagar if actual else "",
+        ])
+    return filas
+
+def registro_jsonl(indice, resultado, origen):
+    """Línea JSONL de una placa: estado de la consulta, multas tipadas y total a pagar"""
+    multas = multas_de(resultado)
+    return json.dumps({
+        'indice': indice,
+        'placa': resultado[0],
+        'tiene_multas': resultado[1],
+        'resultado': resultado[2],
+        'error': resultado[4] if resultado[2] == "Error" else None,
+        'origen': origen,
+        'evidencia': nombre_evidencia(resultado[3]),
+        'total_a_pagar': sum(multa.valor_a_pagar or 0 for multa in multas),
+        'multas': [multa.a_dict() for multa in multas],
+    }, ensure_ascii=False, default=valor_json) + "\n"
+
+def filas_csv(indice, resultado, origen):
+    return [[indice, resultado[0], origen] + multa.a_lista() for multa in multas_de(resultado)]
+
+class ExportacionMultas:
+    """Escribe CSV y JSONL a medida que terminan las placas (el orden lo da la columna 'indice')"""
+    
+    def __init__(self, trabajo_id=None):
+        os.makedirs(CARPETA_REPORTES, exist_ok=True)
+        self.archivos = {formato: ruta_exportacion(trabajo_id, formato) for formato in FORMATOS_EXPORTACION}
+        self._lock = threading.Lock()
+        self._csv_archivo = open(self.archivos['csv'], "w", encoding="utf-8-sig", newline="")
+        self._csv = csv.writer(self._csv_archivo)
+        self._csv.writerow(COLUMNAS_CSV_MULTAS)
+        self._jsonl = open(self.archivos['jsonl'], "w", encoding="utf-8")
+    
+    def agregar(self, indice, resultado, origen="SIMIT"):
+        with self._lock:
+            self._csv.writerows(filas_csv(indice, resultado, origen))
+            self._jsonl.write(registro_jsonl(indice, resultado, origen))
+            self._csv_archivo.flush()
+            self._jsonl.flush()
+    
+    def cerrar(self):
+        with self._lock:
+            self._csv_archivo.close()
+            self._jsonl.close()
+        return dict(self.archivos)
+    
+    def descartar(self):
+        self.cerrar()
+        for ruta in self.archivos.values():
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+def crear_miniatura(captura, destino):
+    """Reduce la captura a una miniatura JPEG; devuelve (ancho, alto) en píxeles"""
+    with PILImage.open(captura) as img:
+        img.thumbnail((MINIATURA_ANCHO, MINIATURA_ANCHO))
+        img = img.convert("RGB")
+        img.save(destino, format="JPEG", quality=MINIATURA_CALIDAD, optimize=True)
+        return img.size
+
+class ReporteExcelStreaming:
+    """Reporte de control de multas escrito con el workbook write-only de openpyxl.
+    
+    Las filas se agregan a medida que terminan las placas (en cualquier orden) y se
+    escriben al disco en el orden de entrada; solo se retienen en memoria las que
+    llegan antes que sus anteriores. Las capturas se insertan como miniaturas JPEG
+    que openpyxl lee del disco recién al guardar.
+    """
+    
+    VERDE_OSCURO = "1F7246"
+    VERDE_CLARO = "C6E0B4"
+    ROJO_CLARO = "FFE6E6"
+    
+    def __init__(self, archivo=None):
+        if not os.path.exists(CARPETA_REPORTES):
+            os.makedirs(CARPETA_REPORTES)
+        self.archivo = archivo or ruta_reporte_excel()
+        
+        self._lock = threading.Lock()
+        self._pendientes = {}  # posición -> (resultado, origen) que llegaron fuera de orden
+        self._siguiente = 0
+        self._fila_excel = 5
+        self._dir_miniaturas = tempfile.mkdtemp(prefix="simit_miniaturas_")
+        
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet("Control de Multas")
+        self._escribir_encabezado()
+    
+    def _celda(self, valor, font=None, fill=None, alignment=None):
+        celda = WriteOnlyCell(self.ws, value=valor)
+        if font:
+            celda.font = font
+        if fill:
+            celda.fill = PatternFill(start_color=fill, end_color=fill, fill_type="solid")
+        if alignment:
+            celda.alignment = alignment
+        return celda
+    
+    def _escribir_encabezado(self):
+        ws = self.ws
+        # En modo write-only los anchos y las combinaciones van antes de las filas
+        for columna, ancho in zip("ABCDEF", [15, 15, 15, 35, 50, 20]):
+            ws.column_dimensions[columna].width = ancho
+        ws.merged_cells.add('A1:F2')
+        ws.merged_cells.add('A3:F3')
+        
+        ws.append([self._celda(
+            "FORMATO DE CONTROL DE MULTAS DE TRÁNSITO",
+            font=Font(name='Arial', size=16, bold=True, color="FFFFFF"),
+            fill=self.VERDE_OSCURO,
+            alignment=Alignment(horizontal="center", vertical="center")
+        )])
+        ws.append([])
+        ws.append([self._celda(
+            f"Reporte generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}",
+            font=Font(name='Arial', size=10, italic=True),
+            alignment=Alignment(horizontal="right")
+        )])
+        encabezados = ["Placa", "Estado Multas", "Resultado", "Evidencia", "Detalles", "Origen"]
+        ws.append([
+            self._celda(
+                encabezado,
+                font=Font(name='Arial', size=11, bold=True, color="FFFFFF"),
+                fill=self.VERDE_OSCURO,
+                alignment=Alignment(horizontal="center", vertical="center")
+            )
+            for encabezado in encabezados
+        ])
+    
+    def _preparar_miniatura(self, posicion, captura):
+        """Genera la miniatura fuera del candado; devuelve (ruta, ancho, alto) o None"""
+        if captura == "Sin captura" or not os.path.exists(captura):
+            return None
+        try:
+            miniatura = os.path.join(self._dir_miniaturas, f"{posicion}.jpg")
+            ancho, alto = crear_miniatura(captura, miniatura)
+            return miniatura, ancho, alto
+        except Exception as e:
+            print(f"Error generando miniatura: {e}")
+            return None
+    
+    def agregar(self, posicion, resultado, origen="SIMIT"):
+        """Registra el resultado de la placa en `posicion` y escribe todo lo que ya esté en orden"""
+        miniatura = self._preparar_miniatura(posicion, resultado[3])
+        with self._lock:
+            self._pendientes[posicion] = (resultado, origen, miniatura)
+            self._escribir_en_orden()
+    
+    def omitir(self, posicion):
+        """La placa en `posicion` no lleva fila (p. ej. sin cambios en modo monitoreo)"""
+        with self._lock:
+            self._pendientes[posicion] = None
+            self._escribir_en_orden()
+    
+    def _escribir_en_orden(self):
+        while self._siguiente in self._pendientes:
+            fila = self._pendientes.pop(self._siguiente)
+            if fila:
+                self._escribir_fila(*fila)
+            self._siguiente += 1
+    
+    def _escribir_fila(self, resultado, origen, miniatura):
+        placa, tiene_multa, resultado_consulta, captura, detalle_multas = resultado[:5]
+        idx = self._fila_excel
+        self._fila_excel += 1
+        
+        # Color de fila según estado
+        if tiene_multa == "Sí":
+            fill_color = self.ROJO_CLARO
+        elif resultado_consulta == "Error":
+            fill_color = "FFCCCC"
+        else:
+            fill_color = self.VERDE_CLARO if idx % 2 == 0 else "FFFFFF"
+        
+        # Miniatura de la evidencia (la altura de fila se fija antes de escribirla)
+        if miniatura:
+            try:
+                ruta_miniatura, ancho, alto = miniatura
+                img = Image(ruta_miniatura)
+                img.width = 300
+                img.height = round(300 * alto / ancho)
+                img.anchor = f"D{idx}"
+                self.ws.add_image(img)
+                self.ws.row_dimensions[idx].height = 120
+            except Exception as e:
+                print(f"Error agregando imagen: {e}")
+        
+        self.ws.append([
+            self._celda(placa, fill=fill_color, alignment=Alignment(horizontal="center")),
+            self._celda(
+                tiene_multa, fill=fill_color,
+                font=Font(color="FF0000", bold=True) if tiene_multa == "Sí" else None,
+                alignment=Alignment(horizontal="center") if tiene_multa == "Sí" else None
+            ),
+            self._celda(resultado_consulta, fill=fill_color),
+            self._celda("Ver imagen adjunta", fill=fill_color),
+            self._celda(detalle_multas or "Sin detalles", fill=fill_color,
+                        alignment=Alignment(wrap_text=True, vertical="top")),
+            self._celda(origen, fill=fill_color),
+        ])
+    
+    def descartar(self):
+        """Libera las miniaturas temporales cuando el proceso falla antes de guardar"""
+        shutil.rmtree(self._dir_miniaturas, ignore_errors=True)
+    
+    def cerrar(self):
+        """Escribe lo que quede pendiente, guarda el archivo y devuelve su ruta (o None)"""
+        try:
+            with self._lock:
+                for posicion in sorted(self._pendientes):
+                    fila = self._pendientes.pop(posicion)
+                    if fila:
+                        self._escribir_fila(*fila)
+            self.wb.save(self.archivo)
+            
+            if os.path.exists(self.archivo) and os.path.getsize(self.archivo) > 1000:
+                return self.archivo
+            return None
+        except Exception as e:
+            print(f"Error generando Excel: {e}")
+            return None
+        finally:
+            shutil.rmtree(self._dir_miniaturas, ignore_errors=True)
+
+# Pestañas por navegador: con más de una, cada Chrome envía la siguiente placa en otra pestaña
+# mientras SIMIT todavía responde la anterior (el ritmo global lo sigue marcando SIMIT_TASA_NAVEGADOR)
+PESTANAS_POR_NAVEGADOR = max(1, min(int(os.environ.get("SIMIT_PESTANAS", 1)), 8))
+
+# Perfil ligero: carga 'eager', sin animaciones y sin recursos que la consulta no necesita
+PERFIL_LIGERO = os.environ.get("SIMIT_PERFIL_LIGERO", "1") == "1"
+BLOQUEO_URLS_DEFECTO = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*youtube.com*",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+]
+BLOQUEO_URLS = [
+    patron.strip() for patron in os.environ.get("SIMIT_BLOQUEAR_URLS", ",".join(BLOQUEO_URLS_DEFECTO)).split(",")
+    if patron.strip()
+]
+
+# Se inyecta en cada documento: sin animaciones y con buffer amplio de Resource Timing
+SIN_ANIMACIONES_JS = """
+try { performance.setResourceTimingBufferSize(20000); } catch (e) {}
+document.addEventListener('DOMContentLoaded', function () {
+    var estilo = document.createElement('style');
+    estilo.textContent = '*, *::before, *::after { animation: none !important; ' +
+        'transition: none !important; scroll-behavior: auto !important; }';
+    document.head.appendChild(estilo);
+});
+"""
+
+# Bytes transferidos por la página desde que se cargó (navegación + recursos)
+BYTES_DESCARGADOS_JS = """
+var total = 0;
+performance.getEntriesByType('navigation').concat(performance.getEntriesByType('resource'))
+    .forEach(function (e) { total += e.transferSize || 0; });
+return total;
+"""
+
+# Consulta observada dentro de la página: antes de enviar la placa se instala un MutationObserver
+# que deja en window.__simitConsulta el estado y la tabla en cuanto la SPA pinta la respuesta de
+# esa placa (o, si no la menciona, cuando el DOM queda quieto con contenido nuevo). Así no se sondea
+# la página ni se lee la tabla de la placa anterior.
+BUSQUEDA_EN_PAGINA = os.environ.get("SIMIT_BUSQUEDA_EN_PAGINA", "1") == "1"
+# Escribir y enviar la placa desde el propio script (eventos sintéticos) en lugar de teclear con Selenium
+DISPARO_EN_PAGINA = os.environ.get("SIMIT_DISPARO_EN_PAGINA", "0") == "1"
+QUIETUD_RESULTADO_MS = int(os.environ.get("SIMIT_QUIETUD_RESULTADO_MS", 300))
+
+# Argumentos: placa, límite (ms), quietud (ms), disparar. Devuelve {ok, bytes}; ok=false si se pidió
+# disparar y no está el campo (el llamador teclea la placa con Selenium)
+OBSERVAR_CONSULTA_JS = """
+var placa = String(arguments[0]).toUpperCase(), limiteMs = arguments[1], quietudMs = arguments[2];
+var disparar = arguments[3];
+var estadoPagina = function () {
+""" + ESTADO_RESULTADO_JS + """
+};
+var leerTabla = function () {
+""" + LEER_TABLA_MULTAS_JS + """
+};
+var bytesDescargados = function () {
+""" + BYTES_DESCARGADOS_JS + """
+};
+var anterior = window.__simitConsulta;
+if (anterior && !anterior.resultado) {
+    anterior.observador.disconnect();
+    clearTimeout(anterior.quietud);
+    clearTimeout(anterior.vence);
+}
+""" + MARCAR_RESULTADOS_PREVIOS_JS + """
+var consulta = {placa: placa, resultado: null, avisar: null, vistoCargando: false, quietud: null};
+window.__simitConsulta = consulta;
+
+var terminar = function (estado) {
+    if (consulta.resultado) { return; }
+    consulta.observador.disconnect();
+    clearTimeout(consulta.quietud);
+    clearTimeout(consulta.vence);
+    var datos = (estado === 'error' || estado === 'timeout') ? null : leerTabla();
+    consulta.resultado = {estado: estado, datos: datos};
+    if (consulta.avisar) { consulta.avisar(consulta.resultado); }
+};
+// Estado terminal según la página: el de ESTADO_RESULTADO_JS o 'estable' si pasó la carga
+var terminal = function (e) {
+    if (e.cargando) { consulta.vistoCargando = true; }
+    if (e.estado) { return e.estado; }
+    return (consulta.vistoCargando && !e.cargando && e.hayContenido) ? 'estable' : null;
+};
+var revisar = function () {
+    if (consulta.resultado) { return; }
+    clearTimeout(consulta.quietud);
+    var e = estadoPagina();
+    var estado = terminal(e);
+    if (!estado) { return; }
+    if (estado === 'error') { terminar(estado); return; }
+    var texto = (document.body.innerText || '').toUpperCase();
+    if (!e.cargando && texto.indexOf(placa) >= 0) { terminar(estado); return; }
+    // Contenido nuevo que no nombra la placa: se da por bueno cuando el DOM deja de cambiar
+    consulta.quietud = setTimeout(function () {
+        var final = terminal(estadoPagina());
+        if (final) { terminar(final); }
+    }, quietudMs);
+};
+consulta.observador = new MutationObserver(revisar);
+consulta.observador.observe(document.body, {
+    childList: true, subtree: true, characterData: true,
+    attributes: true, attributeFilter: ['class', 'style', 'hidden']
+});
+consulta.vence = setTimeout(function () { terminar('timeout'); }, limiteMs);
+
+var bytes = bytesDescargados();
+if (!disparar) { return {ok: true, bytes: bytes}; }
+var campo = document.getElementById('txtBusqueda');
+if (!campo) { return {ok: false, bytes: bytes}; }
+// Angular escucha 'input' sobre el valor nativo; Enter se envía como lo haría el teclado
+Object.getOwnPropertyDescriptor(HTMLInputElement.prototype, 'value').set.call(campo, placa);
+campo.dispatchEvent(new Event('input', {bubbles: true}));
+campo.dispatchEvent(new Event('change', {bubbles: true}));
+['keydown', 'keypress', 'keyup'].forEach(function (tipo) {
+    campo.dispatchEvent(new KeyboardEvent(tipo, {key: 'Enter', code: 'Enter', keyCode: 13, which: 13, bubbles: true}));
+});
+return {ok: true, bytes: bytes};
+"""
+
+# Asíncrono: resuelve con {estado, datos} cuando el observador termina; {estado: null} si la página
+# se recargó y ya no hay consulta observada
+ESPERAR_CONSULTA_JS = """
+var listo = arguments[arguments.length - 1];
+var consulta = window.__simitConsulta;
+if (!consulta) { listo({estado: null}); return; }
+if (consulta.resultado) { listo(consulta.resultado); return; }
+consulta.avisar = listo;
+"""
+
+# Sin bloquear (pestañas): {estado, datos} si ya terminó, false si sigue en curso, null si se perdió
+RESULTADO_CONSULTA_JS = """
+var consulta = window.__simitConsulta;
+if (!consulta) { return null; }
+return consulta.resultado || false;
+"""
+
+def aplicar_perfil_ligero(driver, bloqueo_urls=None):
+    """Bloqueo de URLs y CSS sin animaciones vía Chrome DevTools Protocol"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOQUEO_URLS if bloqueo_urls is None else bloqueo_urls})
+    driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": SIN_ANIMACIONES_JS})
 
 # Configuración para Railway (Linux)
-def configurar_chrome_para_railway():
+def configurar_chrome_para_railway(perfil_dir=None, ligero=PERFIL_LIGERO):
     options = Options()
     
+    if ligero:
+        # No esperar imágenes ni subrecursos: basta con el DOM listo
+        options.page_load_strategy = 'eager'
+    
     if platform.system() == "Linux":
         options.add_argument('--headless')  # Sin interfaz gráfica
         options.add_argument('--no-sandbox')
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--disable-gpu')
-        options.add_argument('--remote-debugging-port=9222')
+        # Puerto 0: Chrome toma uno libre del sistema, así no chocan varios procesos o workers
+        options.add_argument('--remote-debugging-port=0')
         options.add_argument('--disable-extensions')
         options.add_argument('--disable-plugins')
         options.add_argument('--window-size=1920,1080')
+        if PESTANAS_POR_NAVEGADOR > 1:
+            # Las pestañas en segundo plano deben seguir ejecutando la página a toda velocidad
+            options.add_argument('--disable-background-timer-throttling')
+            options.add_argument('--disable-renderer-backgrounding')
+            options.add_argument('--disable-backgrounding-occluded-windows')
         # Railway tiene Chrome preinstalado
         options.binary_location = "/usr/bin/google-chrome"
     else:
@@ -36,36 +1334,723 @@ def configurar_chrome_para_railway():
         options.add_argument('--disable-dev-shm-usage')
         options.add_argument('--disable-gpu')
     
+    # Perfil propio para que varias instancias no compartan el mismo directorio
+    if perfil_dir:
+        options.add_argument(f'--user-data-dir={perfil_dir}')
+    
     return options
 
+# Carga masiva de placas desde CSV / XLSX
+MAX_PLACAS_CARGA = int(os.environ.get("SIMIT_MAX_PLACAS_CARGA", 50000))
+MAX_CARGA_MB = int(os.environ.get("SIMIT_MAX_CARGA_MB", 20))
+MAX_RECHAZADAS_REPORTE = 1000  # filas rechazadas que se detallan en la respuesta
+
+# Formatos de placa colombianos, ya normalizados (sin espacios ni guiones)
+FORMATOS_PLACA = {
+    'vehiculo': re.compile(r'[A-Z]{3}\d{3}'),
+    'motocicleta': re.compile(r'[A-Z]{3}\d{2}[A-Z]?'),
+    'motocarro': re.compile(r'\d{3}[A-Z]{3}'),
+    'remolque': re.compile(r'[RS]\d{5}'),
+    'diplomatica': re.compile(r'(CD|CC|OI|AT)\d{4}'),
+}
+COLUMNAS_PLACA = ('placa', 'placas', 'matricula', 'matrícula', 'vehiculo', 'vehículo')
+
+def tipo_placa(placa):
+    """Tipo de placa colombiana que coincide con `placa` (normalizada), o None si no es válida"""
+    for tipo, patron in FORMATOS_PLACA.items():
+        if patron.fullmatch(placa):
+            return tipo
+    return None
+
+class DepuradorPlacas:
+    """Normaliza, valida y deduplica placas a medida que llegan, anotando las filas rechazadas"""
+    
+    def __init__(self, maximo=MAX_PLACAS_CARGA):
+        self.maximo = maximo
+        self.placas = []
+        self._primera_fila = {}  # placa -> fila donde apareció primero
+        self.rechazadas = []  # {'fila', 'valor', 'motivo'}, hasta MAX_RECHAZADAS_REPORTE
+        self.total_rechazadas = 0
+        self.invalidas = 0
+        self.duplicadas = 0
+        self.vacias = 0
+        self.filas = 0
+    
+    def _rechazar(self, fila, valor, motivo):
+        self.total_rechazadas += 1
+        if len(self.rechazadas) < MAX_RECHAZADAS_REPORTE:
+            self.rechazadas.append({'fila': fila, 'valor': valor, 'motivo': motivo})
+    
+    def agregar(self, fila, valor):
+        self.filas += 1
+        texto = "" if valor is None else str(valor).strip()
+        if not texto:
+            self.vacias += 1
+            return
+        
+        placa = normalizar_placa(texto)
+        if not tipo_placa(placa):
+            self.invalidas += 1
+            self._rechazar(fila, texto, "Formato de placa no válido")
+        elif placa in self._primera_fila:
+            self.duplicadas += 1
+            self._rechazar(fila, texto, f"Duplicada (fila {self._primera_fila[placa]})")
+        elif len(self.placas) >= self.maximo:
+            self._rechazar(fila, texto, f"Supera el máximo de {self.maximo} placas por carga")
+        else:
+            self._primera_fila[placa] = fila
+            self.placas.append(placa)
+    
+    def reporte(self):
+        return {
+            'filas': self.filas,
+            'validas': len(self.placas),
+            'invalidas': self.invalidas,
+            'duplicadas': self.duplicadas,
+            'vacias': self.vacias,
+            'total_rechazadas': self.total_rechazadas,
+            'rechazadas': self.rechazadas,
+        }
+
+def filas_de_carga(archivo, nombre):
+    """Genera las filas (listas de celdas) de un CSV o XLSX sin cargarlo entero en memoria"""
+    extension = os.path.splitext(nombre or "")[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            for fila in wb.worksheets[0].iter_rows(values_only=True):
+                yield list(fila)
+        finally:
+            wb.close()
+    elif extension in ('.csv', '.txt'):
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', errors='replace', newline='')
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t|")
+        except csv.Error:
+            dialecto = csv.excel
+        try:
+            yield from csv.reader(texto, dialecto)
+        finally:
+            texto.detach()
+    else:
+        raise ValueError(f"Formato no soportado: '{extension or nombre}'. Use CSV o XLSX")
+
+def depurar_filas(filas, columna=None):
+    """Pasa las filas por un DepuradorPlacas tomando la columna de placas del encabezado (o la primera)"""
+    depurador = DepuradorPlacas()
+    indice = None
+    for numero, fila in enumerate(filas, start=1):
+        if indice is None:
+            nombres = [str(celda or "").strip().lower() for celda in fila]
+            buscadas = (columna.strip().lower(),) if columna else COLUMNAS_PLACA
+            encontradas = [i for i, nombre in enumerate(nombres) if nombre in buscadas]
+            if encontradas:
+                indice = encontradas[0]
+                continue  # fila de encabezado
+            if columna:
+                raise ValueError(f"No se encontró la columna '{columna}' en la primera fila")
+            indice = 0
+        depurador.agregar(numero, fila[indice] if indice < len(fila) else None)
+    return depurador
+
+def opcion_booleana(valor):
+    """'1'/'true'/'on' de un formulario como booleano; None si no vino"""
+    if valor is None or valor == "":
+        return None
+    return str(valor).strip().lower() in ('1', 'true', 'on', 'si', 'sí')
+
 app = Flask(__name__)
+app.config['MAX_CONTENT_LENGTH'] = MAX_CARGA_MB * 1024 * 1024
+
+# Pool de navegadores compartido entre trabajos
+POOL_CALIENTES = int(os.environ.get("SIMIT_POOL_CALIENTES", 1))  # sesiones listas al arrancar
+POOL_MAX_LIBRES = int(os.environ.get("SIMIT_POOL_MAX_LIBRES", 4))  # 0 = cerrar al terminar cada trabajo
+POOL_RECICLAR_PLACAS = int(os.environ.get("SIMIT_POOL_RECICLAR_PLACAS", 200))
+POOL_RECICLAR_MB = int(os.environ.get("SIMIT_POOL_RECICLAR_MB", 400))  # crecimiento de memoria tolerado
+
+def memoria_proceso_mb(pid):
+    """Memoria residente (MB) de un proceso y todos sus descendientes; 0 fuera de Linux"""
+    total = 0
+    pendientes = [pid]
+    vistos = set()
+    while pendientes:
+        actual = pendientes.pop()
+        if actual in vistos:
+            continue
+        vistos.add(actual)
+        try:
+            with open(f"/proc/{actual}/statm") as f:
+                total += int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            for tarea in os.listdir(f"/proc/{actual}/task"):
+                with open(f"/proc/{actual}/task/{tarea}/children") as f:
+                    pendientes.extend(int(hijo) for hijo in f.read().split())
+        except (OSError, ValueError):
+            continue
+    return round(total / (1024 * 1024), 1)
+
+# Trabajos: cuántos corren a la vez y cuánto se conservan los terminados
+MAX_TRABAJOS_SIMULTANEOS = int(os.environ.get("SIMIT_MAX_TRABAJOS", 2))
+# Clases de prioridad, de mayor a menor: consultas puntuales con alguien esperando y corridas de flota.
+# Sin prioridad explícita, un trabajo de hasta SIMIT_MAX_PLACAS_INTERACTIVA placas es interactivo.
+PRIORIDADES = ('interactiva', 'lote')
+MAX_PLACAS_INTERACTIVA = int(os.environ.get("SIMIT_MAX_PLACAS_INTERACTIVA", 10))
+# Trabajos interactivos que pueden correr además de los SIMIT_MAX_TRABAJOS (no esperan a que acabe un lote)
+MAX_TRABAJOS_INTERACTIVOS = int(os.environ.get("SIMIT_MAX_TRABAJOS_INTERACTIVOS", 2))
+# Dónde corren: 'local' (hilos dentro de la web), 'externo' (la web solo encola en la bitácora y
+# los ejecutan procesos de worker_simit.py) o 'worker' (lo fija worker_simit.py para sí mismo)
+MODO_TRABAJOS = os.environ.get("SIMIT_MODO_TRABAJOS", "local")
+INTERVALO_COLA = float(os.environ.get("SIMIT_INTERVALO_COLA", 1))  # segundos entre búsquedas de trabajo
+RETENCION_TRABAJOS = int(os.environ.get("SIMIT_RETENCION_TRABAJOS", 3600))  # segundos
+MAX_TRABAJOS_RETENIDOS = int(os.environ.get("SIMIT_MAX_TRABAJOS_RETENIDOS", 50))
+
+def prioridad_de_trabajo(prioridad, num_placas):
+    """Clase de prioridad de un trabajo; un lote grande no puede pedir trato interactivo"""
+    if prioridad not in PRIORIDADES:
+        prioridad = 'interactiva' if num_placas <= MAX_PLACAS_INTERACTIVA else 'lote'
+    if prioridad == 'interactiva' and num_placas > MAX_PLACAS_INTERACTIVA:
+        return 'lote'
+    return prioridad
+
+def rango_prioridad(prioridad):
+    """Posición de la clase en PRIORIDADES (menor = antes); lo desconocido va como lote"""
+    return PRIORIDADES.index(prioridad) if prioridad in PRIORIDADES else len(PRIORIDADES) - 1
+
+def nuevo_progreso(total=0, estado='idle', mensaje='Listo para iniciar'):
+    """Estructura de progreso de un trabajo (lo que devuelve /progreso)"""
+    return {
+        'estado': estado,
+        'mensaje': mensaje,
+        'placa_actual': '',
+        'total': total,
+        'procesadas': 0,
+        'porcentaje': 0,
+        'con_multas': 0,
+        'errores': 0,
+        'archivo_excel': '',
+        'cacheadas': 0
+    }
 
-# Variables globales para el progreso
-progreso_actual = {
-    'estado': 'idle',
-    'mensaje': 'Listo para iniciar',
-    'placa_actual': '',
-    'total': 0,
-    'procesadas': 0,
-    'porcentaje': 0,
-    'resultados': [],
-    'archivo_excel': ''
+# API de resultados paginada (los resultados no viajan en /progreso)
+RESULTADOS_POR_PAGINA = 100
+MAX_RESULTADOS_POR_PAGINA = 1000
+FILTROS_RESULTADOS = {
+    'todas': lambda resultado: True,
+    'multas': lambda resultado: resultado[1] == "Sí",
+    'errores': lambda resultado: resultado[2] == "Error",
 }
 
-class SimitScraper:
+def fila_resultado(indice, resultado, origen, con_detalle=True):
+    """Resultado de una placa como objeto JSON para /resultados"""
+    fila = {
+        'indice': indice,
+        'placa': resultado[0],
+        'tiene_multas': resultado[1],
+        'resultado': resultado[2],
+        'evidencia': nombre_evidencia(resultado[3]),
+        'origen': origen,
+    }
+    if con_detalle:
+        fila['detalle'] = resultado[4]
+        fila['multas'] = [multa.a_dict() for multa in multas_de(resultado)]
+    return fila
+
+# Server-Sent Events: cada conexión se cierra tras este tiempo y el navegador reconecta
+SSE_DURACION_MAX = int(os.environ.get("SIMIT_SSE_DURACION_MAX", 300))
+SSE_KEEPALIVE = 15
+
+# Etapas medidas por placa (en segundos) y límites de los histogramas de /metrics
+ETAPAS_PLACA = ['http', 'popup', 'ingreso', 'resultado', 'deteccion', 'extraccion', 'captura']
+BUCKETS_SEGUNDOS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+def describir_fallo(e):
+    """Texto corto de una excepción (Selenium incluye el stacktrace en str(e))"""
+    if isinstance(e, WebDriverException):
+        lineas = (e.msg or "").strip().splitlines()
+        return f"{type(e).__name__}: {lineas[0]}" if lineas else type(e).__name__
+    return str(e) or type(e).__name__
+
+def clasificar_error(detalle):
+    """Etiqueta corta para contar errores por tipo en /metrics"""
+    texto = (detalle or "").lower()
+    if 'timeout' in texto or 'timed out' in texto:
+        return 'timeout'
+    if 'simit respondió con un error' in texto:
+        return 'simit'
+    if 'no procesada' in texto:
+        return 'no_procesada'
+    if 'chrome' in texto or 'session' in texto or 'webdriver' in texto or 'nosuchwindow' in texto:
+        return 'navegador'
+    return 'otro'
+
+class TiempoAgotadoSimit(Exception):
+    """La consulta no llegó a un estado terminal dentro de TIEMPOS_ESPERA['resultado']"""
+
+# Fallos que vale la pena reintentar, y los que indican que SIMIT (no nuestro Chrome) está caído
+FALLOS_TRANSITORIOS = ('timeout', 'simit', 'navegador')
+FALLOS_DE_SIMIT = ('timeout', 'simit')
+
+def espera_reintento(intento, base=REINTENTO_BASE, maximo=REINTENTO_MAX_ESPERA):
+    """Espera exponencial con jitter completo: aleatoria entre 0 y base * 2^(intento-1)"""
+    return random.uniform(0, min(maximo, base * 2 ** (intento - 1)))
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) por rango más cercano; None si no hay valores"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    posicion = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[posicion]
+
+def resumir_tiempos(tiempos_por_placa, etapas=ETAPAS_PLACA):
+    """Promedio, p50, p95 y total por etapa a partir de los tiempos de cada placa"""
+    resumen = {}
+    for etapa in etapas:
+        valores = [t[etapa] for t in tiempos_por_placa if etapa in t]
+        if valores:
+            resumen[etapa] = {
+                'promedio': round(sum(valores) / len(valores), 3),
+                'p50': percentil(valores, 50),
+                'p95': percentil(valores, 95),
+                'total': round(sum(valores), 3),
+            }
+    return resumen
+
+class MetricasSimit:
+    """Métricas del proceso en formato de texto de Prometheus (sin dependencias externas)"""
+    
+    def __init__(self, buckets=BUCKETS_SEGUNDOS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histogramas = {}  # etapa -> {'buckets': [...], 'suma': x, 'cuenta': n}
+        self._contadores = defaultdict(float)  # (nombre, (('etiqueta', 'valor'), ...)) -> valor
+        self._terminadas = deque(maxlen=100000)  # instantes de placas terminadas
+    
+    def observar(self, etapa, segundos):
+        with self._lock:
+            histograma = self._histogramas.setdefault(
+                etapa, {'buckets': [0] * len(self.buckets), 'suma': 0.0, 'cuenta': 0}
+            )
+            for i, limite in enumerate(self.buckets):
+                if segundos <= limite:
+                    histograma['buckets'][i] += 1
+            histograma['suma'] += segundos
+            histograma['cuenta'] += 1
+    
+    def observar_placa(self, tiempos):
+        for etapa in ETAPAS_PLACA:
+            if etapa in tiempos:
+                self.observar(etapa, tiempos[etapa])
+        if 'bytes' in tiempos:
+            self.incrementar('simit_bytes_descargados_total', tiempos['bytes'])
+    
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        with self._lock:
+            self._contadores[(nombre, tuple(sorted(etiquetas.items())))] += valor
+    
+    def placa_terminada(self, resultado, origen):
+        self.incrementar('simit_placas_total', resultado=resultado, origen=origen)
+        with self._lock:
+            self._terminadas.append(time.time())
+    
+    def placas_por_minuto(self):
+        limite = time.time() - 60
+        with self._lock:
+            return sum(1 for instante in self._terminadas if instante >= limite)
+    
+    @staticmethod
+    def _etiquetas(pares):
+        if not pares:
+            return ""
+        return "{" + ",".join(f'{clave}="{valor}"' for clave, valor in pares) + "}"
+    
+    def exportar(self, medidores=None):
+        """Texto para /metrics; `medidores` son gauges calculados al momento {nombre: [(etiquetas, valor)]}"""
+        lineas = [
+            "# HELP simit_etapa_segundos Duración de cada etapa de la consulta de una placa",
+            "# TYPE simit_etapa_segundos histogram",
+        ]
+        with self._lock:
+            for etapa, histograma in sorted(self._histogramas.items()):
+                for limite, conteo in zip(self.buckets, histograma['buckets']):
+                    lineas.append(f'simit_etapa_segundos_bucket{{etapa="{etapa}",le="{limite}"}} {conteo}')
+                lineas.append(f'simit_etapa_segundos_bucket{{etapa="{etapa}",le="+Inf"}} {histograma["cuenta"]}')
+                lineas.append(f'simit_etapa_segundos_sum{{etapa="{etapa}"}} {round(histograma["suma"], 6)}')
+                lineas.append(f'simit_etapa_segundos_count{{etapa="{etapa}"}} {histograma["cuenta"]}')
+            
+            nombres = sorted({nombre for nombre, _ in self._contadores})
+            for nombre in nombres:
+                lineas.append(f"# TYPE {nombre} counter")
+                for (actual, pares), valor in sorted(self._contadores.items()):
+                    if actual == nombre:
+                        lineas.append(f"{nombre}{self._etiquetas(pares)} {valor:g}")
+        
+        lineas.append("# TYPE simit_placas_por_minuto gauge")
+        lineas.append(f"simit_placas_por_minuto {self.placas_por_minuto()}")
+        for nombre, valores in (medidores or {}).items():
+            lineas.append(f"# TYPE {nombre} gauge")
+            for pares, valor in valores:
+                lineas.append(f"{nombre}{self._etiquetas(pares)} {valor:g}")
+        return "\n".join(lineas) + "\n"
+
+metricas = MetricasSimit()
+
+class LimitadorTasa:
+    """Cubeta de fichas compartida: como máximo `tasa` consultas por segundo con ráfagas de `rafaga`.
+    
+    Cuando hay varias consultas esperando, la siguiente ficha no es del hilo que
+    despierte primero: va a la clase de prioridad más alta y, dentro de ella, al
+    usuario y luego al trabajo que hace más tiempo no recibe una. Nunca queda una
+    ficha sin usar mientras alguien espera, así que el lote no pierde ritmo.
+    """
+    
+    def __init__(self, tasa, rafaga=RAFAGA_CONSULTAS):
+        self.tasa = tasa
+        self.rafaga = max(1, rafaga)
+        self._fichas = float(self.rafaga)
+        self._ultima = time.monotonic()
+        self._lock = threading.Lock()
+        self._turno_libre = threading.Condition(self._lock)
+        self._esperando = []  # turnos en espera: [rango, usuario, trabajo, llegada]
+        self._ultimo_servicio = {}  # ('usuario' | 'trabajo', clave) -> reloj de su última ficha
+        self._reloj = 0  # avanza con cada llegada y cada ficha entregada
+    
+    def _siguiente(self):
+        """Turno al que le toca la próxima ficha"""
+        return min(self._esperando, key=lambda turno: (
+            turno[0],
+            self._ultimo_servicio.get(('usuario', turno[1]), 0),
+            self._ultimo_servicio.get(('trabajo', turno[2]), 0),
+            turno[3],
+        ))
+    
+    def adquirir(self, prioridad='lote', usuario=None, trabajo=None):
+        """Bloquea hasta que haya una ficha disponible para este turno y la consume"""
+        if self.tasa <= 0:
+            return
+        with self._turno_libre:
+            self._reloj += 1
+            turno = [rango_prioridad(prioridad), usuario or trabajo, trabajo, self._reloj]
+            self._esperando.append(turno)
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    self._fichas = min(self.rafaga, self._fichas + (ahora - self._ultima) * self.tasa)
+                    self._ultima = ahora
+                    if self._fichas >= 1 and self._siguiente() is turno:
+                        self._fichas -= 1
+                        self._reloj += 1
+                        self._ultimo_servicio[('usuario', turno[1])] = self._reloj
+                        self._ultimo_servicio[('trabajo', trabajo)] = self._reloj
+                        return
+                    # Sin ficha: dormir hasta que se reponga. Con ficha pero sin turno: hasta que salga alguien
+                    self._turno_libre.wait((1 - self._fichas) / self.tasa if self._fichas < 1 else None)
+            finally:
+                self._esperando.remove(turno)
+                if not self._esperando:
+                    self._ultimo_servicio.clear()  # sin competencia no hace falta recordar a nadie
+                self._turno_libre.notify_all()
+
+class CircuitoSimit:
+    """Cortocircuito compartido por todos los trabajos.
+    
+    Tras `umbral` fallos seguidos de SIMIT se abre y nadie consulta durante
+    `pausa` segundos; luego deja pasar una sola consulta de prueba. Si sale
+    bien se cierra, si falla vuelve a abrirse.
+    """
+    
+    def __init__(self, umbral=CIRCUITO_UMBRAL, pausa=CIRCUITO_PAUSA):
+        self.umbral = max(1, umbral)
+        self.pausa = pausa
+        self._fallos = 0
+        self._abierto_hasta = 0  # 0 = cerrado
+        self._sondeo_desde = None
+        self._cond = threading.Condition()
+    
+    def segundos_pausa(self):
+        """Segundos que faltan para volver a probar (0 si no está abierto)"""
+        with self._cond:
+            return max(0, self._abierto_hasta - time.time()) if self._abierto_hasta else 0
+    
+    def estado(self):
+        with self._cond:
+            if not self._abierto_hasta:
+                return 'cerrado'
+            return 'abierto' if time.time() < self._abierto_hasta else 'semiabierto'
+    
+    def esperar(self):
+        """Bloquea mientras el circuito esté abierto; en semiabierto deja pasar a uno solo"""
+        with self._cond:
+            while self._abierto_hasta:
+                ahora = time.time()
+                if ahora < self._abierto_hasta:
+                    self._cond.wait(self._abierto_hasta - ahora)
+                    continue
+                # Si la consulta de prueba quedó colgada se permite otra
+                if self._sondeo_desde is None or ahora - self._sondeo_desde > self.pausa:
+                    self._sondeo_desde = ahora
+                    return
+                self._cond.wait(1)
+    
+    def exito(self):
+        with self._cond:
+            if self._abierto_hasta:
+                print("✅ SIMIT responde de nuevo; se reanudan las consultas")
+            self._fallos = 0
+            self._abierto_hasta = 0
+            self._sondeo_desde = None
+            self._cond.notify_all()
+    
+    def fallo(self):
+        with self._cond:
+            self._fallos += 1
+            if self._sondeo_desde is None and self._fallos < self.umbral:
+                return
+            self._abierto_hasta = time.time() + self.pausa
+            self._sondeo_desde = None
+            self._cond.notify_all()
+        metricas.incrementar('simit_circuito_aperturas_total')
+        print(f"⛔ SIMIT no responde ({self._fallos} fallos seguidos); pausa de {self.pausa:.0f} s")
+
+limitador_navegador = LimitadorTasa(TASA_NAVEGADOR)
+limitador_http = LimitadorTasa(TASA_HTTP)
+circuito_simit = CircuitoSimit()
+
+class CanalEventos:
+    """Registro de eventos de un trabajo (numerados desde 1) para el stream de progreso"""
+    
     def __init__(self):
+        self._eventos = []
+        self._cond = threading.Condition()
+        self.cerrado = False
+    
+    def publicar(self, tipo, datos):
+        with self._cond:
+            self._eventos.append((len(self._eventos) + 1, tipo, datos))
+            self._cond.notify_all()
+    
+    def cerrar(self):
+        with self._cond:
+            self.cerrado = True
+            self._cond.notify_all()
+    
+    def esperar(self, desde, timeout):
+        """Eventos posteriores al número `desde`; bloquea hasta `timeout` si no hay ninguno"""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._eventos) > desde or self.cerrado, timeout)
+            return self._eventos[desde:], self.cerrado
+
+class ConsultaSimitHTTP:
+    """Consulta SIMIT directamente contra el endpoint JSON, sin navegador.
+    
+    Usa una sesión HTTP con pool de conexiones compartida por varios hilos y
+    devuelve las mismas tuplas (placa, estado, resultado, captura, detalle, multas)
+    que el flujo con Selenium. Las placas que no se pueden resolver quedan
+    como None para que SimitScraper las reintente con el navegador.
+    """
+    
+    def __init__(self, url=API_SIMIT_URL, concurrencia=HTTP_CONCURRENCIA, timeout=HTTP_TIMEOUT, turno=None):
+        self.url = url
+        self.turno = turno or {}  # prioridad, usuario y trabajo ante el limitador de tasa
+        self.concurrencia = max(1, concurrencia)
+        self.timeout = timeout
+        self.tiempos = {}  # placa -> segundos de la última respuesta
+        self.session = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrencia)
+        self.session.mount("http://", adaptador)
+        self.session.mount("https://", adaptador)
+        self.session.headers.update({
+            'Accept': 'application/json',
+            'Content-Type': 'application/json',
+            'Origin': 'https://www.fcm.org.co',
+            'Referer': URL_SIMIT,
+        })
+    
+    def cerrar(self):
+        self.session.close()
+    
+    @staticmethod
+    def _campo(datos, *claves, defecto=""):
+        for clave in claves:
+            valor = datos.get(clave)
+            if valor not in (None, ""):
+                return valor
+        return defecto
+    
+    def multa_a_celdas(self, multa, placa):
+        """Ordena una multa del JSON como las columnas de #multaTable"""
+        infracciones = multa.get('infracciones') or []
+        if infracciones:
+            infraccion = ", ".join(
+                str(self._campo(i, 'codigoInfraccion', 'codigo')) for i in infracciones
+            )
+        else:
+            infraccion = self._campo(multa, 'infraccion', 'codigoInfraccion')
+        
+        tipo = self._campo(multa, 'tipo', 'tipoDocumento', defecto="Comparendo")
+        numero = self._campo(multa, 'numeroComparendo', 'numeroResolucion', 'numero')
+        return [
+            f"{tipo} {numero}".strip(),
+            str(self._campo(multa, 'fechaNotificacion', 'notificacion', 'fechaComparendo')),
+            str(self._campo(multa, 'placa', defecto=placa)),
+            str(self._campo(multa, 'organismoTransito', 'secretaria', 'secretariaTransito')),
+            str(infraccion),
+            str(self._campo(multa, 'estadoComparendo', 'estadoCartera', 'estado')),
+            str(self._campo(multa, 'valor', 'valorComparendo')),
+            str(self._campo(multa, 'valorPagar', 'valorAPagar', 'totalPagar')),
+        ]
+    
+    def interpretar_respuesta(self, placa, datos):
+        multas = datos.get('multas')
+        if multas is None:
+            multas = datos.get('comparendos')
+        if multas is None:
+            raise ValueError("Respuesta sin lista de multas")
+        
+        filas = [self.multa_a_celdas(multa, placa) for multa in multas]
+        if filas:
+            return (placa, "Sí", "Éxito", "Sin captura", formatear_detalle_multas(filas), multas_desde_filas(filas, placa))
+        return (placa, "No", "Éxito", "Sin captura", "", ())
+    
+    def _post_con_reintentos(self, placa):
+        """POST a SIMIT reintentando timeouts, errores de conexión, 429 y 5xx; None si no se logró"""
+        for intento in range(REINTENTOS_MAX + 1):
+            if intento:
+                espera = espera_reintento(intento)
+                metricas.incrementar('simit_reintentos_total', motor='http')
+                print(f"🔁 Reintentando {placa} por HTTP ({intento}/{REINTENTOS_MAX}) en {espera:.1f} s")
+                time.sleep(espera)
+            circuito_simit.esperar()
+            limitador_http.adquirir(**self.turno)
+            
+            inicio = time.monotonic()
+            try:
+                respuesta = self.session.post(self.url, json={'filtro': placa}, timeout=self.timeout)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                print(f"⚠️ Consulta HTTP fallida para {placa}: {e}")
+                circuito_simit.fallo()
+                continue
+            self.tiempos[placa] = round(time.monotonic() - inicio, 3)
+            
+            if respuesta.status_code == 429 or respuesta.status_code >= 500:
+                print(f"⚠️ HTTP {respuesta.status_code} consultando {placa}")
+                circuito_simit.fallo()
+                continue
+            circuito_simit.exito()
+            if respuesta.status_code != 200:
+                print(f"⚠️ HTTP {respuesta.status_code} consultando {placa}")
+                return None
+            return respuesta
+        return None
+    
+    def consultar_placa(self, placa):
+        """Devuelve la tupla de resultado, o None si hay que recurrir al navegador"""
+        try:
+            respuesta = self._post_con_reintentos(placa)
+            if respuesta is None:
+                return None
+            
+            datos = respuesta.json()
+            if HTTP_GRABAR_DIR:
+                os.makedirs(HTTP_GRABAR_DIR, exist_ok=True)
+                with open(os.path.join(HTTP_GRABAR_DIR, f"{placa}.json"), "w", encoding="utf-8") as f:
+                    json.dump(datos, f, ensure_ascii=False, indent=2)
+            
+            return self.interpretar_respuesta(placa, datos)
+        except Exception as e:
+            print(f"⚠️ Consulta HTTP fallida para {placa}: {e}")
+            return None
+    
+    def consultar_placas(self, placas, al_terminar=None):
+        """Consulta varias placas en paralelo; `al_terminar(posicion, resultado)` se llama por cada una"""
+        def consultar(posicion):
+            resultado = self.consultar_placa(placas[posicion])
+            if al_terminar:
+                al_terminar(posicion, resultado)
+            return resultado
+        
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as pool:
+            return list(pool.map(consultar, range(len(placas))))
+
+class CronometroEtapas:
+    """Duración de cada etapa de la consulta de una placa, medida entre marcas sucesivas"""
+    
+    def __init__(self):
+        self.tiempos = {}
+        self._inicio = time.monotonic()
+    
+    def fin(self, etapa):
+        ahora = time.monotonic()
+        self.tiempos[etapa] = round(ahora - self._inicio, 3)
+        self._inicio = ahora
+
+class PestanaConsulta:
+    """Una pestaña del buscador dentro de un Chrome, con la placa que tiene en vuelo (si alguna)"""
+    
+    def __init__(self, handle, primera=True):
+        self.handle = handle
+        self.primera = primera  # tras cargar la página puede aparecer el popup inicial
+        self.liberar()
+    
+    def iniciar(self, idx, placa, intento):
+        self.idx, self.placa, self.intento = idx, placa, intento
+        self.cronometro = CronometroEtapas()
+        self.visto = {'cargando': False}
+        self.bytes_inicio = None
+        self.observada = False  # la página avisa el final por MutationObserver
+        self.limite = time.monotonic() + TIEMPOS_ESPERA['resultado']
+    
+    def liberar(self):
+        self.idx = self.placa = None
+        self.intento = 0
+    
+    def libre(self):
+        return self.placa is None
+
+class SimitScraper:
+    def __init__(self, num_workers=None, motor=None, usar_cache=None, modo_excel=None, progreso=None,
+                 bitacora=None, pool=None, politica_captura=None, monitoreo=None, prioridad=None, usuario=None):
+        self.progreso = progreso if progreso is not None else nuevo_progreso()
+        self.prioridad = prioridad if prioridad in PRIORIDADES else 'lote'
+        self.usuario = usuario or None  # para repartir con justicia entre quienes piden trabajos
+        self.monitoreo = MonitoreoFlota() if (MONITOREO_DEFECTO if monitoreo is None else monitoreo) else None
+        self.huellas_previas = {}  # placa normalizada -> (huella, multas) de la corrida anterior
+        self.cambios_por_indice = {}  # índice -> [(cambio, multa_anterior, multa_actual)]
+        self.sin_cambios = set()  # índices cuya tabla de multas no cambió
+        self.pool = pool
+        self.politica_captura = politica_captura if politica_captura in ('todas', 'con_multas', 'ninguna') else CAPTURA_POLITICA
+        self._evidencias = {}  # ruta -> futuro del guardado en segundo plano
+        self._filas_diferidas = []  # eventos de filas del reporte que esperan su evidencia
+        self.inicio = None
+        self.segundos_excel = None
+        self.bitacora = bitacora
+        self.restaurados = set()  # índices recuperados de la bitácora al reanudar
+        self.eventos = CanalEventos()
         self.resultados = []
         self.driver = None
+        self.num_workers = max(1, min(int(num_workers or NUM_WORKERS_DEFECTO), MAX_WORKERS))
+        self._lock = threading.Lock()
+        self._procesadas = 0
+        self._registradas = set()
+        self._errores_inicio = []
+        self.tiempos_por_placa = {}
+        self.motor = motor if motor in ('selenium', 'http') else MOTOR_DEFECTO
+        self.cache = CacheResultados() if (CACHE_ACTIVO if usar_cache is None else usar_cache) else None
+        self.cache_por_indice = {}  # índice -> fecha de la consulta original
+        self.terminadas = {}  # índice -> tupla de resultado, a medida que terminan
+        self.orden_terminadas = []  # índices en el orden en que terminaron (cursor de /resultados)
+        self.modo_excel = modo_excel if modo_excel in ('streaming', 'completo') else EXCEL_MODO
+        self.reporte = None
+        self.exportacion = None
     
     def actualizar_progreso(self, mensaje, placa_actual='', total=0, procesadas=0):
-        global progreso_actual
-        
         porcentaje = 0
         if total > 0:
             porcentaje = round((procesadas / total) * 100, 1)
             porcentaje = min(porcentaje, 100)
         
-        progreso_actual.update({
+        self.progreso.update({
             'mensaje': mensaje,
             'placa_actual': placa_actual,
             'total': total,
@@ -74,87 +2059,87 @@ class SimitScraper:
         })
 
     def esperar_carga_simple(self, driver):
-        """Espera simplificada para carga de página"""
+        """Espera a que la SPA de SIMIT muestre el buscador (o su popup inicial)"""
         try:
-            WebDriverWait(driver, 20).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
+            WebDriverWait(driver, TIEMPOS_ESPERA['carga'], poll_frequency=INTERVALO_SONDEO).until(
+                lambda d: d.execute_script("return document.readyState") in ("interactive", "complete")
+                and (d.find_elements(By.ID, "txtBusqueda") or d.find_elements(By.CLASS_NAME, "swal2-popup"))
             )
-            time.sleep(5)  # Espera fija para que cargue todo
             return True
         except:
-            time.sleep(5)
             return True
 
-    def detectar_multas_mejorada(self, driver, placa):
+    def cerrar_popups(self, driver, timeout=0):
+        """Cierra el popup de SweetAlert si aparece dentro de `timeout` segundos"""
+        try:
+            if timeout:
+                WebDriverWait(driver, timeout, poll_frequency=INTERVALO_SONDEO).until(
+                    EC.presence_of_element_located((By.CLASS_NAME, "swal2-popup"))
+                )
+            botones = driver.find_elements(By.CLASS_NAME, "swal2-confirm")
+            if botones:
+                botones[0].click()
+                WebDriverWait(driver, TIEMPOS_ESPERA['popup'], poll_frequency=INTERVALO_SONDEO).until(
+                    EC.invisibility_of_element_located((By.CLASS_NAME, "swal2-popup"))
+                )
+        except:
+            pass
+
+    def esperar_resultado(self, driver):
+        """Espera hasta que la consulta llegue a un estado terminal.
+        
+        Devuelve 'multas', 'sin_multas', 'error' o 'timeout'. También se da por
+        terminada si se vio un indicador de carga y desapareció dejando contenido.
+        """
+        visto = {'cargando': False}
+        try:
+            return WebDriverWait(driver, TIEMPOS_ESPERA['resultado'], poll_frequency=INTERVALO_SONDEO).until(
+                lambda d: self.revisar_resultado(d, visto)
+            )
+        except TimeoutException:
+            return 'timeout'
+
+    def revisar_resultado(self, driver, visto):
+        """Una sola mirada a la página: estado terminal de la consulta o False si sigue cargando.
+        
+        `visto` recuerda entre llamadas si ya apareció un indicador de carga.
+        """
+        estado = driver.execute_script(ESTADO_RESULTADO_JS) or {}
+        if estado.get('estado'):
+            return estado['estado']
+        if estado.get('cargando'):
+            visto['cargando'] = True
+        elif visto['cargando'] and estado.get('hayContenido'):
+            return 'estable'
+        return False
+
+    def leer_tabla_multas(self, driver):
+        """Lee en una sola llamada al navegador la tabla de multas y los indicadores de la página"""
+        return driver.execute_script(LEER_TABLA_MULTAS_JS) or {}
+
+    def detectar_multas_mejorada(self, driver, placa, datos=None):
         """Detección CORREGIDA de multas usando los selectores reales de SIMIT"""
         try:
-            time.sleep(2)
+            if datos is None:
+                datos = self.leer_tabla_multas(driver)
             
-            # MÉTODO 1: Buscar tabla específica de SIMIT
-            try:
-                # Buscar por el ID exacto de la tabla de multas
-                tabla_multas = driver.find_element(By.ID, "multaTable")
-                tbody = tabla_multas.find_element(By.TAG_NAME, "tbody")
-                filas = tbody.find_elements(By.TAG_NAME, "tr")
-                
-                # Filtrar filas que no son de "sin resultados"
-                filas_con_multas = []
-                for fila in filas:
-                    texto_fila = fila.text.strip().lower()
-                    # Si la fila tiene datos reales de multa (no mensajes de "sin resultados")
-                    if texto_fila and not any(palabra in texto_fila for palabra in [
-                        'no se encontraron', 'sin multas', 'no hay multas', 'no tiene multas'
-                    ]):
-                        # Verificar que tiene celdas con datos reales
-                        celdas = fila.find_elements(By.TAG_NAME, "td")
-                        if len(celdas) >= 6:  # Una multa real debe tener al menos 6 columnas
-                            filas_con_multas.append(fila)
-                
+            # MÉTODO 1: Tabla específica de SIMIT (#multaTable)
+            if datos.get('tabla'):
+                filas_con_multas = datos.get('filas') or []
                 if len(filas_con_multas) > 0:
                     print(f"✅ MULTAS DETECTADAS: {len(filas_con_multas)} multa(s) en tabla")
                     return True, len(filas_con_multas)
                 else:
                     print("✅ TABLA ENCONTRADA pero SIN MULTAS")
                     return False, 0
-                    
-            except Exception as e:
-                print(f"No se encontró tabla #multaTable: {e}")
             
-            # MÉTODO 2: Buscar mensaje específico de "sin multas"
-            try:
-                # Buscar elementos que indiquen que no hay multas
-                sin_multas_elementos = driver.find_elements(By.XPATH, 
-                    "//*[contains(text(), 'No se encontraron') or contains(text(), 'sin multas') or contains(text(), 'No hay multas')]")
-                
-                if len(sin_multas_elementos) > 0:
-                    print("✅ SIN MULTAS - Mensaje encontrado")
-                    return False, 0
-                    
-            except:
-                pass
-            
-            # MÉTODO 3: Analizar texto general de la página
-            texto_pagina = driver.page_source.lower()
-            
-            # Mensajes específicos que indican NO hay multas
-            sin_multas_frases = [
-                "no se encontraron multas",
-                "sin multas registradas", 
-                "no hay multas",
-                "no tiene multas",
-                "sin infracciones",
-                "no se encontraron infracciones"
-            ]
-            
-            for frase in sin_multas_frases:
-                if frase in texto_pagina:
-                    print(f"✅ SIN MULTAS - Frase encontrada: '{frase}'")
-                    return False, 0
+            # MÉTODOS 2 y 3: Mensaje o frase de "sin multas" en la página
+            if datos.get('sinMultas'):
+                print(f"✅ SIN MULTAS - Mensaje encontrado: '{datos.get('fraseSinMultas', '')}'")
+                return False, 0
             
             # MÉTODO 4: Buscar indicadores positivos de multas
-            if any(palabra in texto_pagina for palabra in [
-                "valor a pagar", "cobro coactivo", "secretaría", "infracción"
-            ]):
+            if datos.get('indicadores'):
                 print("✅ POSIBLES MULTAS - Indicadores encontrados")
                 return True, 1
             
@@ -166,67 +2151,17 @@ class SimitScraper:
             print(f"❌ Error en detección: {e}")
             return False, 0
 
-    def extraer_detalles_multas(self, driver, placa):
+    def extraer_detalles_multas(self, driver, placa, datos=None):
         """Extracción CORREGIDA de detalles usando la estructura real de SIMIT"""
         detalles = ""
         try:
-            # Buscar la tabla específica de multas
-            tabla_multas = driver.find_element(By.ID, "multaTable")
-            tbody = tabla_multas.find_element(By.TAG_NAME, "tbody")
-            filas = tbody.find_elements(By.TAG_NAME, "tr")
+            if datos is None:
+                datos = self.leer_tabla_multas(driver)
             
-            multa_count = 0
-            for fila in filas:
-                try:
-                    texto_fila = fila.text.strip()
-                    if not texto_fila or any(palabra in texto_fila.lower() for palabra in [
-                        'no se encontraron', 'sin multas'
-                    ]):
-                        continue
-                    
-                    celdas = fila.find_elements(By.TAG_NAME, "td")
-                    if len(celdas) >= 6:
-                        multa_count += 1
-                        detalles += f"=== MULTA {multa_count} ===\n"
-                        
-                        # Extraer datos según la estructura real de SIMIT
-                        if len(celdas) > 0:  # Tipo y número
-                            tipo_cell = celdas[0].text.strip()
-                            detalles += f"Tipo: {tipo_cell}\n"
-                        
-                        if len(celdas) > 1:  # Notificación
-                            notif_cell = celdas[1].text.strip()
-                            detalles += f"Notificación: {notif_cell}\n"
-                        
-                        if len(celdas) > 2:  # Placa
-                            placa_cell = celdas[2].text.strip()
-                            detalles += f"Placa: {placa_cell}\n"
-                        
-                        if len(celdas) > 3:  # Secretaría
-                            secretaria_cell = celdas[3].text.strip()
-                            detalles += f"Secretaría: {secretaria_cell}\n"
-                        
-                        if len(celdas) > 4:  # Infracción
-                            infraccion_cell = celdas[4].text.strip()
-                            detalles += f"Infracción: {infraccion_cell}\n"
-                        
-                        if len(celdas) > 5:  # Estado
-                            estado_cell = celdas[5].text.strip()
-                            detalles += f"Estado: {estado_cell}\n"
-                        
-                        if len(celdas) > 6:  # Valor
-                            valor_cell = celdas[6].text.strip()
-                            detalles += f"Valor: {valor_cell}\n"
-                        
-                        if len(celdas) > 7:  # Valor a pagar
-                            valor_pagar_cell = celdas[7].text.strip()
-                            detalles += f"Valor a pagar: {valor_pagar_cell}\n"
-                        
-                        detalles += "\n"
-                        
-                except Exception as e:
-                    print(f"Error extrayendo fila de multa: {e}")
-                    continue
+            if datos.get('tabla'):
+                detalles = formatear_detalle_multas(datos.get('filas') or [])
+            else:
+                detalles = "No se pudieron extraer detalles específicos"
                     
         except Exception as e:
             print(f"Error extrayendo detalles de multas: {e}")
@@ -234,142 +2169,862 @@ class SimitScraper:
             
         return detalles.strip() if detalles.strip() else "Sin detalles disponibles"
 
-    def tomar_captura_simple(self, placa, driver):
-        """Captura simple de pantalla"""
+    def tomar_captura_simple(self, placa, driver):
+        """Captura la zona de resultados; comprimir y escribir el archivo queda en segundo plano"""
+        try:
+            try:
+                zona = driver.execute_script(ZONA_RESULTADOS_JS)
+                png = zona.screenshot_as_png if zona else driver.get_screenshot_as_png()
+            except Exception:
+                png = driver.get_screenshot_as_png()
+            
+            screenshot_path = ruta_evidencia(png)
+            
+            futuro = guardado_evidencias.submit(guardar_evidencia, png, screenshot_path)
+            futuro.add_done_callback(self._informar_evidencia)
+            with self._lock:
+                self._evidencias[screenshot_path] = futuro
+            return screenshot_path
+                
+        except:
+            return "Sin captura"
+
+    def _informar_evidencia(self, futuro):
+        if futuro.exception():
+            print(f"Error guardando evidencia: {futuro.exception()}")
+
+    def igual_a_anterior(self, placa, estado_multas, multas):
+        """En modo monitoreo, si la consulta coincide con la huella guardada de la placa"""
+        if not self.monitoreo:
+            return False
+        anterior = self.huellas_previas.get(normalizar_placa(placa))
+        return bool(anterior) and anterior[0] == huella_multas(estado_multas, multas)
+
+    def _comparar_con_anterior(self, idx, resultado):
+        """Anota los cambios de la placa frente a la corrida anterior; True si no cambió nada"""
+        if not self.monitoreo or resultado[2] != "Éxito":
+            return False
+        multas = multas_de(resultado)
+        if self.igual_a_anterior(resultado[0], resultado[1], multas):
+            self.sin_cambios.add(idx)
+            return True
+        anterior = self.huellas_previas.get(normalizar_placa(resultado[0]))
+        self.cambios_por_indice[idx] = comparar_multas(anterior[1] if anterior else (), multas)
+        return False
+
+    def _cerrar_monitoreo(self):
+        """Escribe el reporte de cambios, actualiza las huellas y devuelve el resumen"""
+        archivo = ruta_exportacion(self.progreso.get('id'), "csv", prefijo="cambios_simit")
+        conteo = defaultdict(int)
+        with open(archivo, "w", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(COLUMNAS_CAMBIOS)
+            for idx in sorted(self.cambios_por_indice):
+                placa = self.resultados[idx][0]
+                cambios = self.cambios_por_indice[idx]
+                escritor.writerows(filas_cambios(placa, cambios))
+                for cambio, _, _ in cambios:
+                    conteo[cambio] += 1
+        
+        self.monitoreo.guardar(self.resultados)
+        resumen = {
+            'sin_cambios': len(self.sin_cambios),
+            'placas_nuevas': sum(
+                1 for idx in self.cambios_por_indice
+                if normalizar_placa(self.resultados[idx][0]) not in self.huellas_previas
+            ),
+            'placas_con_cambios': sum(1 for cambios in self.cambios_por_indice.values() if cambios),
+            'multas_nuevas': conteo['nueva'],
+            'multas_pagadas': conteo['pagada'],
+            'multas_cambiadas': conteo['cambiada'],
+            'archivo': archivo,
+        }
+        print(f"🔎 Monitoreo: {resumen}")
+        return resumen
+
+    def debe_capturar(self, tiene_multas):
+        if self.politica_captura == 'ninguna':
+            return False
+        if self.politica_captura == 'con_multas':
+            return tiene_multas
+        return True
+
+    def resumen_tiempos(self):
+        """Resumen de tiempos del trabajo: etapas por placa, Excel, placas/min y errores"""
+        duracion = time.time() - self.inicio if self.inicio else 0
+        resumen = {
+            'etapas': resumir_tiempos(list(self.tiempos_por_placa.values())),
+            'excel_segundos': self.segundos_excel,
+            'duracion_segundos': round(duracion, 1),
+            'placas_por_minuto': round(self._procesadas / duracion * 60, 2) if duracion else None,
+            'errores': sum(1 for r in self.resultados if r[2] == "Error"),
+        }
+        print(f"⏱️ Resumen del trabajo: {resumen}")
+        return resumen
+
+    def resumen_red(self):
+        """Promedios por placa de bytes descargados y segundos hasta el resultado (solo navegador)"""
+        medidas = [t for t in self.tiempos_por_placa.values() if 'resultado' in t]
+        if not medidas:
+            return {}
+        con_bytes = [t['bytes'] for t in medidas if 'bytes' in t]
+        resumen = {
+            'perfil_ligero': PERFIL_LIGERO,
+            'placas_medidas': len(medidas),
+            'segundos_resultado_promedio': round(sum(t['resultado'] for t in medidas) / len(medidas), 3),
+            'bytes_promedio': round(sum(con_bytes) / len(con_bytes)) if con_bytes else None,
+        }
+        print(f"📶 Red: {resumen}")
+        return resumen
+
+    def _esperar_evidencias(self):
+        """Bloquea hasta que todas las capturas pendientes (y sus filas del reporte) estén escritas"""
+        with self._lock:
+            pendientes = list(self._evidencias.values())
+            filas = list(self._filas_diferidas)
+        wait(pendientes)
+        for escrita in filas:
+            escrita.wait()
+
+    def crear_driver(self, worker_id=0):
+        """Abre un Chrome con perfil propio y lo deja en la página de SIMIT"""
+        perfil_dir = tempfile.mkdtemp(prefix=f"simit_chrome_{worker_id}_")
+        try:
+            # Railway maneja Chrome automáticamente
+            service = Service()  # Sin especificar ruta de chromedriver
+            options = configurar_chrome_para_railway(perfil_dir)
+            
+            driver = webdriver.Chrome(service=service, options=options)
+            
+            # Solo maximizar si no es headless
+            if platform.system() != "Linux":
+                driver.maximize_window()
+            
+            if PERFIL_LIGERO:
+                try:
+                    aplicar_perfil_ligero(driver)
+                except Exception as e:
+                    print(f"⚠️ No se pudo aplicar el perfil ligero: {e}")
+            
+            # La espera asíncrona de la consulta observada vence después que la de la propia página
+            driver.set_script_timeout(TIEMPOS_ESPERA['resultado'] + 5)
+            driver.get(URL_SIMIT)
+            self.esperar_carga_simple(driver)
+            return driver, perfil_dir
+        except Exception:
+            shutil.rmtree(perfil_dir, ignore_errors=True)
+            raise
+
+    def cerrar_driver(self, driver, perfil_dir):
+        try:
+            if driver:
+                driver.quit()
+        except:
+            pass
+        shutil.rmtree(perfil_dir, ignore_errors=True)
+
+    def procesar_placa(self, driver, placa, total, primera=False):
+        """Consulta una placa en un navegador ya abierto y devuelve la tupla de resultado"""
+        cronometro = CronometroEtapas()
+        try:
+            bytes_inicio, observada = self.enviar_consulta(driver, placa, cronometro, primera)
+            estado, datos_tabla = self.esperar_consulta(driver, observada)
+            return self.cosechar_consulta(driver, placa, total, cronometro, estado, bytes_inicio, datos_tabla)
+        except Exception as e:
+            return (placa, "Error", "Error", "Sin captura", describir_fallo(e), ())
+        finally:
+            self._anotar_tiempos(placa, cronometro.tiempos)
+
+    def enviar_consulta(self, driver, placa, cronometro, primera=False):
+        """Cierra el popup, escribe la placa y la envía sin esperar la respuesta.
+        
+        Devuelve (bytes descargados hasta ese momento, si la consulta quedó observada en la página).
+        """
+        # Cerrar popups (solo se espera por él tras cargar la página)
+        self.cerrar_popups(driver, TIEMPOS_ESPERA['popup'] if primera else 0)
+        cronometro.fin('popup')
+
+        # Buscar placa
+        campo_placa = WebDriverWait(driver, TIEMPOS_ESPERA['campo'], poll_frequency=INTERVALO_SONDEO).until(
+            EC.element_to_be_clickable((By.ID, "txtBusqueda"))
+        )
+        observada = False
+        if BUSQUEDA_EN_PAGINA:
+            try:
+                inicio = driver.execute_script(
+                    OBSERVAR_CONSULTA_JS, placa, int(TIEMPOS_ESPERA['resultado'] * 1000),
+                    QUIETUD_RESULTADO_MS, DISPARO_EN_PAGINA
+                ) or {}
+                bytes_inicio, observada = inicio.get('bytes'), True
+                if DISPARO_EN_PAGINA and inicio.get('ok'):
+                    cronometro.fin('ingreso')
+                    return bytes_inicio, observada
+            except Exception as e:
+                print(f"⚠️ No se pudo observar la consulta de {placa} en la página: {e}")
+        if not observada:
+            bytes_inicio = driver.execute_script(MARCAR_RESULTADOS_PREVIOS_JS + BYTES_DESCARGADOS_JS)
+        
+        campo_placa.clear()
+        campo_placa.send_keys(placa)
+        campo_placa.send_keys("\n")
+        cronometro.fin('ingreso')
+        return bytes_inicio, observada
+
+    def esperar_consulta(self, driver, observada):
+        """Espera el estado terminal de la consulta; devuelve (estado, datos de la tabla o None).
+        
+        Con la consulta observada basta un viaje al navegador, que vuelve cuando el
+        MutationObserver de la página la da por terminada; si no, se sondea como siempre.
+        """
+        if observada:
+            try:
+                fin = driver.execute_async_script(ESPERAR_CONSULTA_JS) or {}
+                if fin.get('estado'):
+                    return fin['estado'], fin.get('datos')
+            except TimeoutException:
+                return 'timeout', None
+            except Exception as e:
+                print(f"⚠️ Se perdió la consulta observada, se sondea la página: {e}")
+        return self.esperar_resultado(driver), None
+
+    def cosechar_consulta(self, driver, placa, total, cronometro, estado, bytes_inicio, datos_tabla=None):
+        """Con la consulta ya en estado terminal: detecta, extrae y captura; devuelve la tupla de resultado.
+        
+        `datos_tabla` es la tabla que ya leyó el observador de la página (si no, se lee aquí).
+        """
+        tiempos = cronometro.tiempos
+        cronometro.fin('resultado')
+        tiempos['estado_espera'] = estado
+        try:
+            tiempos['bytes'] = driver.execute_script(BYTES_DESCARGADOS_JS) - (bytes_inicio or 0)
+        except Exception:
+            pass
+        if estado == 'error':
+            raise Exception("SIMIT respondió con un error")
+        if estado == 'timeout':
+            # Sin estado terminal no se sabe qué hay en pantalla: nunca se da por "sin multas"
+            raise TiempoAgotadoSimit(f"Timeout: SIMIT no respondió en {TIEMPOS_ESPERA['resultado']:.0f} s")
+        
+        # Detectar multas CORREGIDO (una sola lectura de la tabla para detectar y extraer)
+        if datos_tabla is None:
+            datos_tabla = self.leer_tabla_multas(driver)
+        tiene_multas, num_multas = self.detectar_multas_mejorada(driver, placa, datos_tabla)
+        cronometro.fin('deteccion')
+        
+        # Extraer detalles si hay multas
+        detalle_multas = ""
+        multas = ()
+        if tiene_multas:
+            self.actualizar_progreso(f"Extrayendo detalles de {placa}...", placa, total, self._procesadas)
+            detalle_multas = self.extraer_detalles_multas(driver, placa, datos_tabla)
+            multas = multas_desde_filas(datos_tabla.get('filas') or [], placa)
+        cronometro.fin('extraccion')
+        
+        # Tomar captura (según la política configurada; nunca si en monitoreo nada cambió)
+        screenshot_path = "Sin captura"
+        if self.debe_capturar(tiene_multas) and not self.igual_a_anterior(placa, "Sí" if tiene_multas else "No", multas):
+            screenshot_path = self.tomar_captura_simple(placa, driver)
+        cronometro.fin('captura')
+        
+        estado_multas = "Sí" if tiene_multas else "No"
+        return (placa, estado_multas, "Éxito", screenshot_path, detalle_multas, multas)
+
+    def _anotar_tiempos(self, placa, tiempos):
+        self.tiempos_por_placa[placa] = tiempos
+        metricas.observar_placa(tiempos)
+        print(f"⏱️ {placa}: {tiempos}")
+
+    def _registrar_procesada(self, idx, resultado, total, motor='selenium'):
+        placa, estado_multas, resultado_consulta = resultado[0], resultado[1], resultado[2]
+        desde_cache = idx in self.cache_por_indice
+        if self.cache and not desde_cache and idx not in self.restaurados:
+            try:
+                self.cache.guardar(resultado)
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar {placa} en caché: {e}")
+        
+        with self._lock:
+            if idx in self._registradas:
+                return
+            self._registradas.add(idx)
+            self._anotar_terminada(idx, resultado)
+            sin_cambios = self._comparar_con_anterior(idx, resultado)
+            self._procesadas += 1
+            if idx in self.restaurados:
+                mensaje = f"Recuperada: {placa} ({estado_multas} multas)"
+            elif desde_cache:
+                mensaje = f"Desde caché: {placa} ({estado_multas} multas)"
+            elif resultado_consulta == "Error":
+                mensaje = f"Error en {placa}"
+            else:
+                mensaje = f"Completada: {placa} ({estado_multas} multas)"
+            self.actualizar_progreso(mensaje, placa, total, self._procesadas)
+            self.eventos.publicar('placa_terminada', {
+                'indice': idx,
+                'placa': placa,
+                'estado_multas': estado_multas,
+                'resultado': resultado_consulta,
+                'desde_cache': desde_cache,
+                'sin_cambios': sin_cambios,
+                'procesadas': self._procesadas,
+                'total': total,
+                'porcentaje': self.progreso['porcentaje']
+            })
+        
+        if idx in self.restaurados:
+            origen_metrica = 'bitacora'
+        elif desde_cache:
+            origen_metrica = 'cache'
+        else:
+            origen_metrica = motor
+        metricas.placa_terminada('error' if resultado_consulta == "Error" else 'exito', origen_metrica)
+        if resultado_consulta == "Error":
+            metricas.incrementar('simit_errores_total', tipo=clasificar_error(resultado[4]))
+        
+        if self.bitacora and idx not in self.restaurados:
+            try:
+                self.bitacora.guardar_resultado(self.progreso.get('id'), idx, resultado, self.cache_por_indice.get(idx))
+            except Exception as e:
+                print(f"⚠️ No se pudo guardar {placa} en la bitácora: {e}")
+        
+        if sin_cambios:
+            # En monitoreo las placas iguales a la corrida anterior no llevan fila
+            if self.reporte:
+                self.reporte.omitir(idx)
+            return
+        
+        if self.exportacion:
+            self.exportacion.agregar(idx, resultado, self._origen(idx))
+        
+        if self.reporte:
+            origen = self._origen(idx)
+            pendiente = self._evidencias.get(resultado[3])
+            if pendiente:
+                # La fila se escribe cuando la evidencia ya está en disco
+                escrita = threading.Event()
+                
+                def agregar_fila(_):
+                    try:
+                        self.reporte.agregar(idx, resultado, origen)
+                    finally:
+                        escrita.set()
+                
+                with self._lock:
+                    self._filas_diferidas.append(escrita)
+                pendiente.add_done_callback(agregar_fila)
+            else:
+                self.reporte.agregar(idx, resultado, origen)
+
+    def _anotar_terminada(self, idx, resultado):
+        """Guarda el resultado para /resultados y actualiza los contadores del progreso (con el candado)"""
+        self.terminadas[idx] = resultado
+        self.orden_terminadas.append(idx)
+        if resultado[1] == "Sí":
+            self.progreso['con_multas'] += 1
+        if resultado[2] == "Error":
+            self.progreso['errores'] += 1
+
+    def resultados_desde(self, cursor):
+        """[(indice, resultado, origen)] terminados a partir de la posición `cursor` en orden de llegada"""
+        with self._lock:
+            indices = self.orden_terminadas[cursor:]
+            return [(idx, self.terminadas[idx], self._origen(idx)) for idx in indices]
+
+    def artefactos_en_uso(self):
+        """Capturas y archivos que el trabajo todavía va a leer o escribir"""
+        with self._lock:
+            rutas = set(self._evidencias)
+            rutas.update(resultado[3] for resultado in self.terminadas.values())
+        if self.reporte:
+            rutas.add(self.reporte.archivo)
+        if self.exportacion:
+            rutas.update(self.exportacion.archivos.values())
+        return rutas
+
+    def _origen(self, posicion):
+        """Texto de la columna 'Origen' del reporte para la fila en `posicion`"""
+        if posicion in self.cache_por_indice:
+            consultado = datetime.fromtimestamp(self.cache_por_indice[posicion])
+            return f"Caché ({consultado.strftime('%d/%m/%Y %H:%M')})"
+        return "SIMIT"
+
+    def turno_consulta(self):
+        """Con qué prioridad, y a nombre de quién, pide este trabajo sus fichas al limitador de tasa"""
+        return {'prioridad': self.prioridad, 'usuario': self.usuario, 'trabajo': self.progreso.get('id')}
+
+    def _esperar_circuito(self):
+        """Si SIMIT está caído, avisa en el progreso y espera a que se pueda volver a consultar"""
+        restante = circuito_simit.segundos_pausa()
+        if restante:
+            with self._lock:
+                self.progreso['mensaje'] = f"SIMIT no responde; se reintenta en {restante:.0f} s"
+            self.eventos.publicar('mensaje', {'mensaje': self.progreso['mensaje']})
+        circuito_simit.esperar()
+
+    def _consultar_con_reintentos(self, pool, sesion, placa, total):
+        """Consulta la placa reintentando los fallos transitorios; devuelve (sesion, resultado)"""
+        for intento in range(REINTENTOS_MAX + 1):
+            if intento:
+                espera = espera_reintento(intento)
+                metricas.incrementar('simit_reintentos_total', motor='selenium')
+                print(f"🔁 Reintentando {placa} ({intento}/{REINTENTOS_MAX}) en {espera:.1f} s: {resultado[4]}")
+                time.sleep(espera)
+                sesion = pool.reparar(sesion, self)
+            
+            self._esperar_circuito()
+            limitador_navegador.adquirir(**self.turno_consulta())
+            resultado = self.procesar_placa(sesion.driver, placa, total, sesion.primera)
+            sesion.primera = False
+            sesion.placas += 1
+            
+            if self._anotar_en_circuito(resultado) not in FALLOS_TRANSITORIOS:
+                break
+        return sesion, resultado
+
+    def _anotar_en_circuito(self, resultado):
+        """Informa al cortocircuito cómo le fue a SIMIT y devuelve el tipo de fallo (o None)"""
+        tipo = clasificar_error(resultado[4]) if resultado[2] == "Error" else None
+        if tipo in FALLOS_DE_SIMIT:
+            circuito_simit.fallo()
+        elif tipo != 'navegador':
+            circuito_simit.exito()  # SIMIT respondió, aunque la placa haya fallado
+        return tipo
+
+    def _guardar_resultado_worker(self, idx, resultado, resultados_por_indice, total):
+        if resultados_por_indice[idx] and resultado[2] == "Error":
+            # La captura de evidencia falló pero ya teníamos el resultado por HTTP
+            resultado = resultados_por_indice[idx]
+        resultados_por_indice[idx] = resultado
+        self._registrar_procesada(idx, resultado, total)
+
+    def _worker(self, worker_id, cola, resultados_por_indice, total):
+        """Hilo de trabajo: una sesión del pool que consume placas de la cola compartida"""
+        pool = self.pool or pool_navegadores
+        sesion = None
+        try:
+            sesion = pool.prestar(self)
+            if worker_id == 0:
+                self.driver = sesion.driver
+        except Exception as e:
+            print(f"❌ Worker {worker_id} no pudo iniciar Chrome: {e}")
+            with self._lock:
+                self._errores_inicio.append(e)
+            return
+        
+        try:
+            while True:
+                try:
+                    idx, placa = cola.get_nowait()
+                except queue.Empty:
+                    break
+                
+                with self._lock:
+                    self.actualizar_progreso(f"Procesando: {placa}", placa, total, self._procesadas)
+                self.eventos.publicar('placa_iniciada', {'indice': idx, 'placa': placa})
+                
+                try:
+                    sesion, resultado = self._consultar_con_reintentos(pool, sesion, placa, total)
+                except Exception as e:
+                    print(f"❌ Worker {worker_id} perdió su Chrome: {e}")
+                    resultado = (placa, "Error", "Error", "Sin captura", describir_fallo(e), ())
+                    sesion = None
+                self._guardar_resultado_worker(idx, resultado, resultados_por_indice, total)
+                if sesion is None:
+                    break
+                
+                try:
+                    sesion = pool.renovar_si_hace_falta(sesion, self)
+                except Exception as e:
+                    print(f"❌ Worker {worker_id} no pudo reciclar Chrome: {e}")
+                    sesion = None
+                    break
+                
+                time.sleep(PAUSA_ENTRE_PLACAS)
+        finally:
+            pool.devolver(sesion)
+
+    def _preparar_pestanas(self, sesion, cantidad):
+        """Abre (o reutiliza) `cantidad` pestañas del buscador en el Chrome de la sesión"""
+        driver = sesion.driver
+        if not sesion.pestanas:
+            sesion.pestanas = [PestanaConsulta(driver.current_window_handle, sesion.primera)]
+        while len(sesion.pestanas) < cantidad:
+            driver.switch_to.new_window('tab')
+            if PERFIL_LIGERO:
+                try:
+                    aplicar_perfil_ligero(driver)  # el bloqueo por CDP es por pestaña
+                except Exception as e:
+                    print(f"⚠️ No se pudo aplicar el perfil ligero: {e}")
+            driver.get(URL_SIMIT)
+            self.esperar_carga_simple(driver)
+            sesion.pestanas.append(PestanaConsulta(driver.current_window_handle))
+        return sesion.pestanas[:cantidad]
+
+    def _enviar_en_pestana(self, sesion, pestana, idx, placa, intento, total):
+        """Envía la placa en la pestaña; si el envío falla devuelve la tupla de error, si no None"""
+        with self._lock:
+            self.actualizar_progreso(f"Procesando: {placa}", placa, total, self._procesadas)
+        if not intento:
+            self.eventos.publicar('placa_iniciada', {'indice': idx, 'placa': placa})
+        self._esperar_circuito()
+        limitador_navegador.adquirir(**self.turno_consulta())
+        pestana.iniciar(idx, placa, intento)
+        try:
+            sesion.driver.switch_to.window(pestana.handle)
+            pestana.bytes_inicio, pestana.observada = self.enviar_consulta(
+                sesion.driver, placa, pestana.cronometro, pestana.primera
+            )
+            pestana.primera = False
+            return None
+        except Exception as e:
+            self._anotar_tiempos(placa, pestana.cronometro.tiempos)
+            return (placa, "Error", "Error", "Sin captura", describir_fallo(e), ())
+
+    def _revisar_pestana(self, sesion, pestana, total):
+        """Tupla de resultado si la consulta de la pestaña ya terminó (o venció); None si sigue en curso"""
+        driver = sesion.driver
+        try:
+            driver.switch_to.window(pestana.handle)
+            estado, datos_tabla = None, None
+            if pestana.observada:
+                fin = driver.execute_script(RESULTADO_CONSULTA_JS)
+                if fin is None:
+                    pestana.observada = False  # la pestaña se recargó: se sigue sondeando
+                elif fin:
+                    estado, datos_tabla = fin.get('estado'), fin.get('datos')
+            if not pestana.observada:
+                estado = self.revisar_resultado(driver, pestana.visto)
+            if not estado:
+                if time.monotonic() < pestana.limite:
+                    return None
+                estado = 'timeout'
+            resultado = self.cosechar_consulta(driver, pestana.placa, total, pestana.cronometro,
+                                               estado, pestana.bytes_inicio, datos_tabla)
+        except Exception as e:
+            resultado = (pestana.placa, "Error", "Error", "Sin captura", describir_fallo(e), ())
+        self._anotar_tiempos(pestana.placa, pestana.cronometro.tiempos)
+        return resultado
+
+    def _worker_pestanas(self, worker_id, cola, resultados_por_indice, total):
+        """Como _worker, pero solapando la espera de SIMIT en varias pestañas de un mismo Chrome.
+        
+        Cada pestaña libre envía la siguiente placa de la cola y las ocupadas se
+        revisan por turnos sin bloquear; la que termina se cosecha y toma otra placa.
+        Los fallos transitorios vuelven a la cola del worker con su espera de reintento.
+        """
+        pool = self.pool or pool_navegadores
+        try:
+            sesion = pool.prestar(self)
+            if worker_id == 0:
+                self.driver = sesion.driver
+        except Exception as e:
+            print(f"❌ Worker {worker_id} no pudo iniciar Chrome: {e}")
+            with self._lock:
+                self._errores_inicio.append(e)
+            return
+        
+        reintentos = []  # (momento, idx, placa, intento) que esperan su turno de reintento
+        
+        def siguiente_placa():
+            ahora = time.monotonic()
+            for i, (momento, idx, placa, intento) in enumerate(reintentos):
+                if momento <= ahora:
+                    del reintentos[i]
+                    return idx, placa, intento
+            try:
+                idx, placa = cola.get_nowait()
+                return idx, placa, 0
+            except queue.Empty:
+                return None
+        
+        def terminar(pestana, resultado):
+            """Registra el resultado o, si el fallo es transitorio, agenda el reintento"""
+            idx, placa, intento = pestana.idx, pestana.placa, pestana.intento
+            pestana.liberar()
+            sesion.placas += 1
+            tipo = self._anotar_en_circuito(resultado)
+            if tipo in FALLOS_TRANSITORIOS and intento < REINTENTOS_MAX:
+                espera = espera_reintento(intento + 1)
+                metricas.incrementar('simit_reintentos_total', motor='selenium')
+                print(f"🔁 Reintentando {placa} ({intento + 1}/{REINTENTOS_MAX}) en {espera:.1f} s: {resultado[4]}")
+                reintentos.append((time.monotonic() + espera, idx, placa, intento + 1))
+            else:
+                self._guardar_resultado_worker(idx, resultado, resultados_por_indice, total)
+            return tipo
+        
+        pestanas = []
+        try:
+            pestanas = self._preparar_pestanas(sesion, PESTANAS_POR_NAVEGADOR)
+            while True:
+                # Enviar la siguiente placa en cada pestaña libre (salvo si el Chrome ya debe reciclarse)
+                reciclar = pool.necesita_reciclaje(sesion)
+                for pestana in pestanas:
+                    if reciclar or not pestana.libre():
+                        continue
+                    siguiente = siguiente_placa()
+                    if siguiente is None:
+                        break
+                    fallo = self._enviar_en_pestana(sesion, pestana, *siguiente, total)
+                    if fallo:
+                        terminar(pestana, fallo)
+                
+                ocupadas = [pestana for pestana in pestanas if not pestana.libre()]
+                if not ocupadas:
+                    if reciclar:
+                        sesion = pool.renovar_si_hace_falta(sesion, self)
+                        pestanas = self._preparar_pestanas(sesion, PESTANAS_POR_NAVEGADOR)
+                        continue
+                    if not reintentos:
+                        break
+                    time.sleep(max(0.0, min(momento for momento, _, _, _ in reintentos) - time.monotonic()))
+                    continue
+                
+                # Cosechar por turnos las pestañas cuya consulta ya terminó
+                cosechadas = 0
+                navegador_caido = False
+                for pestana in ocupadas:
+                    resultado = self._revisar_pestana(sesion, pestana, total)
+                    if resultado is None:
+                        continue
+                    cosechadas += 1
+                    navegador_caido |= terminar(pestana, resultado) == 'navegador'
+                
+                if navegador_caido:
+                    nueva = pool.reparar(sesion, self)
+                    if nueva is not sesion:
+                        # Las pestañas del Chrome anterior se perdieron con sus placas en vuelo
+                        for pestana in pestanas:
+                            if not pestana.libre():
+                                reintentos.append((time.monotonic(), pestana.idx, pestana.placa, pestana.intento))
+                                pestana.liberar()
+                        sesion = nueva
+                        pestanas = self._preparar_pestanas(sesion, PESTANAS_POR_NAVEGADOR)
+                elif not cosechadas:
+                    time.sleep(INTERVALO_SONDEO)
+        except Exception as e:
+            print(f"❌ Worker {worker_id} perdió su Chrome: {e}")
+            perdidas = [(p.idx, p.placa) for p in pestanas if not p.libre()]
+            perdidas += [(idx, placa) for _, idx, placa, _ in reintentos]
+            for idx, placa in perdidas:
+                self._guardar_resultado_worker(
+                    idx, (placa, "Error", "Error", "Sin captura", describir_fallo(e), ()), resultados_por_indice, total
+                )
+            sesion = None
+        finally:
+            if sesion and sesion.pestanas:
+                try:
+                    sesion.driver.switch_to.window(sesion.pestanas[0].handle)
+                except Exception:
+                    pass
+            pool.devolver(sesion)
+
+    def _falta_evidencia(self, resultado):
+        """Con SIMIT_HTTP_CAPTURAS, si la placa resuelta por HTTP todavía necesita su captura"""
+        return (HTTP_CAPTURAS and resultado[1] == "Sí"
+                and not self.igual_a_anterior(resultado[0], resultado[1], multas_de(resultado)))
+
+    def _consultar_por_http(self, pendientes, resultados_por_indice, total):
+        """Resuelve lo que se pueda por HTTP y devuelve las placas que necesitan navegador"""
+        self.actualizar_progreso("Consultando SIMIT por HTTP...", total=total, procesadas=self._procesadas)
+        self.eventos.publicar('mensaje', {'mensaje': self.progreso['mensaje']})
+        consulta = ConsultaSimitHTTP(turno=self.turno_consulta())
+        
+        def al_terminar(posicion, resultado):
+            placa = pendientes[posicion][1]
+            if placa in consulta.tiempos:
+                self.tiempos_por_placa[placa] = {'http': consulta.tiempos[placa]}
+                metricas.observar('http', consulta.tiempos[placa])
+            if resultado and not self._falta_evidencia(resultado):
+                self._registrar_procesada(pendientes[posicion][0], resultado, total, motor='http')
+        
         try:
-            if not os.path.exists("capturas"):
-                os.makedirs("capturas")
-            
-            screenshot_path = f"capturas/{placa}_{datetime.now().strftime('%H%M%S')}.png"
-            
-            driver.execute_script("window.scrollTo(0, 0);")
-            time.sleep(1)
-            
-            driver.save_screenshot(screenshot_path)
+            resultados = consulta.consultar_placas([placa for _, placa in pendientes], al_terminar)
+        finally:
+            consulta.cerrar()
+        
+        restantes = []
+        for (idx, placa), resultado in zip(pendientes, resultados):
+            if resultado is None:
+                restantes.append((idx, placa))
+                continue
+            if self._falta_evidencia(resultado):
+                # El navegador solo se usa para dejar la evidencia de esta placa
+                restantes.append((idx, placa))
+            resultados_por_indice[idx] = resultado
+        
+        if restantes:
+            print(f"🌐 {len(restantes)} placa(s) pasan al navegador")
+        return restantes
+
+    def _servir_desde_cache(self, pendientes, resultados_por_indice, total):
+        """Completa las placas con resultado vigente en caché y devuelve las que hay que consultar"""
+        restantes = []
+        for idx, placa in pendientes:
+            try:
+                entrada = self.cache.obtener(placa)
+            except Exception as e:
+                print(f"⚠️ Error leyendo caché para {placa}: {e}")
+                entrada = None
             
-            if os.path.exists(screenshot_path):
-                return screenshot_path
-            else:
-                return "Sin captura"
-                
-        except:
-            return "Sin captura"
+            if entrada is None:
+                restantes.append((idx, placa))
+                continue
+            resultado, consultado = entrada
+            if resultado[3] != "Sin captura":
+                almacen_artefactos.tocar(resultado[3])  # la evidencia se reutiliza: cuenta como uso
+            self.cache_por_indice[idx] = consultado
+            resultados_por_indice[idx] = resultado
+            self._registrar_procesada(idx, resultado, total)
+        
+        self.progreso['cacheadas'] = len(self.cache_por_indice)
+        if self.cache_por_indice:
+            print(f"💾 {len(self.cache_por_indice)} placa(s) servidas desde caché")
+        return restantes
 
-    def buscar_placas(self, placas):
-        global progreso_actual
+    def _restaurar_previos(self, pendientes, previos, resultados_por_indice, total):
+        """Reutiliza las placas que ya estaban en la bitácora y devuelve las que faltan"""
+        por_restaurar = {idx for idx, placa in pendientes}
+        # En el orden en que terminaron, igual que el cursor de /resultados leído de la bitácora
+        for idx, (resultado, consultado_cache) in previos.items():
+            if idx not in por_restaurar:
+                continue
+            if consultado_cache:
+                self.cache_por_indice[idx] = consultado_cache
+            self.restaurados.add(idx)
+            resultados_por_indice[idx] = resultado
+            self._registrar_procesada(idx, resultado, total)
+        restantes = [(idx, placa) for idx, placa in pendientes if idx not in self.restaurados]
         
+        print(f"♻️ Reanudando: {len(self.restaurados)} placa(s) recuperadas, {len(restantes)} pendientes")
+        return restantes
+
+    def buscar_placas(self, placas, previos=None):
+        """Consulta las placas; `previos` ({indice: (resultado, consultado_cache)}) se reutiliza al reanudar"""
+        self.inicio = time.time()
         try:
-            progreso_actual['estado'] = 'processing'
-            self.actualizar_progreso("Iniciando proceso...", total=len(placas), procesadas=0)
+            self.progreso['estado'] = 'processing'
+            total = len(placas)
+            self.actualizar_progreso("Iniciando proceso...", total=total, procesadas=0)
+            self.eventos.publicar('estado', {'estado': 'processing', 'mensaje': self.progreso['mensaje'], 'total': total})
             
-            # Railway maneja Chrome automáticamente
-            service = Service()  # Sin especificar ruta de chromedriver
-            options = configurar_chrome_para_railway()
+            resultados_por_indice = [None] * total
+            pendientes = list(enumerate(placas))
+            if self.modo_excel == 'streaming':
+                self.reporte = ReporteExcelStreaming(ruta_reporte_excel(self.progreso.get('id')))
+            self.exportacion = ExportacionMultas(self.progreso.get('id'))
+            if self.monitoreo:
+                self.huellas_previas = self.monitoreo.cargar(placas)
+            if self.bitacora:
+                self.bitacora.marcar_estado(self.progreso.get('id'), 'processing')
             
-            self.driver = webdriver.Chrome(service=service, options=options)
+            if previos:
+                pendientes = self._restaurar_previos(pendientes, previos, resultados_por_indice, total)
             
-            # Solo maximizar si no es headless
-            if platform.system() != "Linux":
-                self.driver.maximize_window()
+            if pendientes and self.cache:
+                pendientes = self._servir_desde_cache(pendientes, resultados_por_indice, total)
             
-            self.actualizar_progreso("Navegando a SIMIT...", total=len(placas), procesadas=0)
-            self.driver.get("https://www.fcm.org.co/simit/#/home-public")
+            if pendientes and self.motor == 'http':
+                pendientes = self._consultar_por_http(pendientes, resultados_por_indice, total)
             
-            self.esperar_carga_simple(self.driver)
+            if pendientes:
+                # Cola compartida: cada navegador toma la siguiente placa libre
+                cola = queue.Queue()
+                for idx, placa in pendientes:
+                    cola.put((idx, placa))
+                num_workers = max(1, min(self.num_workers, len(pendientes)))
+                
+                self.actualizar_progreso(f"Navegando a SIMIT ({num_workers} navegador(es))...", total=total, procesadas=self._procesadas)
+                self.eventos.publicar('mensaje', {'mensaje': self.progreso['mensaje']})
+                
+                worker = self._worker_pestanas if PESTANAS_POR_NAVEGADOR > 1 else self._worker
+                hilos = [
+                    threading.Thread(target=worker, args=(worker_id, cola, resultados_por_indice, total), daemon=True)
+                    for worker_id in range(num_workers)
+                ]
+                for hilo in hilos:
+                    hilo.start()
+                for hilo in hilos:
+                    hilo.join()
+                
+                if len(self._errores_inicio) == num_workers and not any(resultados_por_indice):
+                    raise self._errores_inicio[0]
             
-            # Procesar cada placa
-            for idx, placa in enumerate(placas):
-                try:
-                    self.actualizar_progreso(f"Procesando: {placa}", placa, len(placas), idx)
-                    
-                    # Cerrar popups
-                    try:
-                        popup = WebDriverWait(self.driver, 2).until(
-                            EC.presence_of_element_located((By.CLASS_NAME, "swal2-popup"))
-                        )
-                        cerrar_btn = self.driver.find_element(By.CLASS_NAME, "swal2-confirm")
-                        cerrar_btn.click()
-                        time.sleep(1)
-                    except:
-                        pass
-
-                    # Buscar placa
-                    campo_placa = WebDriverWait(self.driver, 10).until(
-                        EC.element_to_be_clickable((By.ID, "txtBusqueda"))
-                    )
-                    
-                    campo_placa.clear()
-                    time.sleep(0.5)
-                    campo_placa.send_keys(placa)
-                    time.sleep(1)
-                    campo_placa.send_keys("\n")
-                    
-                    # Esperar resultados
-                    time.sleep(8)
-                    
-                    # Detectar multas CORREGIDO
-                    tiene_multas, num_multas = self.detectar_multas_mejorada(self.driver, placa)
-                    
-                    # Extraer detalles si hay multas
-                    detalle_multas = ""
-                    if tiene_multas:
-                        self.actualizar_progreso(f"Extrayendo detalles de {placa}...", placa, len(placas), idx)
-                        detalle_multas = self.extraer_detalles_multas(self.driver, placa)
-                    
-                    # Tomar captura
-                    screenshot_path = self.tomar_captura_simple(placa, self.driver)
-                    
-                    estado_multas = "Sí" if tiene_multas else "No"
-                    self.resultados.append((placa, estado_multas, "Éxito", screenshot_path, detalle_multas))
-                    
-                    # Actualizar progreso
-                    procesadas_actual = idx + 1
-                    self.actualizar_progreso(f"Completada: {placa} ({estado_multas} multas)", placa, len(placas), procesadas_actual)
-                    
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    procesadas_actual = idx + 1
-                    self.actualizar_progreso(f"Error en {placa}", placa, len(placas), procesadas_actual)
-                    self.resultados.append((placa, "Error", "Error", "Sin captura", str(e)))
+            # Unir resultados en el mismo orden de entrada
+            self.resultados = [
+                resultado if resultado else (placa, "Error", "Error", "Sin captura", "No procesada", ())
+                for placa, resultado in zip(placas, resultados_por_indice)
+            ]
+            for idx, resultado in enumerate(self.resultados):
+                if idx not in self._registradas:
+                    with self._lock:
+                        self._anotar_terminada(idx, resultado)
+                    self.exportacion.agregar(idx, resultado, self._origen(idx))
+                    if self.reporte:
+                        self.reporte.agregar(idx, resultado, self._origen(idx))
+            self.progreso['exportaciones'] = self.exportacion.cerrar()
+            if self.monitoreo:
+                self.progreso['cambios'] = self._cerrar_monitoreo()
+            
+            self.progreso['resumen_red'] = self.resumen_red()
             
             # Generar Excel
-            self.actualizar_progreso("Generando Excel...", total=len(placas), procesadas=len(placas))
+            self._esperar_evidencias()
+            self.actualizar_progreso("Generando Excel...", total=total, procesadas=total)
+            self.eventos.publicar('mensaje', {'mensaje': self.progreso['mensaje']})
+            inicio_excel = time.monotonic()
             archivo_excel = self.guardar_resultados_en_excel()
+            self.segundos_excel = round(time.monotonic() - inicio_excel, 3)
+            metricas.observar('excel', self.segundos_excel)
+            self.progreso['resumen_tiempos'] = self.resumen_tiempos()
             
             if archivo_excel and os.path.exists(archivo_excel):
-                progreso_actual.update({
+                self.progreso.update({
                     'estado': 'completed',
-                    'resultados': self.resultados,
                     'archivo_excel': archivo_excel,
                     'porcentaje': 100,
-                    'procesadas': len(placas),
-                    'total': len(placas),
+                    'procesadas': total,
+                    'total': total,
                     'mensaje': 'Proceso completado. Excel listo para descarga.'
                 })
+                if self.bitacora:
+                    self.bitacora.marcar_estado(self.progreso.get('id'), 'completed', archivo_excel)
+                self.eventos.publicar('reporte_listo', {'archivo': os.path.basename(archivo_excel)})
+                self.eventos.publicar('estado', {
+                    clave: self.progreso.get(clave)
+                    for clave in ('estado', 'mensaje', 'total', 'con_multas', 'errores', 'cacheadas', 'cambios')
+                })
             else:
                 raise Exception("Error generando Excel")
             
         except Exception as e:
-            progreso_actual.update({
+            self.progreso.update({
                 'estado': 'error',
                 'mensaje': f"Error: {str(e)}",
                 'porcentaje': 0
             })
+            if self.reporte:
+                self.reporte.descartar()
+            if self.exportacion:
+                self.exportacion.descartar()
+            if self.bitacora:
+                try:
+                    self.bitacora.marcar_estado(self.progreso.get('id'), 'error')
+                except Exception as e_bitacora:
+                    print(f"⚠️ No se pudo actualizar la bitácora: {e_bitacora}")
+            self.eventos.publicar('estado', {'estado': 'error', 'mensaje': self.progreso['mensaje']})
         finally:
-            try:
-                if self.driver:
-                    self.driver.quit()
-            except:
-                pass
+            self.eventos.cerrar()
 
     def guardar_resultados_en_excel(self):
+        # En modo streaming las filas ya están escritas; solo falta cerrar el archivo
+        if self.reporte:
+            return self.reporte.cerrar()
+        
         try:
-            if not os.path.exists("reportes_excel"):
-                os.makedirs("reportes_excel")
+            if not os.path.exists(CARPETA_REPORTES):
+                os.makedirs(CARPETA_REPORTES)
                 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            archivo = f"reportes_excel/reporte_simit_{timestamp}.xlsx"
+            archivo = ruta_reporte_excel(self.progreso.get('id'))
             
             wb = Workbook()
             ws1 = wb.active
@@ -386,22 +3041,23 @@ class SimitScraper:
             ws1.column_dimensions['C'].width = 15
             ws1.column_dimensions['D'].width = 35
             ws1.column_dimensions['E'].width = 50  # Para detalles
+            ws1.column_dimensions['F'].width = 20  # Origen del dato
 
             # Título principal - RESTAURADO
-            ws1.merge_cells('A1:E2')
+            ws1.merge_cells('A1:F2')
             titulo = ws1.cell(row=1, column=1, value="FORMATO DE CONTROL DE MULTAS DE TRÁNSITO")
             titulo.font = Font(name='Arial', size=16, bold=True, color="FFFFFF")
             titulo.alignment = Alignment(horizontal="center", vertical="center")
             titulo.fill = PatternFill(start_color=verde_oscuro, end_color=verde_oscuro, fill_type="solid")
 
             # Fecha del reporte - RESTAURADA
-            ws1.merge_cells('A3:E3')
+            ws1.merge_cells('A3:F3')
             fecha = ws1.cell(row=3, column=1, value=f"Reporte generado el: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
             fecha.font = Font(name='Arial', size=10, italic=True)
             fecha.alignment = Alignment(horizontal="right")
 
             # Encabezados - RESTAURADOS con columna de detalles
-            encabezados = ["Placa", "Estado Multas", "Resultado", "Evidencia", "Detalles"]
+            encabezados = ["Placa", "Estado Multas", "Resultado", "Evidencia", "Detalles", "Origen"]
             for col, encabezado in enumerate(encabezados, 1):
                 celda = ws1.cell(row=4, column=col, value=encabezado)
                 celda.font = Font(name='Arial', size=11, bold=True, color="FFFFFF")
@@ -409,7 +3065,12 @@ class SimitScraper:
                 celda.alignment = Alignment(horizontal="center", vertical="center")
 
             # Datos - MEJORADOS
-            for idx, (placa, tiene_multa, resultado, captura, detalle_multas) in enumerate(self.resultados, 5):
+            idx = 4
+            for posicion, fila_resultado in enumerate(self.resultados):
+                if posicion in self.sin_cambios:
+                    continue
+                placa, tiene_multa, resultado, captura, detalle_multas = fila_resultado[:5]
+                idx += 1
                 # Color de fila según estado - RESTAURADO
                 if tiene_multa == "Sí":
                     fill_color = rojo_claro
@@ -419,7 +3080,7 @@ class SimitScraper:
                     fill_color = verde_claro if idx % 2 == 0 else "FFFFFF"
                 
                 # Datos de la fila - INCLUYENDO DETALLES
-                datos_fila = [placa, tiene_multa, resultado, "Ver imagen adjunta", detalle_multas or "Sin detalles"]
+                datos_fila = [placa, tiene_multa, resultado, "Ver imagen adjunta", detalle_multas or "Sin detalles", self._origen(posicion)]
                 
                 for col_idx, valor in enumerate(datos_fila, 1):
                     celda = ws1.cell(row=idx, column=col_idx, value=valor)
@@ -456,60 +3117,776 @@ class SimitScraper:
             print(f"Error generando Excel: {e}")
             return None
 
+class SesionNavegador:
+    """Un Chrome abierto del pool, con lo necesario para decidir cuándo reciclarlo"""
+    
+    def __init__(self, creador, driver, perfil_dir):
+        self.creador = creador
+        self.driver = driver
+        self.perfil_dir = perfil_dir
+        self.placas = 0
+        self.primera = True  # tras cargar la página puede aparecer el popup inicial
+        self.pestanas = []  # PestanaConsulta abiertas en este Chrome (modo SIMIT_PESTANAS > 1)
+        self.creada = time.time()
+        self.memoria_inicial = self.memoria_mb()
+    
+    def memoria_mb(self):
+        try:
+            return memoria_proceso_mb(self.driver.service.process.pid)
+        except Exception:
+            return 0
+    
+    def cerrar(self):
+        self.creador.cerrar_driver(self.driver, self.perfil_dir)
+
+class PoolNavegadores:
+    """Sesiones de Chrome ya posadas en el buscador de SIMIT, compartidas entre trabajos.
+    
+    Los workers piden una sesión prestada (con chequeo de salud) y la devuelven
+    al terminar. Una sesión se recicla tras POOL_RECICLAR_PLACAS placas o si su
+    memoria creció más de POOL_RECICLAR_MB, y el pool se repone en segundo plano
+    hasta tener POOL_CALIENTES sesiones libres.
+    """
+    
+    def __init__(self, creador, minimo_caliente=POOL_CALIENTES, max_libres=POOL_MAX_LIBRES,
+                 max_placas=POOL_RECICLAR_PLACAS, max_crecimiento_mb=POOL_RECICLAR_MB):
+        self.creador = creador
+        self.minimo_caliente = min(minimo_caliente, max_libres)
+        self.max_libres = max_libres
+        self.max_placas = max_placas
+        self.max_crecimiento_mb = max_crecimiento_mb
+        self._libres = []
+        self._prestadas = set()
+        self._creando = 0
+        self._secuencia = 0
+        self._lock = threading.Lock()
+    
+    def _crear(self, creador=None):
+        with self._lock:
+            self._secuencia += 1
+            secuencia = self._secuencia
+        driver, perfil_dir = (creador or self.creador).crear_driver(secuencia)
+        return SesionNavegador(creador or self.creador, driver, perfil_dir)
+    
+    def _sana(self, sesion):
+        """Verifica que el navegador responda y siga en el buscador; si no, lo recarga"""
+        try:
+            if sesion.driver.execute_script("return !!document.getElementById('txtBusqueda')"):
+                return True
+            sesion.driver.get(URL_SIMIT)
+            sesion.creador.esperar_carga_simple(sesion.driver)
+            sesion.primera = True
+            for pestana in sesion.pestanas:
+                if pestana.handle == sesion.driver.current_window_handle:
+                    pestana.primera = True
+            return bool(sesion.driver.find_elements(By.ID, "txtBusqueda"))
+        except Exception as e:
+            print(f"⚠️ Sesión de Chrome descartada: {e}")
+            return False
+    
+    def necesita_reciclaje(self, sesion):
+        if self.max_placas and sesion.placas >= self.max_placas:
+            return True
+        if self.max_crecimiento_mb and sesion.memoria_inicial:
+            return sesion.memoria_mb() - sesion.memoria_inicial > self.max_crecimiento_mb
+        return False
+    
+    def prestar(self, creador=None):
+        """Entrega una sesión sana: una libre si la hay, o una nueva"""
+        while True:
+            with self._lock:
+                sesion = self._libres.pop() if self._libres else None
+            if sesion is None:
+                break
+            if self._sana(sesion):
+                self._reponer()
+                with self._lock:
+                    self._prestadas.add(sesion)
+                return sesion
+            sesion.cerrar()
+        sesion = self._crear(creador)
+        self._reponer()
+        with self._lock:
+            self._prestadas.add(sesion)
+        return sesion
+    
+    def devolver(self, sesion):
+        if sesion is None:
+            return
+        with self._lock:
+            self._prestadas.discard(sesion)
+        if not self.necesita_reciclaje(sesion):
+            with self._lock:
+                if len(self._libres) < self.max_libres:
+                    self._libres.append(sesion)
+                    return
+        sesion.cerrar()
+        self._reponer()
+    
+    def reparar(self, sesion, creador=None):
+        """Devuelve la misma sesión si sigue sana o la cambia por una nueva"""
+        if self._sana(sesion):
+            return sesion
+        with self._lock:
+            self._prestadas.discard(sesion)
+        sesion.cerrar()
+        return self.prestar(creador)
+    
+    def renovar_si_hace_falta(self, sesion, creador=None):
+        """Cambia la sesión por una nueva si ya le toca reciclarse"""
+        if not self.necesita_reciclaje(sesion):
+            return sesion
+        print(f"♻️ Reciclando Chrome tras {sesion.placas} placa(s) ({sesion.memoria_mb()} MB)")
+        metricas.incrementar('simit_chrome_reciclados_total')
+        with self._lock:
+            self._prestadas.discard(sesion)
+        sesion.cerrar()
+        return self.prestar(creador)
+    
+    def _reponer(self):
+        """Abre en segundo plano las sesiones que falten para el mínimo caliente"""
+        with self._lock:
+            faltan = self.minimo_caliente - len(self._libres) - self._creando
+            if faltan <= 0:
+                return
+            self._creando += faltan
+        for _ in range(faltan):
+            threading.Thread(target=self._calentar_una, daemon=True).start()
+    
+    def _calentar_una(self):
+        try:
+            sesion = self._crear()
+        except Exception as e:
+            print(f"⚠️ No se pudo precalentar Chrome: {e}")
+            sesion = None
+        with self._lock:
+            self._creando -= 1
+            if sesion and len(self._libres) < self.max_libres:
+                self._libres.append(sesion)
+                sesion = None
+        if sesion:
+            sesion.cerrar()
+    
+    def calentar(self):
+        self._reponer()
+    
+    def vaciar(self):
+        """Cierra las sesiones libres (al apagar o entre corridas de benchmark)"""
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for sesion in libres:
+            sesion.cerrar()
+    
+    def estado(self):
+        with self._lock:
+            libres = list(self._libres)
+            prestadas = list(self._prestadas)
+            creando = self._creando
+        return {
+            'libres': len(libres),
+            'prestadas': len(prestadas),
+            'creando': creando,
+            'memoria_mb': sum(sesion.memoria_mb() for sesion in libres + prestadas)
+        }
+
+class RegistroTrabajos:
+    """Cola de trabajos de consulta con concurrencia acotada.
+    
+    Cada trabajo tiene su propio diccionario de progreso. Los trabajos
+    terminados se conservan RETENCION_TRABAJOS segundos (y como máximo
+    MAX_TRABAJOS_RETENIDOS) para poder consultar su progreso y descargar su Excel.
+    
+    Los trabajos en espera no salen por orden de llegada: primero los
+    interactivos y, dentro de cada clase, los del usuario con menos trabajos
+    en marcha (y, a igualdad, el que hace más tiempo no empieza uno). Además
+    de los max_simultaneos hilos generales hay max_interactivos reservados a
+    trabajos interactivos, para que una consulta puntual no espere a que
+    termine un lote de miles de placas.
+    """
+    
+    def __init__(self, max_simultaneos=MAX_TRABAJOS_SIMULTANEOS, retencion=RETENCION_TRABAJOS,
+                 max_retenidos=MAX_TRABAJOS_RETENIDOS, bitacora=None, solo_encolar=False,
+                 max_interactivos=MAX_TRABAJOS_INTERACTIVOS):
+        self.bitacora = bitacora
+        self.solo_encolar = solo_encolar and bitacora is not None  # la web no ejecuta: lo hacen los workers
+        self.max_simultaneos = max(1, max_simultaneos)
+        self.max_interactivos = max(0, max_interactivos)
+        self.retencion = retencion
+        self.max_retenidos = max_retenidos
+        self._trabajos = {}  # id -> SimitScraper (en orden de creación)
+        self._lock = threading.Lock()
+        self._hay_espera = threading.Condition(self._lock)
+        self._espera = []  # (scraper, placas, previos, llegada) que aún no empiezan
+        self._llegadas = 0
+        self._en_marcha = defaultdict(int)  # usuario (o id del trabajo) -> trabajos corriendo
+        self._ultimo_inicio = {}  # usuario -> llegada del último trabajo suyo que empezó
+        self._hilos = []
+        self._publicados = {}  # id -> última foto del progreso escrita en la bitácora
+        self._sincronizador = None
+        self.ultimo_id = None
+    
+    def _asegurar_hilos(self):
+        while len(self._hilos) < self.max_simultaneos + self.max_interactivos:
+            clase = None if len(self._hilos) < self.max_simultaneos else 'interactiva'
+            hilo = threading.Thread(target=self._consumir, args=(clase,), daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+    
+    @staticmethod
+    def _usuario(scraper):
+        return scraper.usuario or scraper.progreso.get('id')
+    
+    def _siguiente(self, clase=None):
+        """Saca de la espera el próximo trabajo para un hilo (de cualquier clase o solo de `clase`)"""
+        with self._hay_espera:
+            while True:
+                candidatos = [e for e in self._espera if clase is None or e[0].prioridad == clase]
+                if candidatos:
+                    break
+                self._hay_espera.wait()
+            elegido = min(candidatos, key=lambda e: (
+                rango_prioridad(e[0].prioridad),
+                self._en_marcha.get(self._usuario(e[0]), 0),
+                self._ultimo_inicio.get(self._usuario(e[0]), 0),
+                e[3],
+            ))
+            self._espera.remove(elegido)
+            usuario = self._usuario(elegido[0])
+            self._en_marcha[usuario] += 1
+            self._ultimo_inicio[usuario] = self._llegadas
+            return elegido[:3]
+    
+    def _consumir(self, clase=None):
+        while True:
+            scraper, placas, previos = self._siguiente(clase)
+            try:
+                scraper.buscar_placas(placas, previos)
+            except Exception as e:
+                scraper.progreso.update({'estado': 'error', 'mensaje': f"Error: {str(e)}", 'porcentaje': 0})
+                scraper.eventos.cerrar()
+            finally:
+                scraper.progreso['terminado'] = time.time()
+                with self._lock:
+                    usuario = self._usuario(scraper)
+                    self._en_marcha[usuario] -= 1
+                    if not self._en_marcha[usuario]:
+                        del self._en_marcha[usuario]
+                        if not any(self._usuario(e[0]) == usuario for e in self._espera):
+                            self._ultimo_inicio.pop(usuario, None)  # sin nada en marcha ni en espera
+                self.publicar_progresos()  # el estado final, sin esperar al próximo ciclo
+    
+    def en_espera(self):
+        """Trabajos de este proceso que aún no empiezan, por clase de prioridad"""
+        with self._lock:
+            cuenta = {prioridad: 0 for prioridad in PRIORIDADES}
+            for scraper, _, _, _ in self._espera:
+                cuenta[scraper.prioridad] += 1
+            return cuenta
+    
+    def crear(self, placas, trabajo_id=None, previos=None, creado=None, progreso_inicial=None, **opciones):
+        """Encola un trabajo (nuevo, o uno ya registrado si se da su id) y devuelve (id, scraper).
+        
+        Con solo_encolar el trabajo nuevo queda en la bitácora sin dueño y el
+        scraper devuelto no se ejecuta: lo toma un proceso de worker_simit.py.
+        """
+        registrado = trabajo_id is not None
+        trabajo_id = trabajo_id or uuid.uuid4().hex[:12]
+        creado = creado or time.time()
+        opciones['prioridad'] = prioridad_de_trabajo(opciones.get('prioridad'), len(placas))
+        progreso = nuevo_progreso(len(placas), 'queued', 'En cola (reanudado)...' if previos else 'En cola...')
+        progreso.update(progreso_inicial or {})
+        progreso.update({'id': trabajo_id, 'creado': creado, 'prioridad': opciones['prioridad']})
+        scraper = SimitScraper(progreso=progreso, bitacora=self.bitacora, **opciones)
+        
+        if self.solo_encolar and not registrado:
+            self.bitacora.registrar_trabajo(trabajo_id, placas, opciones, creado, pid=0)
+            self.bitacora.guardar_progresos({trabajo_id: progreso})
+            return trabajo_id, scraper
+        if self.bitacora and not registrado:
+            self.bitacora.registrar_trabajo(trabajo_id, placas, opciones, creado)
+        
+        with self._hay_espera:
+            self._purgar()
+            self._trabajos[trabajo_id] = scraper
+            self.ultimo_id = trabajo_id
+            self._asegurar_hilos()
+            self._llegadas += 1
+            self._espera.append((scraper, placas, previos, self._llegadas))
+            self._hay_espera.notify_all()
+        return trabajo_id, scraper
+    
+    def reanudar_interrumpidos(self):
+        """Vuelve a encolar los trabajos que quedaron a medias por un reinicio o una caída"""
+        if not self.bitacora:
+            return []
+        self.bitacora.purgar()
+        reanudados = []
+        for trabajo_id in self.bitacora.reclamar_interrumpidos():
+            trabajo = self.bitacora.obtener_trabajo(trabajo_id)
+            previos = self.bitacora.resultados(trabajo_id)
+            self.crear(trabajo['placas'], trabajo_id=trabajo_id, previos=previos,
+                       creado=trabajo['creado'], **trabajo['opciones'])
+            reanudados.append(trabajo_id)
+        if reanudados:
+            print(f"♻️ {len(reanudados)} trabajo(s) interrumpido(s) reanudado(s)")
+        return reanudados
+    
+    def atender_cola(self, intervalo=INTERVALO_COLA):
+        """Bucle principal de un proceso worker: toma trabajos sin dueño de la bitácora
+        mientras tenga capacidad y los ejecuta aquí (no retorna)"""
+        print(f"🛠️ Worker {os.getpid()} atendiendo la cola ({self.max_simultaneos} trabajo(s) a la vez "
+              f"y {self.max_interactivos} interactivo(s) más)")
+        while True:
+            with self._lock:
+                self._purgar()
+                activos = sum(1 for scraper in self._trabajos.values() if not scraper.progreso.get('terminado'))
+            trabajo_id = None
+            if activos < self.max_simultaneos:
+                trabajo_id = self.bitacora.tomar_pendiente()
+            elif activos < self.max_simultaneos + self.max_interactivos:
+                trabajo_id = self.bitacora.tomar_pendiente(solo_interactivos=True)
+            if not trabajo_id:
+                time.sleep(intervalo)
+                continue
+            trabajo = self.bitacora.obtener_trabajo(trabajo_id)
+            encolado = self.bitacora.progreso(trabajo_id) or {}
+            print(f"📦 Trabajo {trabajo_id} tomado de la cola ({len(trabajo['placas'])} placa(s))")
+            self.crear(trabajo['placas'], trabajo_id=trabajo_id, creado=trabajo['creado'],
+                       progreso_inicial={'carga': encolado['carga']} if 'carga' in encolado else None,
+                       **trabajo['opciones'])
+    
+    def obtener_scraper(self, trabajo_id=None):
+        """Scraper del trabajo (o del último creado si no se indica id)"""
+        with self._lock:
+            self._purgar()
+            return self._trabajos.get(trabajo_id or self.ultimo_id)
+    
+    def progresos(self):
+        with self._lock:
+            return [scraper.progreso for scraper in self._trabajos.values()]
+    
+    def artefactos_en_uso(self):
+        """Archivos de los trabajos que no han terminado (la limpieza de disco no los borra)"""
+        with self._lock:
+            activos = [scraper for scraper in self._trabajos.values() if not scraper.progreso.get('terminado')]
+        rutas = set()
+        for scraper in activos:
+            rutas.update(scraper.artefactos_en_uso())
+        return rutas
+    
+    def obtener(self, trabajo_id=None):
+        """Progreso del trabajo (o del último creado si no se indica id).
+        
+        Si el trabajo corre en otro proceso (u otro worker de gunicorn), se
+        devuelve la última foto que ese proceso publicó en la bitácora.
+        """
+        scraper = self.obtener_scraper(trabajo_id) if trabajo_id or not self.bitacora else None
+        if scraper:
+            return scraper.progreso
+        if self.bitacora:
+            return self.bitacora.progreso(trabajo_id)
+        return None
+    
+    def publicar_progresos(self):
+        """Escribe en la bitácora el progreso de los trabajos locales que cambió desde la última vez"""
+        if not self.bitacora:
+            return
+        with self._lock:
+            locales = list(self._trabajos.items())
+        cambiados = {}
+        for trabajo_id, scraper in locales:
+            progreso = dict(scraper.progreso)
+            if progreso != self._publicados.get(trabajo_id):
+                cambiados[trabajo_id] = progreso
+        if not cambiados:
+            return
+        self.bitacora.guardar_progresos(cambiados)
+        with self._lock:
+            self._publicados.update(cambiados)
+            for trabajo_id in set(self._publicados) - set(self._trabajos):
+                del self._publicados[trabajo_id]
+    
+    def iniciar_sincronizacion(self, intervalo=INTERVALO_PROGRESO_COMPARTIDO, reclamo=INTERVALO_RECLAMO,
+                               latido=INTERVALO_LATIDO):
+        """Hilo que publica el progreso local, marca el latido de los trabajos de este
+        proceso y, cada `reclamo` segundos, adopta los de procesos que murieron
+        (p. ej. un worker reciclado por gunicorn o un contenedor reiniciado)"""
+        if not self.bitacora or self._sincronizador:
+            return
+        def sincronizar():
+            proximo_reclamo = time.monotonic() + reclamo
+            proximo_latido = time.monotonic()
+            while True:
+                time.sleep(intervalo)
+                try:
+                    self.publicar_progresos()
+                    if time.monotonic() >= proximo_latido:
+                        proximo_latido = time.monotonic() + latido
+                        self.bitacora.latir()
+                    if REANUDAR_TRABAJOS and reclamo > 0 and time.monotonic() >= proximo_reclamo:
+                        proximo_reclamo = time.monotonic() + reclamo
+                        self.reanudar_interrumpidos()
+                except Exception as e:
+                    print(f"⚠️ Error sincronizando trabajos: {e}")
+        self._sincronizador = threading.Thread(target=sincronizar, daemon=True, name="sincronizacion_trabajos")
+        self._sincronizador.start()
+    
+    def _purgar(self):
+        ahora = time.time()
+        terminados = [
+            trabajo_id for trabajo_id, scraper in self._trabajos.items()
+            if scraper.progreso.get('terminado')
+        ]
+        vencidos = [
+            trabajo_id for trabajo_id in terminados
+            if ahora - self._trabajos[trabajo_id].progreso['terminado'] > self.retencion
+        ]
+        # Además del vencimiento, no conservar más de max_retenidos terminados
+        exceso = len(terminados) - len(vencidos) - self.max_retenidos
+        if exceso > 0:
+            vigentes = [trabajo_id for trabajo_id in terminados if trabajo_id not in vencidos]
+            vencidos += sorted(vigentes, key=lambda t: self._trabajos[t].progreso['terminado'])[:exceso]
+        for trabajo_id in vencidos:
+            del self._trabajos[trabajo_id]
+
+pool_navegadores = PoolNavegadores(SimitScraper(usar_cache=False))
+bitacora_trabajos = BitacoraTrabajos()
+trabajos = RegistroTrabajos(bitacora=bitacora_trabajos, solo_encolar=MODO_TRABAJOS == 'externo')
+
+def artefactos_protegidos():
+    """Lo que la limpieza de disco no puede borrar: los archivos de los trabajos de este proceso y,
+    según la bitácora, los de trabajos sin terminar de cualquier otro (workers web o worker_simit.py)"""
+    rutas = trabajos.artefactos_en_uso()
+    activos, capturas = bitacora_trabajos.artefactos_activos()
+    rutas.update(capturas)
+    if activos:
+        # Reportes y exportaciones llevan el id del trabajo al final del nombre (ver ruta_reporte_excel)
+        try:
+            nombres = os.listdir(CARPETA_REPORTES)
+        except OSError:
+            nombres = []
+        for nombre in nombres:
+            base = re.sub(r"_parcial$", "", os.path.splitext(nombre)[0])
+            if base.rsplit("_", 1)[-1] in activos:
+                rutas.add(os.path.join(CARPETA_REPORTES, nombre))
+    return rutas
+
+almacen_artefactos.en_uso = artefactos_protegidos
+_servicios = {'iniciados': False}
+
+def iniciar_servicios():
+    """Arranca el trabajo de fondo de este proceso: reanudar trabajos, sincronizar con la
+    bitácora, calentar Chrome y barrer artefactos viejos.
+    
+    Importar app no arranca nada; esto se llama una vez por proceso desde __main__,
+    desde gunicorn.conf.py (post_worker_init) o desde worker_simit.py.
+    """
+    if _servicios['iniciados']:
+        return
+    _servicios['iniciados'] = True
+    if MODO_TRABAJOS != 'externo':
+        # Una web que solo encola no reclama trabajos ni abre navegadores: eso es de los workers
+        if REANUDAR_TRABAJOS:
+            trabajos.reanudar_interrumpidos()
+        trabajos.iniciar_sincronizacion()
+        pool_navegadores.calentar()
+    almacen_artefactos.iniciar_barrido()
+
 # RUTAS FLASK
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
+@app.route('/metrics')
+def exportar_metricas():
+    """Métricas en formato de texto de Prometheus"""
+    pool = pool_navegadores.estado()
+    por_estado = defaultdict(int)
+    for progreso in trabajos.progresos():
+        por_estado[progreso['estado']] += 1
+    medidores = {
+        'simit_chrome_memoria_mb': [((), pool['memoria_mb'])],
+        'simit_chrome_sesiones': [
+            ((('estado', 'libre'),), pool['libres']),
+            ((('estado', 'prestada'),), pool['prestadas']),
+            ((('estado', 'creando'),), pool['creando']),
+        ],
+        'simit_trabajos': [((('estado', estado),), cantidad) for estado, cantidad in sorted(por_estado.items())],
+        'simit_circuito_abierto': [((), 0 if circuito_simit.estado() == 'cerrado' else 1)],
+        'simit_artefactos_bytes': [((), almacen_artefactos.bytes_ocupados)],
+        'simit_trabajos_sin_worker': [((), bitacora_trabajos.pendientes())],
+        'simit_trabajos_en_espera': [((('prioridad', prioridad),), cantidad)
+                                     for prioridad, cantidad in trabajos.en_espera().items()],
+    }
+    return Response(metricas.exportar(medidores), mimetype='text/plain; version=0.0.4')
+
 @app.route('/iniciar_proceso', methods=['POST'])
 def iniciar_proceso():
-    global progreso_actual
-    
     try:
         data = request.get_json()
         placas_texto = data.get('placas', '')
-        placas = [placa.strip().upper() for placa in placas_texto.split('\n') if placa.strip()]
+        depurador = depurar_filas([linea] for linea in placas_texto.split('\n'))
+        placas = depurador.placas
         
         if not placas:
-            return jsonify({'error': 'No se ingresaron placas válidas'}), 400
-        
-        if progreso_actual['estado'] == 'processing':
-            return jsonify({'error': 'Ya hay un proceso en ejecución'}), 400
+            return jsonify({'error': 'No se ingresaron placas válidas', 'reporte': depurador.reporte()}), 400
         
-        # Reiniciar progreso
-        progreso_actual = {
-            'estado': 'idle',
-            'mensaje': 'Iniciando...',
-            'placa_actual': '',
-            'total': len(placas),
-            'procesadas': 0,
-            'porcentaje': 0,
-            'resultados': [],
-            'archivo_excel': ''
-        }
-        
-        scraper = SimitScraper()
-        thread = threading.Thread(target=scraper.buscar_placas, args=(placas,))
-        thread.daemon = True
-        thread.start()
+        trabajo_id, scraper = trabajos.crear(
+            placas,
+            num_workers=data.get('workers'),
+            motor=data.get('motor'),
+            usar_cache=data.get('usar_cache'),
+            politica_captura=data.get('politica_captura'),
+            monitoreo=data.get('monitoreo'),
+            prioridad=data.get('prioridad'),
+            usuario=data.get('usuario') or request.headers.get('X-Usuario')
+        )
         
-        return jsonify({'success': True, 'mensaje': 'Proceso iniciado', 'total_placas': len(placas)})
+        return jsonify({
+            'success': True,
+            'mensaje': 'Proceso encolado',
+            'trabajo_id': trabajo_id,
+            'total_placas': len(placas),
+            'workers': scraper.num_workers,
+            'prioridad': scraper.prioridad,
+            'reporte': depurador.reporte()
+        })
         
     except Exception as e:
         return jsonify({'error': f'Error: {str(e)}'}), 500
 
+@app.route('/cargar_placas', methods=['POST'])
+def cargar_placas():
+    """Recibe un CSV/XLSX con placas, lo valida y deduplica, y encola el trabajo (validar=1 solo reporta)"""
+    archivo = request.files.get('archivo')
+    if not archivo or not archivo.filename:
+        return jsonify({'error': 'No se recibió ningún archivo'}), 400
+    
+    try:
+        depurador = depurar_filas(filas_de_carga(archivo.stream, archivo.filename), request.form.get('columna'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'No se pudo leer el archivo: {str(e)}'}), 400
+    
+    reporte = depurador.reporte()
+    print(f"📥 Carga {archivo.filename}: {reporte['validas']} válidas, {reporte['invalidas']} inválidas, "
+          f"{reporte['duplicadas']} duplicadas")
+    if not depurador.placas:
+        return jsonify({'error': 'El archivo no tiene placas válidas', 'reporte': reporte}), 400
+    if opcion_booleana(request.form.get('validar')):
+        return jsonify({'success': True, 'validado': True, 'reporte': reporte})
+    
+    try:
+        trabajo_id, scraper = trabajos.crear(
+            depurador.placas,
+            progreso_inicial={'carga': {clave: valor for clave, valor in reporte.items() if clave != 'rechazadas'}},
+            num_workers=request.form.get('workers', type=int),
+            motor=request.form.get('motor') or None,
+            usar_cache=opcion_booleana(request.form.get('usar_cache')),
+            politica_captura=request.form.get('politica_captura') or None,
+            monitoreo=opcion_booleana(request.form.get('monitoreo')),
+            prioridad=request.form.get('prioridad') or None,
+            usuario=request.form.get('usuario') or request.headers.get('X-Usuario')
+        )
+    except Exception as e:
+        return jsonify({'error': f'Error: {str(e)}'}), 500
+    
+    return jsonify({
+        'success': True,
+        'mensaje': 'Proceso encolado',
+        'trabajo_id': trabajo_id,
+        'total_placas': len(depurador.placas),
+        'workers': scraper.num_workers,
+        'prioridad': scraper.prioridad,
+        'reporte': reporte
+    })
+
 @app.route('/progreso')
-def obtener_progreso():
-    global progreso_actual
-    return jsonify(progreso_actual.copy())
+@app.route('/progreso/<trabajo_id>')
+def obtener_progreso(trabajo_id=None):
+    progreso = trabajos.obtener(trabajo_id)
+    if progreso is None:
+        if trabajo_id:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        progreso = nuevo_progreso()
+    # Solo contadores; con ETag un sondeo sin cambios responde 304 sin cuerpo
+    respuesta = jsonify(progreso.copy())
+    respuesta.add_etag()
+    return respuesta.make_conditional(request)
 
-@app.route('/descargar_excel')
-def descargar_excel():
-    global progreso_actual
+def formato_sse(numero, tipo, datos):
+    return f"id: {numero}\nevent: {tipo}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+def eventos_compartidos(trabajo_id, desde):
+    """SSE de un trabajo que corre en otro proceso: un 'resumen' por cada foto nueva en la bitácora"""
+    anterior = None
+    numero = desde
+    ultimo_envio = time.monotonic()
+    limite = ultimo_envio + SSE_DURACION_MAX
+    while time.monotonic() < limite:
+        progreso = bitacora_trabajos.progreso(trabajo_id)
+        if progreso != anterior:
+            numero += 1
+            yield formato_sse(numero, 'resumen', progreso)
+            anterior = progreso
+            ultimo_envio = time.monotonic()
+            if progreso['estado'] in BitacoraTrabajos.ESTADOS_FINALES:
+                return
+        elif time.monotonic() - ultimo_envio >= SSE_KEEPALIVE:
+            yield ": keepalive\n\n"
+            ultimo_envio = time.monotonic()
+        time.sleep(INTERVALO_PROGRESO_COMPARTIDO)
+
+@app.route('/progreso/<trabajo_id>/eventos')
+def eventos_progreso(trabajo_id):
+    """Stream SSE con los cambios del trabajo; reanuda desde Last-Event-ID al reconectar"""
+    scraper = trabajos.obtener_scraper(trabajo_id)
+    try:
+        desde = int(request.headers.get('Last-Event-ID') or request.args.get('desde') or 0)
+    except ValueError:
+        desde = 0
+    if scraper is None:
+        if bitacora_trabajos.obtener_trabajo(trabajo_id) is None:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        return Response(
+            stream_with_context(eventos_compartidos(trabajo_id, desde)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+    
+    def generar():
+        # Estado actual sin la lista de resultados, para pintar la página de inmediato
+        resumen = dict(scraper.progreso)
+        yield formato_sse(desde, 'resumen', resumen)
+        
+        ultimo = desde
+        limite = time.monotonic() + SSE_DURACION_MAX
+        while time.monotonic() < limite:
+            eventos, cerrado = scraper.eventos.esperar(ultimo, SSE_KEEPALIVE)
+            if not eventos:
+                if cerrado:
+                    return
+                yield ": keepalive\n\n"
+                continue
+            for numero, tipo, datos in eventos:
+                yield formato_sse(numero, tipo, datos)
+                ultimo = numero
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def secuencia_bitacora(trabajo_id, desde, lote):
+    """(indice, resultado, origen) de la bitácora en orden de terminación, leídos de a `lote` filas"""
+    while True:
+        filas = bitacora_trabajos.resultados_desde(trabajo_id, desde, lote)
+        for indice, (resultado, consultado_cache) in filas:
+            yield indice, resultado, "Caché" if consultado_cache else "SIMIT"
+        if len(filas) < lote:
+            return
+        desde += lote
+
+@app.route('/resultados/<trabajo_id>')
+def obtener_resultados(trabajo_id):
+    """Resultados paginados del trabajo.
+    
+    Parámetros: cursor (posición devuelta como 'siguiente'), limite, filtro
+    (todas | multas | errores) y detalle=0 para omitir el texto y las multas.
+    Mientras el trabajo corre las placas llegan en orden de terminación, así que
+    se puede seguir pidiendo desde el último cursor sin perder ninguna.
+    """
+    filtro = request.args.get('filtro', 'todas')
+    if filtro not in FILTROS_RESULTADOS:
+        return jsonify({'error': f"Filtro no válido (use {', '.join(FILTROS_RESULTADOS)})"}), 400
+    cursor = max(0, request.args.get('cursor', 0, type=int))
+    limite = max(1, min(request.args.get('limite', RESULTADOS_POR_PAGINA, type=int), MAX_RESULTADOS_POR_PAGINA))
+    con_detalle = request.args.get('detalle', '1') != '0'
+    
+    scraper = trabajos.obtener_scraper(trabajo_id)
+    if scraper is not None:
+        estado = scraper.progreso['estado']
+        total = scraper.progreso['total']
+        terminadas = len(scraper.orden_terminadas)
+    else:
+        trabajo = bitacora_trabajos.obtener_trabajo(trabajo_id)
+        if trabajo is None:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        estado, total = trabajo['estado'], len(trabajo['placas'])
+        terminadas = bitacora_trabajos.contar_resultados(trabajo_id)
+    
+    # La página solo cambia si terminaron más placas o cambió el estado del trabajo
+    etag = hashlib.sha1(f"{trabajo_id}|{estado}|{terminadas}|{request.query_string.decode()}".encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+        respuesta.set_etag(etag)
+        return respuesta
+    
+    if scraper is not None:
+        secuencia = scraper.resultados_desde(cursor)
+    else:
+        secuencia = secuencia_bitacora(trabajo_id, cursor, limite)
+    
+    filas = []
+    siguiente = cursor
+    coincide = FILTROS_RESULTADOS[filtro]
+    for indice, resultado, origen in secuencia:
+        if len(filas) == limite:
+            break
+        siguiente += 1
+        if coincide(resultado):
+            filas.append(fila_resultado(indice, resultado, origen, con_detalle))
+    
+    respuesta = jsonify({
+        'estado': estado,
+        'total': total,
+        'terminadas': terminadas,
+        'resultados': filas,
+        'siguiente': siguiente,
+        'hay_mas': siguiente < terminadas or estado not in ('completed', 'error'),
+    })
+    respuesta.set_etag(etag)
+    return respuesta
+
+def generar_reporte_parcial(trabajo_id):
+    """Excel con las placas del trabajo que ya terminaron, leídas de la bitácora"""
+    previos = bitacora_trabajos.resultados(trabajo_id)
+    if not previos:
+        return None
+    scraper = SimitScraper(usar_cache=False, modo_excel='completo', progreso=nuevo_progreso())
+    scraper.progreso['id'] = f"{trabajo_id}_parcial"
+    for posicion, indice in enumerate(sorted(previos)):
+        resultado, consultado_cache = previos[indice]
+        scraper.resultados.append(resultado)
+        if consultado_cache:
+            scraper.cache_por_indice[posicion] = consultado_cache
+    return scraper.guardar_resultados_en_excel()
+
+@app.route('/descargar_excel/<trabajo_id>/parcial')
+def descargar_excel_parcial(trabajo_id):
+    if bitacora_trabajos.obtener_trabajo(trabajo_id) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
     
-    archivo_excel = progreso_actual.get('archivo_excel', '')
+    archivo_excel = generar_reporte_parcial(trabajo_id)
+    if archivo_excel and os.path.exists(archivo_excel):
+        return send_file(
+            archivo_excel,
+            as_attachment=True,
+            download_name=f"reporte_simit_parcial_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    return jsonify({'error': 'Todavía no hay placas terminadas'}), 404
+
+@app.route('/descargar_excel')
+@app.route('/descargar_excel/<trabajo_id>')
+def descargar_excel(trabajo_id=None):
+    progreso = trabajos.obtener(trabajo_id) or (trabajo_id and bitacora_trabajos.obtener_trabajo(trabajo_id)) or {}
+    archivo_excel = progreso.get('archivo_excel', '')
     
     if archivo_excel and os.path.exists(archivo_excel):
+        almacen_artefactos.tocar(archivo_excel)
         try:
             return send_file(
                 archivo_excel, 
@@ -522,6 +3899,69 @@ def descargar_excel():
     else:
         return jsonify({'error': 'No hay archivo disponible'}), 404
 
+@app.route('/evidencia/<nombre>')
+def descargar_evidencia(nombre):
+    """Captura por su nombre de contenido (el que traen /resultados y el JSONL)"""
+    if not NOMBRE_EVIDENCIA.match(nombre):
+        return jsonify({'error': 'Nombre de evidencia no válido'}), 400
+    ruta = os.path.join(CARPETA_CAPTURAS, nombre[:2], nombre)
+    if not os.path.exists(ruta):
+        return jsonify({'error': 'Evidencia no disponible (pudo vencer por la cuota de disco)'}), 404
+    almacen_artefactos.tocar(ruta)
+    # El contenido nunca cambia para un mismo nombre
+    return send_file(ruta, max_age=365 * 86400)
+
+@app.route('/descargar_cambios/<trabajo_id>')
+def descargar_cambios(trabajo_id):
+    """Reporte de cambios (multas nuevas / pagadas / cambiadas) de un trabajo en modo monitoreo"""
+    progreso = trabajos.obtener(trabajo_id) or {}
+    archivo = (progreso.get('cambios') or {}).get('archivo')
+    if archivo and os.path.exists(archivo):
+        return send_file(archivo, as_attachment=True, download_name=f"cambios_simit_{trabajo_id}.csv",
+                         mimetype='text/csv')
+    return jsonify({'error': 'No hay reporte de cambios para este trabajo'}), 404
+
+@app.route('/descargar_multas/<trabajo_id>/<formato>')
+def descargar_multas(trabajo_id, formato):
+    """Multas del trabajo en CSV (una fila por multa) o JSONL (una línea por placa)"""
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({'error': 'Formato no soportado (use csv o jsonl)'}), 400
+    nombre = f"multas_simit_{trabajo_id}.{formato}"
+    
+    progreso = trabajos.obtener(trabajo_id) or {}
+    archivo = (progreso.get('exportaciones') or {}).get(formato)
+    if archivo and os.path.exists(archivo):
+        return send_file(archivo, as_attachment=True, download_name=nombre, mimetype=FORMATOS_EXPORTACION[formato])
+    
+    # Trabajo en curso, de otro proceso o anterior a un reinicio: se arma desde la bitácora
+    if bitacora_trabajos.obtener_trabajo(trabajo_id) is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    previos = bitacora_trabajos.resultados(trabajo_id)
+    
+    def generar():
+        if formato == 'jsonl':
+            for indice in sorted(previos):
+                resultado, consultado_cache = previos[indice]
+                yield registro_jsonl(indice, resultado, "Caché" if consultado_cache else "SIMIT")
+            return
+        salida = io.StringIO()
+        escritor = csv.writer(salida)
+        salida.write("\ufeff")
+        escritor.writerow(COLUMNAS_CSV_MULTAS)
+        for indice in sorted(previos):
+            resultado, consultado_cache = previos[indice]
+            escritor.writerows(filas_csv(indice, resultado, "Caché" if consultado_cache else "SIMIT"))
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+        yield salida.getvalue()
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype=FORMATOS_EXPORTACION[formato],
+        headers={'Content-Disposition': f'attachment; filename="{nombre}"'}
+    )
+
 # HTML TEMPLATE
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -732,6 +4172,19 @@ HTML_TEMPLATE = '''
 DEF456</textarea>
             </div>
             
+            <div class="input-group">
+                <label for="archivoPlacas">O cargue un archivo CSV / XLSX con una columna "Placa":</label>
+                <input type="file" id="archivoPlacas" accept=".csv,.txt,.xlsx,.xlsm">
+                <p id="reporteCarga"></p>
+            </div>
+            
+            <div class="input-group">
+                <label>
+                    <input type="checkbox" id="monitoreo">
+                    Modo monitoreo: reportar solo lo que cambió desde la última consulta de cada placa
+                </label>
+            </div>
+            
             <button id="iniciarBtn" class="btn" onclick="iniciarProceso()">
                 🚀 Iniciar Búsqueda
             </button>
@@ -758,14 +4211,28 @@ DEF456</textarea>
                         <span>Estado</span>
                     </div>
                 </div>
+                <button class="btn download-btn" onclick="descargarParcial()">
+                    📄 Descargar reporte parcial
+                </button>
             </div>
             
             <div id="resultsContainer" class="results-container">
                 <h3>🎉 ¡Proceso Completado!</h3>
                 <p>El reporte Excel ha sido generado con todos los detalles de multas.</p>
+                <p id="resumenResultados"></p>
                 <button id="downloadBtn" class="btn download-btn" onclick="descargarExcel()">
                     📥 Descargar Reporte Excel
                 </button>
+                <button class="btn download-btn" onclick="descargarMultas('csv')">
+                    📊 Multas en CSV
+                </button>
+                <button class="btn download-btn" onclick="descargarMultas('jsonl')">
+                    🧾 Multas en JSONL
+                </button>
+                <button id="cambiosBtn" class="btn download-btn" style="display: none;"
+                        onclick="window.location = `/descargar_cambios/${trabajoId}`">
+                    🔎 Reporte de cambios
+                </button>
             </div>
         </div>
     </div>
@@ -773,8 +4240,15 @@ DEF456</textarea>
     <script>
         let intervalId = null;
         let procesoIniciado = false;
+        let trabajoId = null;
+        let fuenteEventos = null;
+        let estadoTrabajo = {};
         
         function iniciarProceso() {
+            if (document.getElementById('archivoPlacas').files.length) {
+                cargarArchivo();
+                return;
+            }
             const placasTexto = document.getElementById('placas').value.trim();
             
             if (!placasTexto) {
@@ -793,6 +4267,28 @@ DEF456</textarea>
                 return;
             }
             
+            prepararUI();
+            
+            // Iniciar proceso
+            fetch('/iniciar_proceso', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({
+                    placas: placasTexto,
+                    monitoreo: document.getElementById('monitoreo').checked
+                })
+            })
+            .then(response => response.json())
+            .then(comenzarSeguimiento)
+            .catch(error => {
+                alert('Error al iniciar proceso: ' + error.message);
+                resetearUI();
+            });
+        }
+        
+        function prepararUI() {
             procesoIniciado = true;
             
             // Cambiar UI
@@ -807,95 +4303,206 @@ DEF456</textarea>
             const progressFill = document.getElementById('progressFill');
             progressFill.style.width = '0%';
             progressFill.textContent = '0%';
-            
-            // Iniciar proceso
-            fetch('/iniciar_proceso', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    placas: placasTexto
-                })
-            })
-            .then(response => response.json())
+        }
+        
+        function comenzarSeguimiento(data) {
+            if (!data.success) {
+                throw new Error(data.error || 'Error desconocido');
+            }
+            trabajoId = data.trabajo_id;
+            estadoTrabajo = {estado: 'queued', mensaje: 'En cola...', total: data.total_placas, procesadas: 0, porcentaje: 0};
+            if (window.EventSource) {
+                escucharEventos();
+            } else {
+                intervalId = setInterval(actualizarProgreso, 1000);
+            }
+        }
+        
+        function describirCarga(reporte) {
+            let texto = `${reporte.validas} placa(s) válidas, ${reporte.invalidas} inválidas, ${reporte.duplicadas} duplicadas.`;
+            const ejemplos = reporte.rechazadas.slice(0, 5).map(r => `fila ${r.fila}: "${r.valor}" (${r.motivo})`);
+            if (ejemplos.length) {
+                texto += ' Rechazadas: ' + ejemplos.join('; ') + (reporte.total_rechazadas > ejemplos.length ? '...' : '');
+            }
+            return texto;
+        }
+        
+        function enviarArchivo(validar) {
+            const datos = new FormData();
+            datos.append('archivo', document.getElementById('archivoPlacas').files[0]);
+            datos.append('monitoreo', document.getElementById('monitoreo').checked ? '1' : '0');
+            if (validar) {
+                datos.append('validar', '1');
+            }
+            return fetch('/cargar_placas', {method: 'POST', body: datos}).then(response => response.json());
+        }
+        
+        function cargarArchivo() {
+            // Primero solo se valida, para mostrar las filas rechazadas antes de encolar
+            enviarArchivo(true)
             .then(data => {
-                if (data.success) {
-                    intervalId = setInterval(actualizarProgreso, 1000);
-                } else {
+                if (data.reporte) {
+                    document.getElementById('reporteCarga').textContent = describirCarga(data.reporte);
+                }
+                if (!data.success) {
                     throw new Error(data.error || 'Error desconocido');
                 }
+                if (!confirm(describirCarga(data.reporte) + `\n\n¿Iniciar búsqueda para ${data.reporte.validas} placa(s)?`)) {
+                    return;
+                }
+                prepararUI();
+                return enviarArchivo(false).then(comenzarSeguimiento).catch(error => {
+                    alert('Error al iniciar proceso: ' + error.message);
+                    resetearUI();
+                });
             })
-            .catch(error => {
-                alert('Error al iniciar proceso: ' + error.message);
-                resetearUI();
+            .catch(error => alert('Error al cargar el archivo: ' + error.message));
+        }
+        
+        function escucharEventos() {
+            // Stream de eventos pequeños en vez de sondear /progreso cada segundo
+            fuenteEventos = new EventSource(`/progreso/${trabajoId}/eventos`);
+            
+            fuenteEventos.addEventListener('resumen', e => {
+                Object.assign(estadoTrabajo, JSON.parse(e.data));
+                pintarProgreso(estadoTrabajo);
+            });
+            fuenteEventos.addEventListener('estado', e => {
+                Object.assign(estadoTrabajo, JSON.parse(e.data));
+                pintarProgreso(estadoTrabajo);
             });
+            fuenteEventos.addEventListener('mensaje', e => {
+                estadoTrabajo.mensaje = JSON.parse(e.data).mensaje;
+                pintarProgreso(estadoTrabajo);
+            });
+            fuenteEventos.addEventListener('placa_iniciada', e => {
+                const evento = JSON.parse(e.data);
+                estadoTrabajo.placa_actual = evento.placa;
+                estadoTrabajo.mensaje = `Procesando: ${evento.placa}`;
+                pintarProgreso(estadoTrabajo);
+            });
+            fuenteEventos.addEventListener('placa_terminada', e => {
+                const evento = JSON.parse(e.data);
+                Object.assign(estadoTrabajo, {
+                    placa_actual: evento.placa,
+                    procesadas: evento.procesadas,
+                    total: evento.total,
+                    porcentaje: evento.porcentaje,
+                    mensaje: evento.resultado === 'Error'
+                        ? `Error en ${evento.placa}`
+                        : `Completada: ${evento.placa} (${evento.estado_multas} multas)`
+                });
+                pintarProgreso(estadoTrabajo);
+            });
+            fuenteEventos.addEventListener('reporte_listo', e => {
+                estadoTrabajo.archivo_excel = JSON.parse(e.data).archivo;
+            });
+            fuenteEventos.onerror = () => {
+                // El navegador reconecta solo; si el trabajo ya terminó, cerrar
+                if (!procesoIniciado) {
+                    fuenteEventos.close();
+                }
+            };
         }
         
         function actualizarProgreso() {
             if (!procesoIniciado) return;
             
-            fetch('/progreso')
+            fetch(`/progreso/${trabajoId}`)
             .then(response => response.json())
-            .then(data => {
-                const porcentaje = Math.max(0, Math.min(100, data.porcentaje || 0));
-                
-                // Actualizar barra
-                const progressFill = document.getElementById('progressFill');
-                progressFill.style.width = porcentaje + '%';
-                progressFill.textContent = porcentaje.toFixed(1) + '%';
-                
-                // Actualizar información
-                document.getElementById('placaActual').textContent = data.placa_actual || '-';
-                document.getElementById('contador').textContent = `${data.procesadas || 0} / ${data.total || 0}`;
-                document.getElementById('estadoGeneral').textContent = data.estado || 'Procesando';
-                
-                // Actualizar mensaje
-                const statusMessage = document.getElementById('statusMessage');
-                const statusText = document.getElementById('statusText');
-                statusText.textContent = data.mensaje || 'Procesando...';
-                
-                // Cambiar estilo según estado
-                statusMessage.className = 'status-message';
-                if (data.estado === 'completed') {
-                    statusMessage.classList.add('status-success');
-                    progressFill.style.width = '100%';
-                    progressFill.textContent = '100%';
-                    
-                    clearInterval(intervalId);
-                    procesoIniciado = false;
-                    resetearUI();
-                    
-                    setTimeout(() => {
-                        document.getElementById('resultsContainer').style.display = 'block';
-                    }, 1000);
-                    
-                } else if (data.estado === 'error') {
-                    statusMessage.classList.add('status-error');
-                    clearInterval(intervalId);
-                    procesoIniciado = false;
-                    resetearUI();
-                } else {
-                    statusMessage.classList.add('status-info');
-                }
-            })
+            .then(data => pintarProgreso(data))
             .catch(error => {
                 console.error('Error polling:', error);
             });
         }
         
+        function pintarProgreso(data) {
+            const porcentaje = Math.max(0, Math.min(100, data.porcentaje || 0));
+            
+            // Actualizar barra
+            const progressFill = document.getElementById('progressFill');
+            progressFill.style.width = porcentaje + '%';
+            progressFill.textContent = porcentaje.toFixed(1) + '%';
+            
+            // Actualizar información
+            document.getElementById('placaActual').textContent = data.placa_actual || '-';
+            document.getElementById('contador').textContent = `${data.procesadas || 0} / ${data.total || 0}`;
+            document.getElementById('estadoGeneral').textContent = data.estado || 'Procesando';
+            
+            // Actualizar mensaje
+            const statusMessage = document.getElementById('statusMessage');
+            const statusText = document.getElementById('statusText');
+            statusText.textContent = data.mensaje || 'Procesando...';
+            
+            // Cambiar estilo según estado
+            statusMessage.className = 'status-message';
+            if (data.estado === 'completed') {
+                statusMessage.classList.add('status-success');
+                progressFill.style.width = '100%';
+                progressFill.textContent = '100%';
+                
+                terminarSeguimiento();
+                cargarResultados(data);
+                
+                setTimeout(() => {
+                    document.getElementById('resultsContainer').style.display = 'block';
+                }, 1000);
+                
+            } else if (data.estado === 'error') {
+                statusMessage.classList.add('status-error');
+                terminarSeguimiento();
+            } else {
+                statusMessage.classList.add('status-info');
+            }
+        }
+        
+        function terminarSeguimiento() {
+            clearInterval(intervalId);
+            if (fuenteEventos) {
+                fuenteEventos.close();
+                fuenteEventos = null;
+            }
+            procesoIniciado = false;
+            resetearUI();
+        }
+        
+        function cargarResultados(data) {
+            // El progreso ya trae los contadores; el detalle por placa está paginado en /resultados
+            let resumen = `${data.total || 0} placa(s): ${data.con_multas || 0} con multas, ${data.errores || 0} con error.`;
+            const cambios = data.cambios;
+            if (cambios) {
+                resumen += ` Monitoreo: ${cambios.sin_cambios} sin cambios, ${cambios.multas_nuevas} multa(s) nuevas, ` +
+                    `${cambios.multas_pagadas} pagadas, ${cambios.multas_cambiadas} cambiadas.`;
+                document.getElementById('cambiosBtn').style.display = 'inline-block';
+            }
+            document.getElementById('resumenResultados').textContent = resumen;
+        }
+        
         function resetearUI() {
             const btn = document.getElementById('iniciarBtn');
             btn.disabled = false;
             btn.textContent = '🚀 Iniciar Búsqueda';
         }
         
+        function descargarParcial() {
+            // Excel con las placas terminadas hasta ahora (sale de la bitácora del trabajo)
+            if (trabajoId) {
+                window.location = `/descargar_excel/${trabajoId}/parcial`;
+            }
+        }
+        
+        function descargarMultas(formato) {
+            if (trabajoId) {
+                window.location = `/descargar_multas/${trabajoId}/${formato}`;
+            }
+        }
+        
         function descargarExcel() {
             const btn = document.getElementById('downloadBtn');
             btn.disabled = true;
             btn.textContent = '📥 Descargando...';
             
-            fetch('/descargar_excel')
+            fetch(`/descargar_excel/${trabajoId}`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error('Error en la descarga');
@@ -929,6 +4536,7 @@ DEF456</textarea>
 '''
 
 if __name__ == '__main__':
+    iniciar_servicios()
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
 
@@ -0,0 +1,218 @@
+# Benchmark reproducible del scraper contra el SIMIT simulado (simit_mock.py).
+#
+# Corre buscar_placas de principio a fin con una configuración dada y guarda una línea JSON por
+# corrida (placas/min, latencia p50/p95 por placa, memoria pico, errores) para compararlas después.
+# Uso:
+#   python benchmark_simit.py correr --placas 50 --workers 2 --latencia 0.5 --etiqueta base
+#   python benchmark_simit.py correr --placas 50 --workers 4 --motor http --etiqueta http
+#   python benchmark_simit.py comparar benchmarks/resultados.jsonl
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def placas_de_prueba(cantidad, semilla=0):
+    """Placas con formato colombiano (ABC123), deterministas para una semilla"""
+    letras = "ABCDEFGHJKLMNPRSTUVWXYZ"
+    placas = []
+    for i in range(cantidad):
+        n = i + semilla * 7919
+        placas.append(
+            letras[n % 23] + letras[(n // 23) % 23] + letras[(n // 529) % 23] + f"{(n * 37) % 1000:03d}"
+        )
+    return placas
+
+
+class MuestreoMemoria(threading.Thread):
+    """Mide cada `intervalo` segundos la memoria del proceso y sus hijos (Chrome) y guarda el pico"""
+
+    def __init__(self, medir, intervalo=0.25):
+        super().__init__(daemon=True)
+        self.medir = medir
+        self.intervalo = intervalo
+        self.pico = 0
+        self._fin = threading.Event()
+
+    def run(self):
+        while not self._fin.is_set():
+            self.pico = max(self.pico, self.medir(os.getpid()))
+            self._fin.wait(self.intervalo)
+
+    def detener(self):
+        self._fin.set()
+        self.join()
+        self.pico = max(self.pico, self.medir(os.getpid()))
+
+
+def correr(args):
+    import simit_mock
+
+    servidor = simit_mock.iniciar_servidor(
+        args.grabaciones, args.puerto, args.latencia,
+        prob_multas=args.prob_multas, max_multas=args.max_multas,
+        tasa_error=args.tasa_error, semilla=args.semilla
+    )
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+
+    # La configuración de app.py se lee al importarlo: todo el entorno va antes del import
+    os.environ.update({
+        'SIMIT_URL': base + "/",
+        'SIMIT_API_URL': base + "/consulta",
+        'SIMIT_CACHE': "0",
+        'SIMIT_REANUDAR': "0",
+        'SIMIT_POOL_CALIENTES': str(args.workers if args.calentar else 0),
+        'SIMIT_PAUSA_ENTRE_PLACAS': str(args.pausa),
+        'SIMIT_PERFIL_LIGERO': "1" if args.perfil_ligero else "0",
+        'SIMIT_EXCEL_MODO': args.excel,
+        # Sin esto se mide el tope del limitador de tasa (0.5 consultas/s por defecto), no el cambio
+        'SIMIT_TASA_NAVEGADOR': str(args.tasa_navegador),
+        'SIMIT_TASA_HTTP': str(args.tasa_http),
+    })
+    for asignacion in args.entorno:
+        clave, _, valor = asignacion.partition("=")
+        os.environ[clave] = valor
+
+    salida = os.path.abspath(args.salida)
+    trabajo_dir = tempfile.mkdtemp(prefix="benchmark_simit_")
+    os.chdir(trabajo_dir)  # capturas, reportes y bitácora quedan fuera del repositorio
+    sys.path.insert(0, DIRECTORIO)
+    import app
+
+    placas = placas_de_prueba(args.placas, args.semilla)
+    if args.calentar:
+        app.pool_navegadores.calentar()
+        limite = time.monotonic() + 120
+        while app.pool_navegadores.estado()['creando'] and time.monotonic() < limite:
+            time.sleep(0.5)
+
+    memoria = MuestreoMemoria(app.memoria_proceso_mb)
+    memoria.start()
+    scraper = app.SimitScraper(num_workers=args.workers, motor=args.motor, usar_cache=False,
+                               politica_captura=args.captura)
+    inicio = time.monotonic()
+    scraper.buscar_placas(placas)
+    duracion = time.monotonic() - inicio
+    memoria.detener()
+
+    latencias = [
+        sum(t.get(etapa, 0) for etapa in app.ETAPAS_PLACA)
+        for t in scraper.tiempos_por_placa.values() if t
+    ]
+    resultado = {
+        'etiqueta': args.etiqueta,
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'configuracion': {
+            'placas': args.placas, 'workers': args.workers, 'motor': args.motor,
+            'captura': args.captura, 'perfil_ligero': args.perfil_ligero, 'excel': args.excel,
+            'latencia': args.latencia, 'prob_multas': args.prob_multas, 'tasa_error': args.tasa_error,
+            'pausa': args.pausa, 'calentar': args.calentar, 'entorno': args.entorno,
+            'tasa_navegador': app.TASA_NAVEGADOR, 'tasa_http': app.TASA_HTTP,
+        },
+        'estado': scraper.progreso['estado'],
+        'duracion_segundos': round(duracion, 2),
+        'placas_por_minuto': round(len(placas) / duracion * 60, 2) if duracion else None,
+        'latencia_p50': app.percentil(latencias, 50),
+        'latencia_p95': app.percentil(latencias, 95),
+        'memoria_pico_mb': memoria.pico,
+        'errores': sum(1 for r in scraper.resultados if r[2] == "Error"),
+        'con_multas': sum(1 for r in scraper.resultados if r[1] == "Sí"),
+        'etapas': app.resumir_tiempos(list(scraper.tiempos_por_placa.values())),
+        'excel_segundos': scraper.segundos_excel,
+    }
+
+    app.pool_navegadores.vaciar()
+    servidor.shutdown()
+
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    print(f"📊 {args.etiqueta}: {resultado['placas_por_minuto']} placas/min, "
+          f"p50 {resultado['latencia_p50']} s, p95 {resultado['latencia_p95']} s, "
+          f"memoria pico {resultado['memoria_pico_mb']} MB, errores {resultado['errores']}")
+    tasa = lambda valor: f"{valor} consultas/s" if valor else "sin límite"
+    print(f"🚦 Limitador de tasa: navegador {tasa(app.TASA_NAVEGADOR)}, HTTP {tasa(app.TASA_HTTP)}")
+    print(f"💾 Resultado agregado a {salida}")
+
+
+def comparar(args):
+    corridas = []
+    for ruta in args.archivos:
+        with open(ruta, encoding="utf-8") as f:
+            corridas.extend(json.loads(linea) for linea in f if linea.strip())
+    if args.etiquetas:
+        corridas = [c for c in corridas if c['etiqueta'] in args.etiquetas]
+    if not corridas:
+        print("⚠️ No hay corridas para comparar")
+        return
+
+    # Varias corridas con la misma etiqueta se promedian
+    por_etiqueta = {etiqueta: [] for etiqueta in args.etiquetas or []}
+    for corrida in corridas:
+        por_etiqueta.setdefault(corrida['etiqueta'], []).append(corrida)
+
+    columnas = ['placas_por_minuto', 'latencia_p50', 'latencia_p95', 'memoria_pico_mb', 'errores']
+    def promedio(lista, clave):
+        valores = [c[clave] for c in lista if c.get(clave) is not None]
+        return round(sum(valores) / len(valores), 2) if valores else None
+
+    filas = [(etiqueta, len(lista), {c: promedio(lista, c) for c in columnas})
+             for etiqueta, lista in por_etiqueta.items() if lista]
+    referencia = filas[0][2]
+
+    print(f"{'etiqueta':<20} {'n':>3} " + " ".join(f"{c:>22}" for c in columnas))
+    for etiqueta, n, valores in filas:
+        celdas = []
+        for c in columnas:
+            valor, base = valores[c], referencia[c]
+            texto = "-" if valor is None else f"{valor}"
+            if valor is not None and base and etiqueta != filas[0][0]:
+                texto += f" ({(valor - base) / base * 100:+.0f}%)"
+            celdas.append(f"{texto:>22}")
+        print(f"{etiqueta:<20} {n:>3} " + " ".join(celdas))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark del scraper de SIMIT contra el simulador local")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_correr = sub.add_parser("correr", help="Ejecuta una corrida y agrega su resultado al archivo")
+    p_correr.add_argument("--etiqueta", default="corrida")
+    p_correr.add_argument("--placas", type=int, default=20)
+    p_correr.add_argument("--workers", type=int, default=1)
+    p_correr.add_argument("--motor", choices=['selenium', 'http'], default='selenium')
+    p_correr.add_argument("--captura", choices=['todas', 'con_multas', 'ninguna'], default='todas')
+    p_correr.add_argument("--excel", choices=['streaming', 'completo'], default='streaming')
+    p_correr.add_argument("--perfil-ligero", type=int, choices=[0, 1], default=1)
+    p_correr.add_argument("--pausa", type=float, default=0.0, help="Pausa entre placas (SIMIT_PAUSA_ENTRE_PLACAS)")
+    p_correr.add_argument("--tasa-navegador", type=float, default=0.0,
+                          help="Consultas/s del navegador (SIMIT_TASA_NAVEGADOR; 0 = sin límite)")
+    p_correr.add_argument("--tasa-http", type=float, default=0.0,
+                          help="Consultas/s por HTTP (SIMIT_TASA_HTTP; 0 = sin límite)")
+    p_correr.add_argument("--calentar", action="store_true", help="Abrir los Chrome antes de medir")
+    p_correr.add_argument("--entorno", action="append", default=[], metavar="CLAVE=VALOR",
+                          help="Variable de entorno extra para app.py (se puede repetir)")
+    p_correr.add_argument("--grabaciones", default=None, help="Carpeta con <PLACA>.json para el simulador")
+    p_correr.add_argument("--puerto", type=int, default=0, help="0 = puerto libre cualquiera")
+    p_correr.add_argument("--latencia", type=float, default=0.3)
+    p_correr.add_argument("--prob-multas", type=float, default=0.3)
+    p_correr.add_argument("--max-multas", type=int, default=3)
+    p_correr.add_argument("--tasa-error", type=float, default=0.0)
+    p_correr.add_argument("--semilla", type=int, default=0)
+    p_correr.add_argument("--salida", default=os.path.join("benchmarks", "resultados.jsonl"))
+    p_correr.set_defaults(funcion=correr)
+
+    p_comparar = sub.add_parser("comparar", help="Compara corridas (la primera etiqueta es la referencia)")
+    p_comparar.add_argument("archivos", nargs="+")
+    p_comparar.add_argument("--etiquetas", nargs="*", help="Limitar y ordenar por estas etiquetas")
+    p_comparar.set_defaults(funcion=comparar)
+
+    args = parser.parse_args()
+    args.funcion(args)
@@ -0,0 +1,9 @@
+# Configuración de gunicorn (la lee sola al arrancar desde esta carpeta).
+#
+# Importar app no arranca hilos ni navegadores: cada worker los inicia aquí, ya con la app
+# cargada en su propio proceso (reanudar trabajos, sincronizar la bitácora, calentar Chrome).
+
+
+def post_worker_init(worker):
+    import app
+    app.iniciar_servicios()
@@ -0,0 +1,251 @@
+# Servidor local que imita a SIMIT para probar y medir el scraper sin salir a internet.
+#
+# Sirve dos cosas:
+#   - POST /consulta: el backend JSON que usa el motor HTTP. Reproduce las respuestas grabadas con
+#     SIMIT_HTTP_GRABAR_DIR (un <PLACA>.json por placa) y, si no hay grabación, genera multas sintéticas.
+#   - GET /: una página con el DOM del que depende SimitScraper (#txtBusqueda, popup swal2-popup,
+#     #multaTable y los mensajes de "No se encontraron multas"), alimentada por los mismos datos.
+# Uso:
+#   python simit_mock.py --grabaciones grabaciones_simit --puerto 8765 --latencia 0.5 --prob-multas 0.3
+#   SIMIT_MOTOR=http SIMIT_API_URL=http://127.0.0.1:8765/consulta python app.py
+#   SIMIT_URL=http://127.0.0.1:8765/ python app.py
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+SECRETARIAS = ["Bogotá D.C.", "Medellín", "Cali", "Barranquilla", "Cundinamarca"]
+INFRACCIONES = ["C02", "C14", "C29", "C35", "D02", "D12"]
+ESTADOS = ["Pendiente", "Cobro coactivo", "Acuerdo de pago"]
+
+
+def pesos(valor):
+    """Formato de moneda como lo muestra SIMIT: $ 1.234.567"""
+    return "$ " + f"{valor:,}".replace(",", ".")
+
+
+class SimuladorSimit:
+    """Decide qué responde SIMIT para cada placa: grabación, multas sintéticas o error"""
+
+    def __init__(self, grabaciones=None, latencia=0.0, placa_desconocida='vacia',
+                 prob_multas=0.0, max_multas=3, tasa_error=0.0, semilla=0):
+        self.grabaciones = grabaciones
+        self.latencia = latencia
+        self.placa_desconocida = placa_desconocida
+        self.prob_multas = prob_multas
+        self.max_multas = max(1, max_multas)
+        self.tasa_error = tasa_error
+        self.semilla = semilla
+        # Los errores salen de una secuencia aparte para que un reintento pueda tener éxito
+        self._azar_errores = random.Random(semilla)
+        self._lock = threading.Lock()
+
+    def multas_sinteticas(self, placa):
+        """Multas deterministas por placa (misma semilla y placa -> mismas multas)"""
+        azar = random.Random(f"{self.semilla}:{placa}")
+        if azar.random() >= self.prob_multas:
+            return []
+        multas = []
+        for _ in range(azar.randint(1, self.max_multas)):
+            valor = azar.randrange(200000, 2000000, 100)
+            multas.append({
+                'tipo': "Comparendo",
+                'numeroComparendo': str(azar.randrange(10**17, 10**18)),
+                'fechaNotificacion': f"{azar.randint(1, 28):02d}/{azar.randint(1, 12):02d}/{azar.randint(2018, 2024)}",
+                'placa': placa,
+                'organismoTransito': azar.choice(SECRETARIAS),
+                'infraccion': azar.choice(INFRACCIONES),
+                'estadoComparendo': azar.choice(ESTADOS),
+                'valor': pesos(valor),
+                'valorPagar': pesos(valor + azar.randrange(0, 300000, 100)),
+            })
+        return multas
+
+    def resolver(self, placa):
+        """(codigo HTTP, datos JSON) para la placa, tras la latencia configurada"""
+        if self.latencia:
+            time.sleep(self.latencia)
+        with self._lock:
+            falla = self.tasa_error and self._azar_errores.random() < self.tasa_error
+        if falla:
+            return 500, {'error': 'Error simulado de SIMIT'}
+
+        ruta = os.path.join(self.grabaciones, f"{placa}.json") if self.grabaciones else ""
+        if placa and ruta and os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                return 200, json.load(f)
+        if self.prob_multas or self.placa_desconocida == 'vacia':
+            return 200, {'multas': self.multas_sinteticas(placa)}
+        return 404, {'error': f'Sin grabación para {placa}'}
+
+    @staticmethod
+    def celdas(multa, placa):
+        """Columnas de #multaTable para una multa (mismo orden que espera el scraper)"""
+        return [
+            f"{multa.get('tipo', 'Comparendo')} {multa.get('numeroComparendo', '')}".strip(),
+            str(multa.get('fechaNotificacion', '')),
+            str(multa.get('placa', placa)),
+            str(multa.get('organismoTransito', '')),
+            str(multa.get('infraccion', '')),
+            str(multa.get('estadoComparendo', '')),
+            str(multa.get('valor', '')),
+            str(multa.get('valorPagar', '')),
+        ]
+
+
+PAGINA_SIMIT = """<!DOCTYPE html>
+<html lang="es">
+<head>
+<meta charset="utf-8">
+<title>SIMIT (simulado)</title>
+<style>
+    body { font-family: Arial, sans-serif; margin: 20px; }
+    .swal2-container { position: fixed; inset: 0; background: rgba(0,0,0,.4); display: flex;
+                       align-items: center; justify-content: center; }
+    .swal2-popup { background: white; padding: 20px; border-radius: 5px; min-width: 300px; }
+    .spinner-border { display: inline-block; width: 20px; height: 20px; border: 3px solid #ccc;
+                      border-top-color: #333; border-radius: 50%; }
+    table { border-collapse: collapse; margin-top: 15px; }
+    td, th { border: 1px solid #ccc; padding: 4px 8px; }
+</style>
+</head>
+<body>
+<h1>Consulta de multas (SIMIT simulado)</h1>
+<input id="txtBusqueda" type="text" placeholder="Placa o documento">
+<div id="resultados"></div>
+<script>
+function mostrarPopup(html) {
+    var contenedor = document.createElement('div');
+    contenedor.className = 'swal2-container';
+    contenedor.innerHTML = '<div class="swal2-popup">' + html +
+        '<br><button class="swal2-confirm">Aceptar</button></div>';
+    contenedor.querySelector('.swal2-confirm').onclick = function () { contenedor.remove(); };
+    document.body.appendChild(contenedor);
+}
+
+function consultar(placa) {
+    var resultados = document.getElementById('resultados');
+    resultados.innerHTML = '<div class="spinner-border"></div>';
+    fetch('/simular?placa=' + encodeURIComponent(placa))
+        .then(function (r) { return r.json().then(function (datos) { return {ok: r.ok, datos: datos}; }); })
+        .then(function (respuesta) {
+            if (!respuesta.ok) {
+                resultados.innerHTML = '';
+                mostrarPopup('<div class="swal2-icon swal2-error">X</div><p>Error consultando la placa</p>');
+                return;
+            }
+            var filas = respuesta.datos.filas;
+            if (!filas.length) {
+                resultados.innerHTML = '<p>No se encontraron multas para la placa ' + placa + '</p>';
+                return;
+            }
+            var html = '<table id="multaTable"><thead><tr><th>Tipo</th><th>Notificación</th><th>Placa</th>' +
+                '<th>Secretaría</th><th>Infracción</th><th>Estado</th><th>Valor</th><th>Valor a pagar</th>' +
+                '</tr></thead><tbody>';
+            filas.forEach(function (celdas) {
+                html += '<tr>' + celdas.map(function (c) { return '<td>' + c + '</td>'; }).join('') + '</tr>';
+            });
+            resultados.innerHTML = html + '</tbody></table>';
+        })
+        .catch(function () {
+            resultados.innerHTML = '';
+            mostrarPopup('<div class="swal2-icon swal2-error">X</div><p>Sin conexión</p>');
+        });
+}
+
+document.getElementById('txtBusqueda').addEventListener('keydown', function (e) {
+    if (e.key === 'Enter') { consultar(this.value.trim().toUpperCase()); }
+});
+mostrarPopup('<h2>Aviso</h2><p>Bienvenido a la consulta de SIMIT</p>');
+</script>
+</body>
+</html>
+"""
+
+
+def crear_manejador(grabaciones=None, latencia=0.0, placa_desconocida='vacia', simulador=None):
+    simulador = simulador or SimuladorSimit(grabaciones, latencia, placa_desconocida)
+
+    class ManejadorSimit(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Mantener viva la conexión como el backend real
+        disable_nagle_algorithm = True  # Sin la espera de ~40 ms entre encabezados y cuerpo
+
+        def enviar(self, codigo, cuerpo, tipo):
+            self.send_response(codigo)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+
+        def responder(self, codigo, datos):
+            cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+            self.enviar(codigo, cuerpo, "application/json; charset=utf-8")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/simular':
+                placa = parse_qs(url.query).get('placa', [''])[0].strip().upper()
+                codigo, datos = simulador.resolver(placa)
+                if codigo != 200:
+                    self.responder(codigo, datos)
+                    return
+                multas = datos.get('multas') or datos.get('comparendos') or []
+                self.responder(200, {'filas': [simulador.celdas(multa, placa) for multa in multas]})
+            elif url.path in ('/', '/simit/'):
+                self.enviar(200, PAGINA_SIMIT.encode("utf-8"), "text/html; charset=utf-8")
+            else:
+                self.responder(404, {'error': 'No encontrado'})
+
+        def do_POST(self):
+            longitud = int(self.headers.get("Content-Length", 0))
+            try:
+                peticion = json.loads(self.rfile.read(longitud) or b"{}")
+            except ValueError:
+                self.responder(400, {'error': 'JSON inválido'})
+                return
+
+            placa = str(peticion.get('filtro', '')).strip().upper()
+            self.responder(*simulador.resolver(placa))
+
+        def log_message(self, formato, *args):
+            pass
+
+    return ManejadorSimit
+
+
+def iniciar_servidor(grabaciones=None, puerto=8765, latencia=0.0, placa_desconocida='vacia', **opciones):
+    """Crea el servidor (sin arrancarlo); útil para levantarlo en un hilo desde pruebas.
+
+    `opciones` pasa al simulador: prob_multas, max_multas, tasa_error, semilla.
+    """
+    simulador = SimuladorSimit(grabaciones, latencia, placa_desconocida, **opciones)
+    manejador = crear_manejador(simulador=simulador)
+    return ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor local que imita a SIMIT (API JSON y página)")
+    parser.add_argument("--grabaciones", default="grabaciones_simit", help="Carpeta con <PLACA>.json")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0, help="Segundos de espera por respuesta")
+    parser.add_argument("--desconocida", choices=['vacia', '404'], default='vacia',
+                        help="Qué responder para placas sin grabación (si no hay multas sintéticas)")
+    parser.add_argument("--prob-multas", type=float, default=0.0,
+                        help="Probabilidad de que una placa sin grabación tenga multas sintéticas")
+    parser.add_argument("--max-multas", type=int, default=3, help="Máximo de multas sintéticas por placa")
+    parser.add_argument("--tasa-error", type=float, default=0.0, help="Fracción de respuestas con error 500")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    servidor = iniciar_servidor(args.grabaciones, args.puerto, args.latencia, args.desconocida,
+                                prob_multas=args.prob_multas, max_multas=args.max_multas,
+                                tasa_error=args.tasa_error, semilla=args.semilla)
+    print(f"🧪 SIMIT simulado en http://127.0.0.1:{args.puerto}/ (grabaciones: {args.grabaciones})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
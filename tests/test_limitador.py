@@ -0,0 +1,54 @@
+import threading
+import time
+
+from app import LimitadorTasa
+
+
+def esperar_en_cola(limitador, cantidad, limite=2):
+    fin = time.monotonic() + limite
+    while len(limitador._esperando) < cantidad:
+        assert time.monotonic() < fin, "los turnos no llegaron a la cola"
+        time.sleep(0.005)
+
+
+def lanzar(limitador, orden, nombre, **turno):
+    def pedir():
+        limitador.adquirir(**turno)
+        orden.append(nombre)
+    hilo = threading.Thread(target=pedir, daemon=True)
+    hilo.start()
+    return hilo
+
+
+def test_sin_tasa_no_bloquea():
+    limitador = LimitadorTasa(0)
+    for _ in range(1000):
+        limitador.adquirir()
+
+
+def test_interactiva_antes_que_lote():
+    limitador = LimitadorTasa(10, rafaga=1)
+    limitador.adquirir()  # gasta la ficha inicial: los siguientes tienen que esperar
+    orden = []
+    hilos = [lanzar(limitador, orden, "lote", prioridad='lote', usuario="a", trabajo="t1")]
+    esperar_en_cola(limitador, 1)
+    hilos.append(lanzar(limitador, orden, "interactiva", prioridad='interactiva', usuario="b", trabajo="t2"))
+    esperar_en_cola(limitador, 2)
+    for hilo in hilos:
+        hilo.join(2)
+    assert orden == ["interactiva", "lote"]
+
+
+def test_reparto_justo_entre_usuarios():
+    # Un usuario con muchas consultas en cola no deja sin turno al que llega después
+    limitador = LimitadorTasa(10, rafaga=1)
+    limitador.adquirir()
+    orden = []
+    hilos = [lanzar(limitador, orden, f"a{n}", usuario="a", trabajo="ta") for n in range(6)]
+    esperar_en_cola(limitador, 6)
+    hilos.append(lanzar(limitador, orden, "b", usuario="b", trabajo="tb"))
+    esperar_en_cola(limitador, 7)
+    for hilo in hilos:
+        hilo.join(2)
+    assert len(orden) == 7
+    assert orden.index("b") <= 1
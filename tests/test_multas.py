@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pytest
+
+from app import Multa, comparar_multas, huella_multas, parsear_pesos
+
+
+def multa(valor=Decimal("500000"), estado="Pendiente", notificacion="N1", tipo="Comparendo"):
+    return Multa("ABC123", tipo, notificacion, "Bogotá", "C02", estado, valor, valor)
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("$ 1.234.567", Decimal("1234567")),
+    ("$ 250.000", Decimal("250000")),
+    ("1,234,567.50", Decimal("1234567.50")),
+    ("$ 1.234.567,5", Decimal("1234567.50")),
+    ("$ 604.100,25", Decimal("604100.25")),
+    ("1500", Decimal("1500")),
+    (1500, Decimal("1500")),
+    (12.5, Decimal("12.5")),
+])
+def test_parsear_pesos(texto, esperado):
+    assert parsear_pesos(texto) == esperado
+
+
+@pytest.mark.parametrize("texto", [None, "", "N/A", "$", "--", ".,"])
+def test_parsear_pesos_sin_numero(texto):
+    assert parsear_pesos(texto) is None
+
+
+def test_comparar_multas_sin_cambios():
+    assert comparar_multas([multa(), multa(notificacion="N2")], [multa(notificacion="N2"), multa()]) == []
+
+
+def test_comparar_multas_duplicadas():
+    # Dos multas idénticas cuentan por separado: si queda una, la otra se pagó
+    anteriores = [multa(), multa()]
+    assert comparar_multas(anteriores, [multa()]) == [('pagada', anteriores[1], None)]
+    actuales = [multa(), multa(), multa()]
+    assert comparar_multas(anteriores, actuales) == [('nueva', None, actuales[2])]
+
+
+def test_comparar_multas_cambiada_nueva_y_pagada():
+    anteriores = [multa(), multa(notificacion="N2")]
+    actuales = [multa(estado="Pagada"), multa(notificacion="N3")]
+    assert comparar_multas(anteriores, actuales) == [
+        ('cambiada', anteriores[0], actuales[0]),
+        ('nueva', None, actuales[1]),
+        ('pagada', anteriores[1], None),
+    ]
+
+
+def test_huella_cuenta_duplicadas():
+    assert huella_multas("con_multas", [multa(), multa()]) != huella_multas("con_multas", [multa()])
+
+
+def test_huella_con_valores_ilegibles():
+    # Dos multas que solo difieren en si el valor se pudo leer (None) o no
+    multas = [multa(valor=None), multa()]
+    assert huella_multas("con_multas", multas) == huella_multas("con_multas", list(reversed(multas)))
+
+
+def test_huella_distingue_valor_ilegible():
+    assert huella_multas("con_multas", [multa(valor=None)]) != huella_multas("con_multas", [multa()])
+
+
+def test_comparar_multas_con_valores_ilegibles():
+    anteriores = [multa(valor=None), multa()]
+    actuales = [multa(), multa(valor=None, estado="Pagada")]
+    assert comparar_multas(anteriores, actuales) == [('cambiada', anteriores[0], actuales[1])]
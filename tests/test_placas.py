@@ -0,0 +1,41 @@
+import pytest
+
+from app import DepuradorPlacas
+
+
+@pytest.mark.parametrize("valor, placa", [
+    ("ABC123", "ABC123"),
+    ("abc-123", "ABC123"),
+    (" abc 12d ", "ABC12D"),
+    ("ABC12", "ABC12"),
+    ("123ABC", "123ABC"),
+    ("R12345", "R12345"),
+    ("CD1234", "CD1234"),
+])
+def test_acepta_formatos_validos(valor, placa):
+    depurador = DepuradorPlacas()
+    depurador.agregar(2, valor)
+    assert depurador.placas == [placa]
+    assert depurador.total_rechazadas == 0
+
+
+@pytest.mark.parametrize("valor", ["AB1234", "ABCD12", "12345", "ABC1234", "X12345", "CD12345", "ÑBC123"])
+def test_rechaza_formatos_invalidos(valor):
+    depurador = DepuradorPlacas()
+    depurador.agregar(2, valor)
+    assert depurador.placas == []
+    assert depurador.invalidas == 1
+    assert depurador.rechazadas == [{'fila': 2, 'valor': valor, 'motivo': "Formato de placa no válido"}]
+
+
+def test_duplicadas_vacias_y_maximo():
+    depurador = DepuradorPlacas(maximo=2)
+    for fila, valor in enumerate(["ABC123", "abc 123", None, "  ", "DEF456", "GHI789"], start=2):
+        depurador.agregar(fila, valor)
+    assert depurador.placas == ["ABC123", "DEF456"]
+    reporte = depurador.reporte()
+    assert (reporte['filas'], reporte['validas'], reporte['duplicadas'], reporte['vacias']) == (6, 2, 1, 2)
+    assert [rechazada['motivo'] for rechazada in reporte['rechazadas']] == [
+        "Duplicada (fila 2)",
+        "Supera el máximo de 2 placas por carga",
+    ]
@@ -0,0 +1,33 @@
+# Proceso aparte que ejecuta los trabajos de consulta, fuera del proceso web.
+#
+# Con SIMIT_MODO_TRABAJOS=externo la web solo registra cada trabajo en la bitácora (SQLite en modo
+# WAL) sin dueño. Cada worker toma el más antiguo que nadie tenga, abre sus propios navegadores y
+# publica progreso y resultados en la misma bitácora, de donde los lee cualquier worker web.
+# Si un worker muere, otro reclama sus trabajos a medias y los reanuda desde la última placa.
+# Uso (misma carpeta y misma SIMIT_BITACORA_DB para la web y los workers):
+#   SIMIT_MODO_TRABAJOS=externo gunicorn app:app --workers 4 --worker-class gthread --threads 16
+#   python worker_simit.py --trabajos 2
+#   python worker_simit.py --trabajos 2      (otro proceso más para sumar capacidad)
+import argparse
+import os
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker que ejecuta los trabajos encolados por la web")
+    parser.add_argument("--trabajos", type=int, default=None,
+                        help="Trabajos simultáneos en este proceso (por defecto SIMIT_MAX_TRABAJOS)")
+    parser.add_argument("--intervalo", type=float, default=None,
+                        help="Segundos entre búsquedas de trabajo nuevo (por defecto SIMIT_INTERVALO_COLA)")
+    args = parser.parse_args()
+
+    # La configuración de app.py se lee al importarlo
+    os.environ["SIMIT_MODO_TRABAJOS"] = "worker"
+    if args.trabajos:
+        os.environ["SIMIT_MAX_TRABAJOS"] = str(args.trabajos)
+    import app
+    app.iniciar_servicios()  # reanudar, sincronizar con la bitácora, calentar Chrome, barrer artefactos
+
+    try:
+        app.trabajos.atender_cola(args.intervalo or app.INTERVALO_COLA)
+    except KeyboardInterrupt:
+        # Los trabajos a medias quedan en la bitácora y los reclama otro worker
+        app.pool_navegadores.vaciar()